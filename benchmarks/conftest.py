@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from benchmarks.workloads import peak_memory, workload
+
+# fewer rounds for the slow scales, so the whole suite runs in minutes
+ROUNDS = {"day": 20, "month": 5, "year": 1, 10: 5, 100: 2, 300: 1}
+# polars' allocator (jemalloc) returning freed memory straight away
+ALLOCATOR_CONFIG = {"_RJEM_MALLOC_CONF": "dirty_decay_ms:0,muzzy_decay_ms:0"}
+
+PEAK_MEMORY: dict[str, float] = {}
+
+
+@pytest.fixture(scope="session")
+def memory_worker():
+    """
+    Process measuring the peak memory of the workloads
+
+    Its allocator gives the freed memory back straight away, so the RSS follows the
+    memory in use, which would slow down the timed calls in this process.
+    """
+    previous = {key: os.environ.get(key) for key in ALLOCATOR_CONFIG}
+    os.environ.update(ALLOCATOR_CONFIG)
+    executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        # the worker is started on the first task, with the environment as it is
+        executor.submit(os.getpid).result()
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key)
+            else:
+                os.environ[key] = value
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def measure(benchmark, memory_worker, request):
+    """
+    Benchmarks the workload of `function` at the scale
+
+    The peak memory is kept in the benchmark's `extra_info`, so it's saved with the
+    timings.
+    """
+
+    def run(function: str, kind: str, scale):
+        benchmark.group = f"{function} per {kind}"
+        peak = memory_worker.submit(peak_memory, function, kind, scale).result()
+        benchmark.extra_info["peak_memory_mb"] = peak
+        PEAK_MEMORY[request.node.name] = peak
+        call = workload(function, kind, scale)
+        # a single round is slow enough for the warm-up not to matter
+        warmup_rounds = 1 if ROUNDS[scale] > 1 else 0
+        return benchmark.pedantic(
+            call, rounds=ROUNDS[scale], warmup_rounds=warmup_rounds
+        )
+
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not PEAK_MEMORY:
+        return
+    terminalreporter.section("peak memory (MB)")
+    for name, peak in PEAK_MEMORY.items():
+        terminalreporter.write_line(
+            f"{name:<60} {'n/a' if peak is None else f'{peak:10.1f}'}"
+        )
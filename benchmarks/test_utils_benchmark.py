@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.workloads import FLEETS, FUNCTIONS, SPANS
+
+
+@pytest.mark.parametrize("span", list(SPANS))
+@pytest.mark.parametrize("function", list(FUNCTIONS))
+def test_unit(measure, function, span):
+    measure(function, "unit", span)
+
+
+@pytest.mark.parametrize("n_units", FLEETS)
+@pytest.mark.parametrize("function", list(FUNCTIONS))
+def test_fleet(measure, function, n_units):
+    measure(function, "fleet", n_units)
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from functools import cache
+from typing import Callable, Literal, Optional
+
+import polars as pl
+
+from src.elexon.synthetic import synthetic_datasets, synthetic_units
+from src.elexon.utils import (
+    aggregate_acceptance_and_pn,
+    aggregate_prices,
+    calculate_cashflow,
+    cashflow,
+    format_bid_offer_table,
+    resolve_acceptances,
+    smoothen_physical,
+)
+
+# Each hot function of utils.py, called on a unit's inputs the way the pipeline
+# calls it: the per-period ones once for every settlement period.
+FUNCTIONS = {
+    "smoothen_physical": lambda inputs: smoothen_physical(inputs["physical"]),
+    "resolve_acceptances": lambda inputs: resolve_acceptances(inputs["acceptances"]),
+    "aggregate_acceptance_and_pn": lambda inputs: aggregate_acceptance_and_pn(
+        inputs["accepted"], inputs["smoothened"], "30m", "MWh"
+    ),
+    "format_bid_offer_table": lambda inputs: [
+        format_bid_offer_table(ladder) for ladder in inputs["ladders"]
+    ],
+    "aggregate_prices": lambda inputs: [
+        aggregate_prices(table) for table in inputs["tables"]
+    ],
+    "calculate_cashflow": lambda inputs: [
+        calculate_cashflow(period) for period in inputs["periods"]
+    ],
+    "cashflow": lambda inputs: cashflow(inputs["bid_offer"], inputs["generation"]),
+}
+
+FROM_TIME = "2024-01-01T00:00:00Z"
+# the end of each time scale of a single unit
+SPANS = {
+    "day": "2024-01-02T00:00:00Z",
+    "month": "2024-02-01T00:00:00Z",
+    "year": "2025-01-01T00:00:00Z",
+}
+# fleets are benchmarked over a day, like the daily incremental runs
+FLEETS = [10, 100, 300]
+KEYS = ["settlementDate", "settlementPeriod"]
+
+
+def prepare(
+    physical: pl.DataFrame, acceptances: pl.DataFrame, bid_offer: pl.DataFrame
+) -> dict:
+    """The inputs of every benchmarked function for a unit, as the pipeline makes them"""
+    accepted = acceptances if acceptances.height else None
+    smoothened = smoothen_physical(physical)
+    generation = aggregate_acceptance_and_pn(accepted, smoothened, "30m", "MWh")
+    periods = bid_offer.join(
+        generation.select(*KEYS, "curtailment", "extra"), on=KEYS
+    ).partition_by(KEYS)
+    ladders = [
+        period.select(
+            "levelFrom", "levelTo", "bid", "offer", "curtailment", "extra", "pairId"
+        ).unique()
+        for period in periods
+    ]
+    return {
+        "physical": physical,
+        "acceptances": acceptances,
+        "accepted": accepted,
+        "smoothened": smoothened,
+        "bid_offer": bid_offer,
+        "generation": generation,
+        "periods": periods,
+        "ladders": ladders,
+        "tables": [format_bid_offer_table(ladder) for ladder in ladders],
+    }
+
+
+@cache
+def unit_inputs(span: str) -> dict:
+    """Inputs of the unit with the most acceptances out of 10, over the span"""
+    datasets = synthetic_datasets(synthetic_units(10), FROM_TIME, SPANS[span])
+    unit = datasets["acceptance"]["bmUnit"].mode().sort()[0]
+    return prepare(
+        *(
+            datasets[dataset].filter(pl.col("bmUnit").eq(unit))
+            for dataset in ["physical", "acceptance", "bid_offer"]
+        )
+    )
+
+
+@cache
+def fleet_inputs(n_units: int) -> list[dict]:
+    """Inputs of each unit of a fleet of `n_units`, over a day"""
+    datasets = synthetic_datasets(synthetic_units(n_units), FROM_TIME, SPANS["day"])
+    by_unit = {
+        dataset: dict(datasets[dataset].partition_by("bmUnit", as_dict=True))
+        for dataset in ["physical", "acceptance", "bid_offer"]
+    }
+    return [
+        prepare(
+            physical,
+            by_unit["acceptance"].get(key, datasets["acceptance"].clear()),
+            by_unit["bid_offer"][key],
+        )
+        for key, physical in by_unit["physical"].items()
+    ]
+
+
+def workload(
+    function: str, kind: Literal["unit", "fleet"], scale
+) -> Callable[[], object]:
+    """The benchmarked call of `function`, for a unit over a span or for a fleet"""
+    if kind == "unit":
+        inputs = unit_inputs(scale)
+        return lambda: FUNCTIONS[function](inputs)
+    fleet = fleet_inputs(scale)
+    return lambda: [FUNCTIONS[function](inputs) for inputs in fleet]
+
+
+def _rss() -> Optional[int]:
+    """Resident memory of the process in bytes, if the platform has /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def peak_memory(
+    function: str, kind: Literal["unit", "fleet"], scale
+) -> Optional[float]:
+    """
+    Peak resident memory of the workload above the memory before it, in MB
+
+    Polars allocates outside of the Python heap (so tracemalloc doesn't see it),
+    so the process' RSS is sampled every millisecond instead. It's only meaningful
+    when the allocator gives the freed memory back straight away (see the
+    `memory_worker` fixture). The workload runs once before, so that lazily
+    initialised state isn't counted.
+    """
+    call = workload(function, kind, scale)
+    call()
+    start = _rss()
+    if start is None:
+        return None
+    peak = start
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _rss())
+            time.sleep(0.001)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        call()
+    finally:
+        done.set()
+        sampler.join()
+    return (max(peak, _rss()) - start) / 1e6
@@ -0,0 +1,130 @@
+import dataclasses
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import typer
+import yaml
+
+from src.elexon.fake_server import BackgroundServer, ServerStats, create_app
+from src.elexon.orchestrate import run_stages
+from src.elexon.synthetic import synthetic_units
+
+
+def benchmark_config(
+    base_url: str, units: list[str], from_time: str, to_time: str
+) -> dict:
+    """
+    Run config fetching everything from the fake server at `base_url`
+
+    The rate limit is lifted and the response cache is off, so the run is only
+    limited by the server's latency and the client's concurrency.
+    """
+    return {
+        "from_time": from_time,
+        "to_time": to_time,
+        "downsample_frequency": "30m",
+        "integration": "minute",
+        "energy_unit": "MWh",
+        "retry_empty": False,
+        "incremental": False,
+        "max_concurrent_units": 8,
+        "fetch_mode": "auto",
+        "workers": 1,
+        "client": {
+            "base_url": base_url,
+            "max_in_flight": 20,
+            "rate_limit": {"rate": 10_000, "capacity": 10_000},
+        },
+        "units": units,
+    }
+
+
+def run_benchmark(
+    units: dict[str, str],
+    from_time: str,
+    to_time: str,
+    output_folder: str,
+    config: Optional[dict] = None,
+    **server_options,
+) -> list[dict]:
+    """
+    Runs every stage against the fake server, returning the figures of each stage
+
+    `server_options` are passed on to `create_app` (latency, 429s, payload size),
+    and `config` overrides the benchmark config's keys.
+    """
+    stats = ServerStats()
+    app = create_app(units, from_time, to_time, stats=stats, **server_options)
+    results = []
+    with BackgroundServer(app) as server:
+        run_config = benchmark_config(server.url, list(units), from_time, to_time)
+        run_config.update(config or {})
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        config_path = str(Path(output_folder) / "benchmark_config.yaml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump(run_config, f)
+
+        before, started = dataclasses.replace(stats), time.perf_counter()
+        for stage in run_stages(config_path, output_folder):
+            wall_time = time.perf_counter() - started
+            requests = stats.requests - before.requests
+            served = stats.bytes - before.bytes
+            results.append(
+                {
+                    "stage": stage,
+                    "wall_time": wall_time,
+                    "requests": requests,
+                    "throttled": stats.throttled - before.throttled,
+                    "bytes": served,
+                    "requests_per_s": requests / wall_time,
+                    "bytes_per_s": served / wall_time,
+                }
+            )
+            before, started = dataclasses.replace(stats), time.perf_counter()
+    return results
+
+
+def main(
+    n_units: int = 20,
+    from_time: str = "2024-01-01T00:00:00Z",
+    to_time: str = "2024-01-15T00:00:00Z",
+    latency: float = 0.05,
+    jitter: float = 0.02,
+    throttle_rate: float = 0.0,
+    records_per_period: int = 1,
+    fetch_mode: str = "auto",
+    seed: int = 0,
+    output_folder: Optional[str] = None,
+):
+    """Benchmarks a whole run against the fake Elexon server"""
+    units = synthetic_units(n_units, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_benchmark(
+            units,
+            from_time,
+            to_time,
+            output_folder or tmp,
+            config={"fetch_mode": fetch_mode},
+            latency=latency,
+            jitter=jitter,
+            throttle_rate=throttle_rate,
+            records_per_period=records_per_period,
+            seed=seed,
+        )
+
+    print(
+        f"{'stage':<20} {'wall time':>10} {'requests':>9} {'429s':>6} "
+        f"{'requests/s':>11} {'MB/s':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['stage']:<20} {r['wall_time']:>9.2f}s {r['requests']:>9} "
+            f"{r['throttled']:>6} {r['requests_per_s']:>11.1f} "
+            f"{r['bytes_per_s'] / 1e6:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
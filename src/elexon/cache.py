@@ -0,0 +1,112 @@
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import polars as pl
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# bumped when the decoded responses change, so that older entries aren't mixed in
+FORMAT_VERSION = 2
+
+
+def period_end(url: str) -> Optional[datetime.datetime]:
+    """
+    End of the time period a request covers
+
+    Taken from the `to` parameter (e.g. PN, BOALF, bid-offer), or from the date in
+    the path (e.g. system prices, indicative cashflows) as the end of that day.
+    """
+    parsed = urlparse(url)
+    to = parse_qs(parsed.query).get("to")
+    if to:
+        return datetime.datetime.strptime(to[0], "%Y-%m-%dT%H:%M:%SZ")
+
+    dates = DATE_PATTERN.findall(parsed.path)
+    if dates:
+        return datetime.datetime.strptime(dates[-1], "%Y-%m-%d") + datetime.timedelta(
+            days=1
+        )
+    return None
+
+
+class ResponseCache:
+    """
+    On-disk cache of Elexon responses, stored as zstd compressed Parquet
+
+    Entries are addressed by the hash of the request URL (which holds the endpoint,
+    the BM unit and the time range), and grouped by endpoint:
+
+        {folder}/v{FORMAT_VERSION}/{endpoint}/{hash[:2]}/{hash}.parquet
+
+    Periods that ended more than `settled_after_days` ago are settled, so their
+    entries never expire. Anything more recent (or without a known period) is
+    refreshed once it's older than `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        settled_after_days: float = 7,
+        ttl_seconds: float = 3600,
+    ):
+        self.folder = Path(folder)
+        self.settled_after = datetime.timedelta(days=settled_after_days)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, url: str) -> Path:
+        parsed = urlparse(url)
+        endpoint = parsed.path.strip("/").split("/api/v1/")[-1]
+        # dropping the dates and periods from the path, so that they don't end up as
+        # separate folders for every day
+        endpoint = "_".join(
+            p
+            for p in endpoint.split("/")
+            if not (DATE_PATTERN.fullmatch(p) or p.isdigit())
+        )
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            self.folder
+            / f"v{FORMAT_VERSION}"
+            / endpoint
+            / digest[:2]
+            / f"{digest}.parquet"
+        )
+
+    def is_fresh(self, url: str, path: Path) -> bool:
+        end = period_end(url)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if end is not None and end < now - self.settled_after:
+            return True
+        return time.time() - path.stat().st_mtime < self.ttl_seconds
+
+    def get(self, url: str) -> Optional[pl.DataFrame]:
+        """Returns the cached response, or None if it's missing or stale"""
+        path = self.path(url)
+        if path.exists() and self.is_fresh(url, path):
+            self.hits += 1
+            return pl.read_parquet(path)
+        self.misses += 1
+        return None
+
+    def put(self, url: str, df: pl.DataFrame) -> None:
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # writing to a temporary file first, so that a crash (or a concurrent run)
+        # never leaves a half-written entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.write_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
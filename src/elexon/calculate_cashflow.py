@@ -1,30 +1,71 @@
-from pathlib import Path
+from functools import partial
+from typing import Optional
 
 import polars as pl
 import typer
-from rich.progress import track
 
+from src.elexon.incremental import HighWaterMarks, fetch_start, replace_from
+from src.elexon.parallel import report_failures, run_in_processes
+from src.elexon.store import DataStore
 from src.elexon.utils import cashflow
 
 
-def run_from_config(bid_offer_folder: str, generation_folder: str, output_folder: str):
-    paths_to_process = [
-        p
-        for p in Path(bid_offer_folder).glob("*.csv")
-        if not Path(f"{output_folder}/{p.stem}.csv").exists()
+def calculate_unit(output_folder: str, incremental: bool, unit: str) -> Optional[str]:
+    """
+    Calculates and stores the cashflow of a single unit
+
+    Returns the last calculated settlement date, or None if there was nothing to
+    calculate.
+    """
+    store = DataStore(output_folder)
+    bo = store.read("bid_offer", unit)
+    gen = store.read("generation/total", unit)
+    if bo is None or gen is None:
+        return None
+
+    existing = store.read("calculated_cashflow", unit) if incremental else None
+    if existing is None:
+        out = cashflow(bo, gen)
+    else:
+        marks = HighWaterMarks(store.dataset_path("calculated_cashflow"))
+        start = fetch_start(marks, unit, existing, "", "settlementDate")
+        bo = bo.filter(pl.col("settlementDate") >= start)
+        gen = gen.filter(pl.col("settlementDate") >= start)
+        if bo.is_empty() or gen.is_empty():
+            return None
+        out = replace_from(existing, cashflow(bo, gen), start, "settlementDate")
+    store.write("calculated_cashflow", unit, out)
+    return out.select(pl.col("settlementDate").max()).item()
+
+
+def run_from_config(output_folder: str, incremental: bool = False, workers: int = 1):
+    """
+    Calculates the cashflow per unit from the stored bid-offer and generation data
+
+    Units are independent, so they're calculated in `workers` processes. With
+    `incremental`, units that already have an output are recomputed from their
+    last calculated settlement date onwards, the earlier days are kept as they are.
+    """
+    store = DataStore(output_folder)
+    units_to_process = [
+        unit
+        for unit in store.units("bid_offer")
+        if incremental or not store.exists("calculated_cashflow", unit)
     ]
 
-    for p in track(
-        paths_to_process,
-        description="Calculating cashflow:",
-    ):
-        unit = p.stem
-        bo = pl.read_csv(p)
-        gen = pl.read_csv(Path(generation_folder) / f"{unit}.csv")
-
-        if not bo.is_empty() and not gen.is_empty():
-            out = cashflow(bo, gen)
-            out.write_csv(f"{output_folder}/{unit}.csv")
+    results, failures = run_in_processes(
+        partial(calculate_unit, output_folder, incremental),
+        units_to_process,
+        workers,
+        "Calculating cashflow:",
+    )
+    report_failures(failures, "Calculating cashflow")
+
+    # only this process writes the marks, the workers just read them
+    marks = HighWaterMarks(store.dataset_path("calculated_cashflow"))
+    for unit, last_date in results.items():
+        if last_date is not None:
+            marks.set(unit, last_date)
 
 
 if __name__ == "__main__":
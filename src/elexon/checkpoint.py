@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+CHECKPOINT_FOLDER = "_checkpoints"
+
+
+def chunk_key(args: tuple) -> str:
+    """Name of the chunk requested with `args` (e.g. the unit and time range)"""
+    return hashlib.sha256(repr(args).encode()).hexdigest()[:16]
+
+
+class ChunkCheckpoint:
+    """
+    Chunks of a long fetch completed so far, persisted as soon as each completes
+
+    Every chunk with data is written to `{key}.parquet`, and the completed chunks
+    (including the empty ones) are recorded in `_manifest.json`, so a restarted
+    fetch only requests the chunks that are missing. The chunks are cleared once
+    the fetched data is stored.
+
+        {folder}/_checkpoints/{dataset}/{unit or batch}/{key}.parquet
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.manifest_path = self.folder / "_manifest.json"
+        self.chunks: dict[str, dict] = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                self.chunks = json.load(f)
+
+    @classmethod
+    def for_units(
+        cls, folder: str | Path, dataset: str, units: list[str]
+    ) -> "ChunkCheckpoint":
+        """Checkpoint of a unit (or a batch of units) fetched for the dataset"""
+        if len(units) == 1:
+            name = units[0]
+        else:
+            name = "batch-" + chunk_key(tuple(units))
+        return cls(Path(folder) / CHECKPOINT_FOLDER / dataset / name)
+
+    def rows(self, args: tuple) -> Optional[int]:
+        """Number of rows of the chunk, None if it hasn't completed"""
+        return self.chunks.get(chunk_key(args), {}).get("rows")
+
+    def save(self, args: tuple, df: pl.DataFrame) -> None:
+        """Records the chunk as completed, writing its rows if it has any"""
+        key = chunk_key(args)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if not df.is_empty():
+            tmp_path = self.folder / f"{key}.tmp"
+            df.write_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, self.folder / f"{key}.parquet")
+
+        self.chunks[key] = {"args": repr(args), "rows": df.shape[0]}
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.chunks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def scan(self, args: list[tuple]) -> list[pl.LazyFrame]:
+        """Lazily scans the completed chunks with data, out of the ones in `args`"""
+        keys = [chunk_key(a) for a in args]
+        return [
+            pl.scan_parquet(self.folder / f"{key}.parquet")
+            for key in keys
+            if self.chunks.get(key, {}).get("rows")
+        ]
+
+    def clear(self) -> None:
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.chunks = {}
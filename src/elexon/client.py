@@ -0,0 +1,121 @@
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+
+from src.elexon.cache import ResponseCache
+from src.elexon.concurrency import AdaptiveConcurrency
+from src.elexon.rate_limit import RATE_LIMITER, TokenBucket
+
+BASE_URL = "https://data.elexon.co.uk/bmrs/api/v1"
+
+
+class ElexonClient:
+    """
+    Owns a single pooled aiohttp session shared by every Elexon request
+
+    Opening a session per request (or per BM unit) means paying for the TCP and TLS
+    handshakes every time. The client keeps the connections alive between requests,
+    and caches the DNS lookups, so it should be created once per run:
+
+        async with ElexonClient.from_config(config) as client:
+            df = await get_physical(client, bm_unit, from_time, to_time)
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 30,
+        ttl_dns_cache: int = 300,
+        timeout_seconds: int = 30,
+        max_in_flight: int = 20,
+        base_url: str = BASE_URL,
+        rate_limiter: TokenBucket = RATE_LIMITER,
+        cache: Optional[ResponseCache] = None,
+        concurrency: Optional[dict] = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.timeout_seconds = timeout_seconds
+        self.max_in_flight = max_in_flight
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.concurrency = concurrency or {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._in_flight: Optional[AdaptiveConcurrency] = None
+
+    @classmethod
+    def from_config(
+        cls, config: dict, output_folder: Optional[str | Path] = None
+    ) -> "ElexonClient":
+        """
+        Creates the client from the optional `client` section of the run config
+
+        The `rate_limit` subsection configures the process-wide rate limiter, which
+        is shared with every other client, the `cache` subsection turns on the
+        on-disk response cache, and the `concurrency` subsection tunes the adaptive
+        limit on the requests in flight (see `AdaptiveConcurrency`). Its relative
+        `log_path` is in `output_folder`, next to the run report.
+        """
+        client_config = dict(config.get("client", {}))
+        concurrency = client_config.get("concurrency")
+        if concurrency and concurrency.get("log_path") and output_folder is not None:
+            client_config["concurrency"] = {
+                **concurrency,
+                "log_path": str(Path(output_folder) / concurrency["log_path"]),
+            }
+        rate_limit = client_config.pop("rate_limit", None)
+        if rate_limit is not None:
+            RATE_LIMITER.configure(**rate_limit)
+        cache = client_config.pop("cache", None)
+        if cache is not None:
+            client_config["cache"] = ResponseCache(**cache)
+        return cls(**client_config)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError(
+                "ElexonClient must be used as `async with ElexonClient()`"
+            )
+        return self._session
+
+    @property
+    def in_flight(self) -> AdaptiveConcurrency:
+        """
+        Caps the requests in flight across every caller of the client
+
+        Waiting for a free pooled connection counts towards aiohttp's timeout, so
+        requests queue up here instead of in the connector. The cap adapts to the
+        observed latency and throttling, up to `max_in_flight`.
+        """
+        if self._in_flight is None:
+            raise RuntimeError(
+                "ElexonClient must be used as `async with ElexonClient()`"
+            )
+        return self._in_flight
+
+    async def __aenter__(self) -> "ElexonClient":
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+        )
+        self._in_flight = AdaptiveConcurrency(
+            max_limit=self.max_in_flight, **self.concurrency
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+        self._session = None
+        self._in_flight = None
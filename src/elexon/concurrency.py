@@ -0,0 +1,109 @@
+import asyncio
+import datetime
+import json
+import statistics
+from pathlib import Path
+from typing import Optional
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the requests in flight, shared by every request of a client
+
+    Every `window` completed requests, the median latency is compared with the
+    lowest median seen so far (the baseline). If it's within `latency_factor` of
+    the baseline and nothing was throttled, the limit goes up by one (additive
+    increase); if the latency rose above that, the limit is multiplied by
+    `decrease`. A throttled (429) or failed request decreases the limit straight
+    away, at most once per window, so a burst of 429s doesn't collapse it.
+
+    Every decision is appended to `log_path` as a JSON line (with the latency and
+    the reason), to tune the limits from.
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 20,
+        min_limit: int = 1,
+        initial: Optional[int] = None,
+        window: int = 20,
+        latency_factor: float = 2.0,
+        decrease: float = 0.5,
+        log_path: Optional[str] = None,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        if initial is None:
+            initial = max_limit // 2
+        self.limit = min(max(initial, min_limit), max_limit)
+        self.window = window
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.log_path = Path(log_path) if log_path is not None else None
+        self.baseline: Optional[float] = None
+        self.decisions = 0
+        self._in_flight = 0
+        self._latencies: list[float] = []
+        self._throttled = 0
+        self._since_decrease = window
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> "AdaptiveConcurrency":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    async def record(self, latency: float, throttled: bool = False) -> None:
+        """Records a completed request, adjusting the limit every `window` of them"""
+        self._latencies.append(latency)
+        self._since_decrease += 1
+        if throttled:
+            self._throttled += 1
+            if self._since_decrease >= self.window:
+                self._set_limit(self.limit * self.decrease, "throttled", latency)
+        if len(self._latencies) < self.window:
+            return
+
+        median = statistics.median(self._latencies)
+        if self.baseline is None or median < self.baseline:
+            self.baseline = median
+        if median > self.latency_factor * self.baseline:
+            if self._since_decrease >= self.window:
+                self._set_limit(self.limit * self.decrease, "latency", median)
+        elif not self._throttled:
+            self._set_limit(self.limit + 1, "healthy", median)
+        self._latencies = []
+        self._throttled = 0
+        # waking up the requests waiting for a higher limit
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _set_limit(self, limit: float, reason: str, latency: float) -> None:
+        previous = self.limit
+        self.limit = int(min(max(limit, self.min_limit), self.max_limit))
+        if reason != "healthy":
+            self._since_decrease = 0
+        if self.limit == previous:
+            return
+        self.decisions += 1
+        if self.log_path is not None:
+            with open(self.log_path, "a") as f:
+                entry = {
+                    "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "reason": reason,
+                    "from": previous,
+                    "to": self.limit,
+                    "latency": round(latency, 3),
+                    "baseline": round(self.baseline or latency, 3),
+                    "in_flight": self._in_flight,
+                }
+                f.write(json.dumps(entry) + "\n")
+
+    def __str__(self) -> str:
+        return f"concurrency limit {self.limit} after {self.decisions} changes"
@@ -0,0 +1,216 @@
+import asyncio
+import random
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import polars as pl
+import typer
+from aiohttp import web
+
+from src.elexon.query import TIME_FORMAT
+from src.elexon.synthetic import synthetic_datasets, synthetic_units
+
+# Local stand-in for the Elexon BMRS API, serving synthetic data for the endpoints
+# used in query.py, so that fetching can be benchmarked without the rate limits
+# and the network variance of the real API.
+
+
+@dataclass
+class ServerStats:
+    """Counters of the fake server"""
+
+    requests: int = 0
+    throttled: int = 0
+    bytes: int = 0
+
+
+STATS = web.AppKey("stats", ServerStats)
+
+
+def _as_strings(df: pl.DataFrame) -> pl.DataFrame:
+    """Formats the time columns like the API does"""
+    return df.with_columns(
+        pl.col(c).dt.strftime(TIME_FORMAT)
+        for c, dtype in df.schema.items()
+        if dtype == pl.Datetime
+    )
+
+
+def _overlapping(df: pl.DataFrame, from_time: str, to_time: str) -> pl.DataFrame:
+    # ISO strings in the same format compare like the times
+    return df.filter(pl.col("timeFrom").lt(to_time) & pl.col("timeTo").gt(from_time))
+
+
+def create_app(
+    units: dict[str, str],
+    from_time: str,
+    to_time: str,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    throttle_rate: float = 0.0,
+    retry_after: Optional[float] = None,
+    records_per_period: int = 1,
+    seed: int = 0,
+    stats: Optional[ServerStats] = None,
+) -> web.Application:
+    """
+    Fake Elexon API serving synthetic data for `units` between the two times
+
+    The `units` map the BM units to their types (see `synthetic.synthetic_units`).
+
+    Every response is delayed by `latency` seconds (plus up to `jitter`), and a
+    `throttle_rate` fraction of the requests get a 429, with a `Retry-After`
+    header if `retry_after` is given. The served requests and bytes are counted
+    in `stats`.
+    """
+    frames = {
+        dataset: _as_strings(df)
+        for dataset, df in synthetic_datasets(
+            units, from_time, to_time, records_per_period, seed
+        ).items()
+    }
+    stats = stats if stats is not None else ServerStats()
+    # the server's own generator, so the 429s don't change the served data
+    rng = random.Random(seed)
+
+    def respond(df: pl.DataFrame, wrapped: bool = True) -> web.Response:
+        body = df.write_json().encode()
+        if wrapped:
+            body = b'{"data":' + body + b"}"
+        stats.bytes += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    @web.middleware
+    async def simulate(request: web.Request, handler) -> web.StreamResponse:
+        stats.requests += 1
+        await asyncio.sleep(latency + rng.uniform(0, jitter))
+        if rng.random() < throttle_rate:
+            stats.throttled += 1
+            headers = {} if retry_after is None else {"Retry-After": str(retry_after)}
+            return web.Response(status=429, headers=headers)
+        return await handler(request)
+
+    def per_unit(dataset: str):
+        async def handler(request: web.Request) -> web.Response:
+            query = request.query
+            df = frames[dataset].filter(pl.col("bmUnit").eq(query["bmUnit"]))
+            return respond(_overlapping(df, query["from"], query["to"]))
+
+        return handler
+
+    async def stream(request: web.Request) -> web.Response:
+        dataset = {"PN": "physical", "BOALF": "acceptance", "BOD": "bid_offer"}[
+            request.match_info["code"]
+        ]
+        df = frames[dataset]
+        bm_units = request.query.getall("bmUnit", [])
+        if bm_units:
+            df = df.filter(pl.col("bmUnit").is_in(bm_units))
+        return respond(
+            _overlapping(df, request.query["from"], request.query["to"]), wrapped=False
+        )
+
+    async def cashflows(request: web.Request) -> web.Response:
+        return respond(
+            frames["indicative_cashflow"].filter(
+                pl.col("bmUnit").eq(request.query["bmUnit"])
+                & pl.col("settlementDate").eq(request.match_info["date"])
+            )
+        )
+
+    async def system_prices(request: web.Request) -> web.Response:
+        df = frames["system_prices"].filter(
+            pl.col("settlementDate").eq(request.match_info["date"])
+        )
+        if "period" in request.match_info:
+            df = df.filter(
+                pl.col("settlementPeriod").eq(int(request.match_info["period"]))
+            )
+        return respond(df)
+
+    app = web.Application(middlewares=[simulate])
+    app[STATS] = stats
+    app.router.add_get("/balancing/physical", per_unit("physical"))
+    app.router.add_get("/balancing/acceptances", per_unit("acceptance"))
+    app.router.add_get("/balancing/bid-offer", per_unit("bid_offer"))
+    app.router.add_get("/datasets/{code}/stream", stream)
+    app.router.add_get(
+        "/balancing/settlement/indicative/cashflows/all/{type}/{date}", cashflows
+    )
+    app.router.add_get("/balancing/settlement/system-prices/{date}", system_prices)
+    app.router.add_get(
+        "/balancing/settlement/system-prices/{date}/{period}", system_prices
+    )
+    return app
+
+
+class BackgroundServer:
+    """
+    Runs the app on its own event loop in a background thread
+
+    The stages run their own event loops (and processes), so the server can't share
+    theirs. Used as a context manager, `url` is the base URL to configure the
+    client with.
+    """
+
+    def __init__(self, app: web.Application, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # the port the OS picked, if it was 0
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def __enter__(self) -> "BackgroundServer":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def main(
+    from_time: str,
+    to_time: str,
+    n_units: int = 20,
+    port: int = 8080,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    throttle_rate: float = 0.0,
+    records_per_period: int = 1,
+    seed: int = 0,
+):
+    """Serves the fake API, e.g. to point `client.base_url` at it"""
+    units = synthetic_units(n_units, seed)
+    print(f"Serving {', '.join(units)}")
+    app = create_app(
+        units,
+        from_time,
+        to_time,
+        latency=latency,
+        jitter=jitter,
+        throttle_rate=throttle_rate,
+        records_per_period=records_per_period,
+        seed=seed,
+    )
+    web.run_app(app, host="127.0.0.1", port=port)
+
+
+if __name__ == "__main__":
+    typer.run(main)
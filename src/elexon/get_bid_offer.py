@@ -1,33 +1,104 @@
 import asyncio
-from pathlib import Path
 
-import pandas as pd
 import typer
 import yaml
-from rich.progress import track
 
-from src.elexon.query import get_bid_offer
+from src.elexon.checkpoint import ChunkCheckpoint
+from src.elexon.client import ElexonClient
+from src.elexon.incremental import (
+    HighWaterMarks,
+    append_rows,
+    fetch_start,
+    is_empty,
+    resolve_time_range,
+)
+from src.elexon.metrics import METRICS
+from src.elexon.parallel import report_failures
+from src.elexon.query import (
+    IncompleteFetchError,
+    get_units,
+    run_unit_queue,
+    trim_to_range,
+    unit_batches,
+)
+from src.elexon.store import DataStore
 
 
-def run_from_config(config_path: str, output_folder: str):
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
-
+async def fetch_units(config: dict, output_folder: str):
     from_time = config["from_time"]
     to_time = config["to_time"]
+    incremental = config.get("incremental", False)
+    store = DataStore(output_folder)
+    marks = HighWaterMarks(store.dataset_path("bid_offer"))
+    failures: dict[str, str] = {}
+
+    async with ElexonClient.from_config(config, output_folder) as client:
+
+        async def fetch_batch(units: list[str]):
+            # (stored data, start of what's missing) of the units to fetch
+            planned = {}
+            for unit in units:
+                existing = None
+                start = from_time
+                if store.exists("bid_offer", unit):
+                    if not incremental:
+                        continue
+                    # only fetching what's missing since the last run
+                    existing = store.read("bid_offer", unit)
+                    start = fetch_start(marks, unit, existing, from_time)
+                    if start >= to_time:
+                        continue
+                planned[unit] = existing, start
+            if not planned:
+                return
 
-    for unit in track(config["units"], description="Getting bid-offer data:"):
-        output_path = Path(f"{output_folder}/{unit}.csv")
-        if output_path.exists():
-            continue
+            # the fetched chunks are kept until the units are stored, so that a
+            # restarted run picks up where this one stopped
+            checkpoint = ChunkCheckpoint.for_units(output_folder, "bid_offer", units)
+            try:
+                fetched = await get_units(
+                    client,
+                    "bid_offer",
+                    list(planned),
+                    min(start for _, start in planned.values()),
+                    to_time,
+                    checkpoint,
+                )
+            except IncompleteFetchError as e:
+                # nothing is stored (or marked) with holes in it, the completed
+                # chunks are kept in the checkpoint for the next run
+                for unit in planned:
+                    failures[unit] = f"{type(e).__name__}: {e}"
+                return
+            for unit, (existing, start) in planned.items():
+                new = fetched.get(unit)
+                if new is not None:
+                    new = trim_to_range(new, start, to_time)
+                # units without data are marked empty, so that they're not re-queried,
+                # and a stored unit with nothing new is left as it is
+                if not (is_empty(new) and store.exists("bid_offer", unit)):
+                    store.write("bid_offer", unit, append_rows(existing, new))
+                marks.set(unit, to_time)
+            checkpoint.clear()
 
-        agg = asyncio.run(get_bid_offer(unit, from_time, to_time))
+        failures |= await run_unit_queue(
+            unit_batches(
+                config["units"], from_time, to_time, config.get("fetch_mode", "auto")
+            ),
+            fetch_batch,
+            config.get("max_concurrent_units", 1),
+            "Getting bid-offer data:",
+        )
+
+    report_failures(failures, "Getting bid-offer data")
+
+
+def run_from_config(config_path: str, output_folder: str):
+    with open(config_path, "r") as f:
+        config = resolve_time_range(yaml.safe_load(f))
 
-        if agg is not None:
-            agg.write_csv(f"{output_folder}/{unit}.csv")
-        else:
-            # creating a file so that it's not re-queried next time
-            pd.DataFrame().to_csv(f"{output_folder}/{unit}.csv")
+    with METRICS.exporting(config.get("metrics")):
+        asyncio.run(fetch_units(config, output_folder))
 
 
 if __name__ == "__main__":
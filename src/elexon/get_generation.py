@@ -1,103 +1,339 @@
 import asyncio
 import json
+import traceback
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from pathlib import Path
+from functools import partial
 from typing import Literal, Optional
 
-import pandas as pd
 import polars as pl
 import typer
 import yaml
-from rich.progress import track
+from rich.progress import Progress
 
-from src.elexon.query import get_acceptances, get_physical
+from src.elexon.checkpoint import ChunkCheckpoint
+from src.elexon.client import ElexonClient
+from src.elexon.incremental import (
+    HighWaterMarks,
+    append_rows,
+    fetch_start,
+    is_empty,
+    recompute_start,
+    replace_from,
+    resolve_time_range,
+)
+from src.elexon.metrics import METRICS
+from src.elexon.parallel import process_pool, report_failures
+from src.elexon.query import (
+    IncompleteFetchError,
+    get_acceptances,
+    get_physical,
+    get_units,
+    run_unit_queue,
+    trim_to_range,
+    unit_batches,
+)
+from src.elexon.run_report import RUN_REPORT, timed
+from src.elexon.store import DataStore
 from src.elexon.utils import (
     aggregate_acceptance_and_pn,
     aggregate_bm_unit_generation,
-    safe_create_dir,
+    integrate_acceptance_and_pn,
     smoothen_physical,
 )
 
+COMPUTE_TASK = "Computing generation data"
+# the datasets the generation is computed from
+FETCHED_DATASETS = ["acceptance", "physical"]
+
 
 def downsample_aggregate_for_bm_unit(
     physical: Optional[pl.DataFrame],
     acceptances: Optional[pl.DataFrame],
     downsample_frequency: str,
     energy_unit: Literal["MWh", "GWh"],
+    integration: Literal["minute", "exact"] = "minute",
 ) -> tuple[Optional[pl.DataFrame], Optional[pl.DataFrame]]:
-    """Daily aggregates for the bm unit generation and curtailment"""
+    """
+    Daily aggregates for the bm unit generation and curtailment
+
+    With `integration="minute"` the PN and acceptance levels are upsampled to 1
+    minute before downsampling, with `integration="exact"` the piecewise-linear
+    levels are integrated over each bucket without materialising the minute grid.
+    """
     if physical is None and acceptances is None:
         return None, None
 
-    physical_smoothened = smoothen_physical(physical)
+    if integration == "exact":
+        physical_input = physical
+        aggregate = integrate_acceptance_and_pn
+    else:
+        physical_input = smoothen_physical(physical)
+        aggregate = aggregate_acceptance_and_pn
+
     agg_so_only = None
     if acceptances is not None:
         so_only_acceptances = acceptances.filter(pl.col("soFlag"))
         if so_only_acceptances.shape[0] != 0:
-            agg_so_only = aggregate_acceptance_and_pn(
+            agg_so_only = aggregate(
                 so_only_acceptances,
-                physical_smoothened,
+                physical_input,
                 downsample_frequency,
                 energy_unit,
             )
 
-    agg = aggregate_acceptance_and_pn(
-        acceptances, physical_smoothened, downsample_frequency, energy_unit
-    )
+    agg = aggregate(acceptances, physical_input, downsample_frequency, energy_unit)
 
     return agg, agg_so_only
 
 
-def save_with_empty_default(df: Optional[pl.DataFrame], path: str) -> None:
-    """Saves the dataframe if exists, otherwise an empty csv"""
-    if df is not None:
-        df.write_csv(path)
-    else:
-        # creating a file so that it's not re-queried next time
-        pd.DataFrame().to_csv(path)
+def downsample_stored_unit(
+    output_folder: str,
+    unit: str,
+    downsample_frequency: str,
+    energy_unit: Literal["MWh", "GWh"],
+    integration: Literal["minute", "exact"],
+    start: Optional[datetime] = None,
+) -> None:
+    """
+    Downsamples the unit's stored PN and acceptance data into the generation datasets
+
+    Runs in the compute processes. With `start`, only the buckets from `start`
+    onwards are recomputed: those only depend on the rows ending after the bucket
+    starts, and the stored buckets before it are kept.
+    """
+    store = DataStore(output_folder)
+    physical = store.read("physical", unit)
+    acceptances = store.read("acceptance", unit)
+
+    if start is not None:
+
+        def ending_after_start(df: Optional[pl.DataFrame]) -> Optional[pl.DataFrame]:
+            if df is None:
+                return None
+            df = df.filter(pl.col("timeTo").gt(start))
+            return None if df.is_empty() else df
+
+        physical = ending_after_start(physical)
+        acceptances = ending_after_start(acceptances)
+
+    agg, agg_so_only = downsample_aggregate_for_bm_unit(
+        physical, acceptances, downsample_frequency, energy_unit, integration
+    )
+    for dataset, df in [("generation/total", agg), ("generation/so_only", agg_so_only)]:
+        if start is not None:
+            df = replace_from(store.read(dataset, unit), df, start)
+        store.write(dataset, unit, df)
 
 
 def downsample_for_config(config_path: str, output_folder: str):
     with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
+        config = resolve_time_range(yaml.safe_load(f))
+
+    with METRICS.exporting(config.get("metrics")):
+        asyncio.run(downsample_units(config, DataStore(output_folder)))
+
+
+async def downsample_units(config: dict, store: DataStore):
+    """
+    Fetches the PN and acceptance data of every unit, and downsamples it
+
+    Fetching and computing are decoupled: the fetched units wait in a bounded queue
+    for the `workers` compute processes, so the downloads of the next units overlap
+    with the compute of the previous ones, without fetching further ahead than the
+    compute can keep up with. A unit failing to compute is reported at the end.
+    """
     from_time = config["from_time"]
     to_time = config["to_time"]
     downsample_frequency = config["downsample_frequency"]
     energy_unit = config["energy_unit"]
+    integration = config.get("integration", "minute")
+    incremental = config.get("incremental", False)
+    workers = config.get("workers", 1)
+    marks = {
+        dataset: HighWaterMarks(store.dataset_path(dataset))
+        for dataset in FETCHED_DATASETS
+    }
+
+    # (unit, start of the buckets to recompute), None when the fetching is done
+    queue: asyncio.Queue[Optional[tuple[str, Optional[datetime]]]] = asyncio.Queue(
+        maxsize=2 * workers
+    )
+    failures: dict[str, str] = {}
+    fetch_failures: dict[str, str] = {}
+    # with a single worker the compute runs in a thread (polars releases the GIL)
+    pool = process_pool(workers) if workers > 1 else None
+    loop = asyncio.get_running_loop()
+
+    async with ElexonClient.from_config(config, store.folder) as client:
+
+        async def fetch_new(
+            units: list[str], dataset: str
+        ) -> tuple[dict[str, tuple], ChunkCheckpoint]:
+            """
+            Fetches the units' data missing up to `to_time`, without storing it
+
+            Returns the (stored data, new rows) of every unit to extend, and the
+            checkpoint holding the fetched chunks until the units are stored, so that
+            a restarted run picks up where this one stopped.
+            """
+            # (stored data, start of what's missing) of the units to extend
+            planned = {}
+            for unit in units:
+                if store.exists(dataset, unit):
+                    if not incremental:
+                        continue
+                    existing = store.read(dataset, unit)
+                    start = fetch_start(marks[dataset], unit, existing, from_time)
+                else:
+                    existing, start = None, from_time
+                planned[unit] = existing, start
+
+            starts = [start for _, start in planned.values() if start < to_time]
+            checkpoint = ChunkCheckpoint.for_units(store.folder, dataset, units)
+            fetched = {}
+            if starts:
+                fetched = await get_units(
+                    client,
+                    dataset,
+                    [unit for unit, (_, start) in planned.items() if start < to_time],
+                    min(starts),
+                    to_time,
+                    checkpoint,
+                )
+
+            extended = {}
+            for unit, (existing, start) in planned.items():
+                new = fetched.get(unit)
+                if new is not None:
+                    new = trim_to_range(new, start, to_time)
+                extended[unit] = existing, new
+            return extended, checkpoint
+
+        async def fetch_batch(units: list[str]):
+            generated = {unit: store.exists("generation/total", unit) for unit in units}
+            if not incremental:
+                progress.advance(compute_task, sum(generated.values()))
+                units = [unit for unit in units if not generated[unit]]
+
+            results = await asyncio.gather(
+                *[fetch_new(units, dataset) for dataset in FETCHED_DATASETS],
+                return_exceptions=True,
+            )
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                for error in errors:
+                    if not isinstance(error, Exception):
+                        # e.g. the stage being cancelled
+                        raise error
+                # nothing is stored (or marked) unless both datasets were fetched, so
+                # a unit's PNs and acceptances never cover different ranges; the
+                # completed chunks are kept in the checkpoints for the next run
+                error = errors[0]
+                if isinstance(error, IncompleteFetchError):
+                    message = f"{type(error).__name__}: {error}"
+                else:
+                    message = "".join(traceback.format_exception(error))
+                for unit in units:
+                    fetch_failures[unit] = message
+                progress.advance(compute_task, len(units))
+                return
+
+            new_rows = {dataset: {} for dataset in FETCHED_DATASETS}
+            for dataset, (extended, _) in zip(FETCHED_DATASETS, results):
+                for unit, (existing, new) in extended.items():
+                    new_rows[dataset][unit] = new
+                    # a stored unit with nothing new is left as it is, only marked
+                    if is_empty(new) and store.exists(dataset, unit):
+                        continue
+                    store.write(dataset, unit, append_rows(existing, new))
+            # the marks only move once both datasets of the units are stored
+            for dataset, (extended, checkpoint) in zip(FETCHED_DATASETS, results):
+                for unit in extended:
+                    marks[dataset].set(unit, to_time)
+                checkpoint.clear()
+
+            for unit in units:
+                start = None
+                if generated[unit]:
+                    start = recompute_start(
+                        [new_rows[dataset].get(unit) for dataset in FETCHED_DATASETS],
+                        downsample_frequency,
+                    )
+                    if start is None:
+                        progress.advance(compute_task)
+                        continue
+
+                # waits while the compute is behind
+                await queue.put((unit, start))
+                METRICS.set("elexon_queue_depth", queue.qsize(), task=COMPUTE_TASK)
+
+        async def compute():
+            nonlocal pool
+            while (item := await queue.get()) is not None:
+                unit, start = item
+                METRICS.set("elexon_queue_depth", queue.qsize(), task=COMPUTE_TASK)
+                current_pool = pool
+                try:
+                    _, wall_time, cpu_time = await loop.run_in_executor(
+                        current_pool,
+                        partial(
+                            timed,
+                            downsample_stored_unit,
+                            str(store.folder),
+                            unit,
+                            downsample_frequency,
+                            energy_unit,
+                            integration,
+                            start,
+                        ),
+                    )
+                    RUN_REPORT.unit(unit, "compute", wall_time, cpu_time)
+                    METRICS.inc("elexon_units_completed_total", task=COMPUTE_TASK)
+                except BrokenProcessPool:
+                    # a worker died, taking the pool (and the units in it) with it
+                    failures[unit] = "worker process died"
+                    if current_pool is pool:
+                        current_pool.shutdown(wait=False, cancel_futures=True)
+                        pool = process_pool(workers)
+                except Exception:
+                    failures[unit] = traceback.format_exc()
+                progress.advance(compute_task)
+
+        try:
+            with Progress() as progress:
+                compute_task = progress.add_task(
+                    f"{COMPUTE_TASK}:", total=len(config["units"])
+                )
+                consumers = [
+                    asyncio.create_task(compute()) for _ in range(max(workers, 1))
+                ]
+                try:
+                    fetch_failures |= await run_unit_queue(
+                        unit_batches(
+                            config["units"],
+                            from_time,
+                            to_time,
+                            config.get("fetch_mode", "auto"),
+                        ),
+                        fetch_batch,
+                        config.get("max_concurrent_units", 1),
+                        "Getting generation data:",
+                        progress,
+                    )
+                finally:
+                    # the consumers stop once they've computed the queued units,
+                    # even if the fetching failed
+                    for _ in consumers:
+                        await queue.put(None)
+                    await asyncio.gather(*consumers)
+                METRICS.set("elexon_queue_depth", 0, task=COMPUTE_TASK)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
 
-    output_folder = Path(output_folder)
-
-    safe_create_dir(output_folder / "generation")
-    safe_create_dir(output_folder / "generation/total")
-    safe_create_dir(output_folder / "generation/so_only")
-    safe_create_dir(output_folder / "acceptance")
-    safe_create_dir(output_folder / "physical")
-
-    for unit in track(config["units"], description="Getting generation data:"):
-        output_path = Path(f"{output_folder}/generation/total/{unit}.csv")
-        if output_path.exists():
-            continue
-
-        if Path(f"{output_folder}/acceptance/{unit}.csv").exists():
-            acceptances = pl.read_csv(f"{output_folder}/acceptance/{unit}.csv")
-        else:
-            acceptances = asyncio.run(get_acceptances(unit, from_time, to_time))
-
-        if Path(f"{output_folder}/physical/{unit}.csv").exists():
-            physical = pl.read_csv(f"{output_folder}/physical/{unit}.csv")
-        else:
-            physical = asyncio.run(get_physical(unit, from_time, to_time))
-
-        agg, agg_so_only = downsample_aggregate_for_bm_unit(
-            physical, acceptances, downsample_frequency, energy_unit
-        )
-
-        save_with_empty_default(agg, f"{output_folder}/generation/total/{unit}.csv")
-        save_with_empty_default(
-            agg_so_only, f"{output_folder}/generation/so_only/{unit}.csv"
-        )
-        save_with_empty_default(acceptances, f"{output_folder}/acceptance/{unit}.csv")
-        save_with_empty_default(physical, f"{output_folder}/physical/{unit}.csv")
+    report_failures(fetch_failures, "Getting generation data")
+    report_failures(failures, "Computing generation data")
 
 
 def totals_for_bm_unit(bm_unit: str, from_time: str, to_time: str) -> dict:
@@ -1,81 +1,121 @@
 import asyncio
+import time
 from pathlib import Path
 
-import pandas as pd
 import polars as pl
 import typer
 import yaml
 from rich.progress import track
 
-from src.elexon.query import fetch_unit_cashflows
-from src.elexon.utils import safe_create_dir
+from src.elexon.client import ElexonClient
+from src.elexon.incremental import (
+    HighWaterMarks,
+    append_rows,
+    fetch_start,
+    resolve_time_range,
+)
+from src.elexon.metrics import METRICS
+from src.elexon.parallel import report_failures
+from src.elexon.query import IncompleteFetchError, fetch_unit_cashflows
+from src.elexon.run_report import RUN_REPORT
+from src.elexon.store import DataStore
 
 
 def run_from_config(config_path: str, output_folder: str):
     with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
+        config = resolve_time_range(yaml.safe_load(f))
 
     with open(Path(output_folder) / "config.yaml", "w") as f:
         yaml.safe_dump(config, f)
 
+    with METRICS.exporting(config.get("metrics")):
+        asyncio.run(fetch_units(config, output_folder))
+
+
+async def fetch_units(config: dict, output_folder: str):
     from_time = config["from_time"]
     to_time = config["to_time"]
     retry_empty = config["retry_empty"]
-
-    for cashflow_type in ["bid", "offer"]:
-        type_folder = Path(output_folder) / cashflow_type
-        safe_create_dir(type_folder)
-
-        for unit in track(
-            config["units"],
-            description=f"Getting indicative cashflow data ({cashflow_type}):",
-        ):
-            output_path = Path(type_folder / f"{unit}.csv")
-
-            _acceptance = pl.read_csv(
-                str(output_path).replace(
-                    f"indicative_cashflow/{cashflow_type}", "acceptance"
-                )
-            )
-
-            # This is to reduce the number of calls we're making to the API: if there's
-            # no acceptance, there shouldn't be
-            # a cashflow for it
-            if _acceptance.is_empty():
-                continue
-            else:
-                # restricting the search to those periods where we had acceptances
-                to_time = _acceptance.select(pl.col("settlementDate").max()).item()
-                from_time = _acceptance.select(pl.col("settlementDate").min()).item()
-
-            if output_path.exists():
-                if not retry_empty:
+    incremental = config.get("incremental", False)
+    store = DataStore(output_folder)
+
+    async with ElexonClient.from_config(config, output_folder) as client:
+        for cashflow_type in ["bid", "offer"]:
+            dataset = f"indicative_cashflow/{cashflow_type}"
+            marks = HighWaterMarks(store.dataset_path(dataset))
+
+            description = f"Getting indicative cashflow data ({cashflow_type})"
+            failures: dict[str, str] = {}
+            for unit in track(config["units"], description=f"{description}:"):
+                _acceptance = store.read("acceptance", unit)
+
+                # This is to reduce the number of calls we're making to the API: if there's
+                # no acceptance, there shouldn't be
+                # a cashflow for it
+                if _acceptance is None:
                     continue
                 else:
-                    _df = pl.read_csv(output_path)
-
-                    if not _df.is_empty():
+                    # restricting the search to those periods where we had acceptances
+                    to_time = _acceptance.select(pl.col("settlementDate").max()).item()
+                    from_time = _acceptance.select(
+                        pl.col("settlementDate").min()
+                    ).item()
+
+                existing = None
+                if store.exists(dataset, unit):
+                    existing = store.read(dataset, unit)
+                    if incremental:
+                        # the last fetched day is fetched again, as it may have been
+                        # incomplete
+                        from_time = max(
+                            from_time,
+                            fetch_start(
+                                marks, unit, existing, from_time, "settlementDate"
+                            ),
+                        )
+                        if from_time > to_time:
+                            continue
+                    elif not retry_empty:
+                        continue
+                    elif existing is not None:
                         continue
                     else:
                         print(f"No data found for {unit}, retrying...")
 
-            dfs = asyncio.run(
-                fetch_unit_cashflows(unit, from_time, to_time, cashflow_type)
-            )
-
-            if dfs:
-                agg = pl.concat(dfs)
-                if agg is not None:
-                    # NOTE: if more granular data is needed, then we need to unnest
-                    # x§the `bidOfferPairCashflows`
-                    agg.write_csv(output_path)
+                started = time.perf_counter()
+                try:
+                    dfs = await fetch_unit_cashflows(
+                        client, unit, from_time, to_time, cashflow_type
+                    )
+                except IncompleteFetchError as e:
+                    # nothing is stored (or marked) with holes in it, the next
+                    # incremental run fetches the days again
+                    failures[unit] = f"{type(e).__name__}: {e}"
                     continue
-                else:
-                    print(f"Aggregate is None for {unit}")
-            else:
-                print(f"No valid days found for {unit}")
-
-            pd.DataFrame().to_csv(output_path)
+                finally:
+                    RUN_REPORT.unit(
+                        unit, f"fetch_{cashflow_type}", time.perf_counter() - started
+                    )
+
+                if not dfs:
+                    print(f"No valid days found for {unit}")
+
+                # NOTE: if more granular data is needed, then we need to unnest
+                # x§the `bidOfferPairCashflows`
+                # (a stored unit with nothing new is left as it is)
+                if dfs or not store.exists(dataset, unit):
+                    store.write(
+                        dataset,
+                        unit,
+                        append_rows(
+                            existing,
+                            pl.concat(dfs, rechunk=False) if dfs else None,
+                            subset=["settlementDate", "settlementPeriod", "bmUnit"],
+                        ),
+                    )
+                marks.set(unit, to_time)
+                METRICS.inc("elexon_units_completed_total", task=description)
+            report_failures(failures, description)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,60 @@
 import asyncio
-from pathlib import Path
+from typing import Optional
 
 import polars as pl
 import typer
+import yaml
 
+from src.elexon.client import ElexonClient
+from src.elexon.incremental import append_rows
+from src.elexon.metrics import METRICS
 from src.elexon.query import fetch_imbalance_settlement
+from src.elexon.store import DataStore
 
 
-def main(from_time: str, to_time: str, output_folder: str):
-    df: pl.DataFrame = asyncio.run(
-        fetch_imbalance_settlement(from_time=from_time, to_time=to_time)
-    )
+async def fetch(
+    config: dict, output_folder: str, from_time: str, to_time: str
+) -> pl.DataFrame:
+    async with ElexonClient.from_config(config, output_folder) as client:
+        return await fetch_imbalance_settlement(
+            client, from_time=from_time, to_time=to_time
+        )
+
+
+def main(
+    from_time: str,
+    to_time: str,
+    output_folder: str,
+    incremental: bool = False,
+    config_path: Optional[str] = None,
+):
+    """
+    Fetches the system prices into the `system_prices` dataset of the store
+
+    With `--incremental`, the stored prices are extended from their last settlement
+    date (which is fetched again, as it may have been incomplete). With
+    `--config-path`, the requests use the run config's `client` section (rate
+    limit, cache, ...), like the other stages, and its metrics are exported.
+    """
+    config = {}
+    if config_path is not None:
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f)
 
-    df.write_csv(Path(output_folder) / "imbalance_settlement.csv")
+    store = DataStore(output_folder)
+    existing = store.read("system_prices") if incremental else None
+    if existing is not None:
+        last_date = existing.select(pl.col("settlementDate").max()).item()
+        from_time = max(from_time, f"{last_date}T00:00:00Z")
+
+    with METRICS.exporting(config.get("metrics")):
+        df = asyncio.run(fetch(config, output_folder, from_time, to_time))
+
+    store.write(
+        "system_prices",
+        None,
+        append_rows(existing, df, subset=["settlementDate", "settlementPeriod"]),
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+from src.elexon.query import TIME_FORMAT
+from src.elexon.store import with_datetimes
+
+
+def resolve_time_range(config: dict) -> dict:
+    """
+    Resolves `to_time: now` to the start of the current settlement period (UTC)
+
+    Returns a copy of the config, so that the resolved time can be saved and passed
+    on to every stage of the run.
+    """
+    config = dict(config)
+    if config["to_time"] == "now":
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        now = now.replace(minute=now.minute // 30 * 30, second=0, microsecond=0)
+        config["to_time"] = now.strftime(TIME_FORMAT)
+    return config
+
+
+class HighWaterMarks:
+    """
+    Per-unit record of the time up to which a dataset has been fetched (or computed)
+
+    Kept as `_high_water_marks.json` in the dataset's folder, and written after
+    every update, so that an interrupted run still knows what it has stored.
+    """
+
+    def __init__(self, folder: Path):
+        self.path = Path(folder) / "_high_water_marks.json"
+        self.marks: dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.marks = json.load(f)
+
+    def get(self, unit: str) -> Optional[str]:
+        return self.marks.get(unit)
+
+    def set(self, unit: str, time: str) -> None:
+        self.marks[unit] = time
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.marks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def fetch_start(
+    marks: HighWaterMarks,
+    unit: str,
+    existing: Optional[pl.DataFrame],
+    from_time: str,
+    time_column: str = "timeTo",
+) -> str:
+    """
+    Where fetching should continue from for the unit
+
+    Falls back to the latest time in the stored data for outputs written before
+    the high-water marks were recorded, and to `from_time` if there's nothing.
+    """
+    mark = marks.get(unit)
+    if mark is not None:
+        return mark
+    if existing is not None and time_column in existing.columns:
+        latest = existing.select(pl.col(time_column).max()).item()
+        if isinstance(latest, datetime.datetime):
+            return latest.strftime(TIME_FORMAT)
+        if latest is not None:
+            return latest
+    return from_time
+
+
+def is_empty(df: Optional[pl.DataFrame]) -> bool:
+    """Whether nothing was fetched"""
+    return df is None or df.is_empty()
+
+
+def append_rows(
+    existing: Optional[pl.DataFrame],
+    new: Optional[pl.DataFrame],
+    subset: Optional[list[str]] = None,
+) -> Optional[pl.DataFrame]:
+    """
+    Appends the newly fetched rows to the stored ones
+
+    Rows fetched again (e.g. the ones spanning the previous high-water mark) are
+    deduplicated, keeping the new version if `subset` is given.
+    """
+    if existing is None:
+        return new
+    if new is None or new.is_empty():
+        return existing
+    return pl.concat(
+        [with_datetimes(existing), with_datetimes(new)], how="diagonal_relaxed"
+    ).unique(subset=subset, keep="last", maintain_order=True)
+
+
+def recompute_start(
+    new: list[Optional[pl.DataFrame]], every: str
+) -> Optional[datetime.datetime]:
+    """
+    Start of the first downsampled bucket touched by the newly fetched rows
+
+    Buckets before it only depend on rows that were already stored, so they don't
+    need to be recomputed. Returns None if nothing new was fetched.
+    """
+    starts = [
+        with_datetimes(df).select(pl.col("timeFrom").min()).item()
+        for df in new
+        if df is not None and not df.is_empty()
+    ]
+    if not starts:
+        return None
+    return pl.Series([min(starts)]).dt.truncate(every).item()
+
+
+def replace_from(
+    existing: Optional[pl.DataFrame],
+    recomputed: Optional[pl.DataFrame],
+    start: datetime.datetime | str,
+    time_column: str = "time",
+) -> Optional[pl.DataFrame]:
+    """Replaces the stored rows from `start` onwards with the recomputed ones"""
+    if existing is None:
+        return recomputed
+    kept = existing.filter(pl.col(time_column) < start)
+    if recomputed is None or recomputed.is_empty():
+        return kept
+    return pl.concat(
+        [kept, recomputed.filter(pl.col(time_column) >= start)],
+        how="diagonal_relaxed",
+    )
@@ -0,0 +1,228 @@
+import bisect
+import os
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# latencies of the Elexon API, from cached-at-the-edge responses to slow streams
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name: (type, help)
+DEFINITIONS = {
+    "elexon_requests_in_flight": ("gauge", "Requests waiting for their response"),
+    "elexon_request_duration_seconds": (
+        "histogram",
+        "Time to the response headers, per endpoint",
+    ),
+    "elexon_responses_total": ("counter", "Responses, per endpoint and status"),
+    "elexon_request_errors_total": (
+        "counter",
+        "Requests that timed out or lost their connection",
+    ),
+    "elexon_throttled_total": ("counter", "Rate limited (429) responses"),
+    "elexon_retry_wait_seconds_total": (
+        "counter",
+        "Time waited before retrying rate limited requests",
+    ),
+    "elexon_cache_hits_total": ("counter", "Requests answered by the response cache"),
+    "elexon_queue_depth": ("gauge", "Units (or batches) waiting to be processed"),
+    "elexon_units_completed_total": ("counter", "Units processed"),
+    "elexon_rows_written_total": ("counter", "Rows written to the store"),
+}
+
+_DATE = re.compile(r"/\d{4}-\d{2}-\d{2}(?=/|$)")
+_NUMBER = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint(url: str, base_url: str) -> str:
+    """
+    The endpoint of a request, as a label, e.g. `/balancing/physical`
+
+    The query, and the dates and periods in the path, are left out, so there's a
+    label per endpoint rather than per request.
+    """
+    path, base = urlsplit(url).path, urlsplit(base_url).path
+    if base and path.startswith(base):
+        path = path[len(base) :]
+    return _NUMBER.sub("/{period}", _DATE.sub("/{date}", path))
+
+
+def _labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and histograms of the fetch jobs, in the
+    Prometheus text format
+
+    They're only kept in memory: `start` serves them on `port` (for Prometheus to
+    scrape) and/or writes them to `textfile` every `interval_seconds` (for
+    node_exporter's textfile collector), e.g. from the `metrics` section of the run
+    config. Nothing is exported until then.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._values: dict[str, dict[tuple, float]] = defaultdict(dict)
+        # per label set: the count per bucket (and above them), and the sum
+        self._histograms: dict[str, dict[tuple, tuple[list[int], float]]] = defaultdict(
+            dict
+        )
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._textfile: Optional[Path] = None
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """Adds `value` to a counter (or gauge, which can go down)"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Sets a gauge"""
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Adds a value to a histogram"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._histograms[name].get(
+                key, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._histograms[name][key] = (counts, total + value)
+
+    def value(self, name: str, **labels: str) -> float:
+        """The value of a counter or gauge, 0 if it hasn't been set"""
+        with self._lock:
+            return self._values[name].get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> str:
+        """Every metric so far, in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._values.keys() | self._histograms.keys()):
+                kind, help = DEFINITIONS.get(name, ("untyped", name))
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+                for key, (counts, total) in sorted(
+                    self._histograms.get(name, {}).items()
+                ):
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, "+Inf"), counts):
+                        cumulative += count
+                        le = _labels((*key, ("le", str(bound))))
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {total:g}")
+                    lines.append(f"{name}_count{_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str | Path) -> None:
+        """Writes the metrics to `path`, replacing it at once so it's never partial"""
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+    @property
+    def port(self) -> Optional[int]:
+        """The port the metrics are served on, if they are"""
+        return None if self._server is None else self._server.server_address[1]
+
+    def start(
+        self,
+        port: Optional[int] = None,
+        textfile: Optional[str] = None,
+        interval_seconds: float = 15.0,
+        host: str = "0.0.0.0",
+    ) -> None:
+        """Serves the metrics on `port` and/or writes them to `textfile`"""
+        self._stop.clear()
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self._handler())
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, daemon=True)
+            )
+        if textfile is not None:
+            self._textfile = Path(textfile)
+            self._threads.append(
+                threading.Thread(
+                    target=self._write_every, args=(interval_seconds,), daemon=True
+                )
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stops exporting, writing the textfile a last time"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self._textfile is not None:
+            self.write_textfile(self._textfile)
+        self._server, self._textfile, self._threads = None, None, []
+
+    @contextmanager
+    def exporting(self, config: Optional[dict]) -> Iterator[None]:
+        """
+        Exports the metrics during the block, as configured by the run config's
+        `metrics` section (see `start`)
+
+        Does nothing without a config, or if they're already exported, e.g. by the
+        orchestrator running the stage.
+        """
+        if not config or self._threads:
+            yield
+            return
+        self.start(**config)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def _write_every(self, interval_seconds: float) -> None:
+        while not self._stop.wait(interval_seconds):
+            self.write_textfile(self._textfile)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # scrapes every few seconds would drown the progress bars
+                pass
+
+        return Handler
+
+
+METRICS = Metrics()
@@ -1,5 +1,5 @@
-import os
 from pathlib import Path
+from typing import Iterator
 
 import typer
 import yaml
@@ -8,33 +8,76 @@ from src.elexon.calculate_cashflow import run_from_config as calc_cf
 from src.elexon.get_bid_offer import run_from_config as run_bo
 from src.elexon.get_generation import downsample_for_config as run_gen
 from src.elexon.get_indicative_cashflow import run_from_config as run_ic
+from src.elexon.incremental import resolve_time_range
+from src.elexon.metrics import METRICS
+from src.elexon.rate_limit import RATE_LIMITER
+from src.elexon.run_report import REPORT_FILE, RUN_REPORT
+from src.elexon.store import DataStore
 
+GENERATION_DATASETS = [
+    "physical",
+    "acceptance",
+    "generation/total",
+    "generation/so_only",
+]
+CASHFLOW_DATASETS = ["indicative_cashflow/bid", "indicative_cashflow/offer"]
 
-def run_from_config(config_path: str, output_folder: str):
+
+def run_stages(config_path: str, output_folder: str) -> Iterator[str]:
+    """
+    Runs every stage for the config, yielding each stage's name once it's done
+
+    With `incremental: true` the outputs of a previous run in the same folder are
+    extended up to `to_time` (which can be `now`), fetching only the missing data.
+    Every dataset is kept in the Parquet store in the output folder (see `DataStore`),
+    and the figures of each stage are appended to `run_report.jsonl` next to the
+    config (see `RunReport`). With a `metrics` section, the metrics of the run are
+    exported while it runs (see `Metrics`).
+    """
     with open(config_path, "r") as f:
         config = yaml.safe_load(f)
 
-    with open(Path(output_folder) / "config.yaml", "w") as f:
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+    # resolving `now` once, so that every stage runs up to the same time
+    config = resolve_time_range(config)
+    config_path = str(Path(output_folder) / "config.yaml")
+    with open(config_path, "w") as f:
         yaml.safe_dump(config, f)
 
-    bo_folder = output_folder + "/bid_offer"
-    gen_folder = (
-        output_folder  # run_gen creates its own folders for generation and acceptances
-    )
-    ic_folder = output_folder + "/indicative_cashflow"
-    cashflow_folder = output_folder + "/calculated_cashflow"
+    # the report of each stage, next to the config it ran with
+    store = DataStore(output_folder)
+    # exported for the whole run, so that the stages don't each start their own
+    with METRICS.exporting(config.get("metrics")):
+        RUN_REPORT.open(Path(output_folder) / REPORT_FILE)
+        try:
+            with RUN_REPORT.stage("bid_offer", store, ["bid_offer"]):
+                run_bo(config_path, output_folder)
+            yield "bid_offer"
+            with RUN_REPORT.stage("generation", store, GENERATION_DATASETS):
+                run_gen(config_path, output_folder)
+            yield "generation"
+            with RUN_REPORT.stage("indicative_cashflow", store, CASHFLOW_DATASETS):
+                run_ic(config_path, output_folder)
+            yield "indicative_cashflow"
+            print(f"Elexon API: {RATE_LIMITER.stats}")
 
-    for f in [bo_folder, gen_folder, ic_folder, cashflow_folder]:
-        p = Path(f)
-        if not p.exists():
-            os.mkdir(p)
+            # turning off calc cf for now to speed things up.
+            with RUN_REPORT.stage("cashflow", store, ["calculated_cashflow"]):
+                calc_cf(
+                    output_folder,
+                    config.get("incremental", False),
+                    config.get("workers", 1),
+                )
+            yield "cashflow"
+        finally:
+            RUN_REPORT.close()
 
-    run_bo(config_path, bo_folder)
-    run_gen(config_path, gen_folder)
-    run_ic(config_path, ic_folder)
 
-    # turning off calc cf for now to speed things up.
-    calc_cf(bo_folder, gen_folder + "/generation/total", cashflow_folder)
+def run_from_config(config_path: str, output_folder: str):
+    """Runs every stage for the config (see `run_stages`)"""
+    for _ in run_stages(config_path, output_folder):
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import re
+import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Hashable, TypeVar
+
+from rich.progress import Progress
+
+from src.elexon.metrics import METRICS
+from src.elexon.run_report import RUN_REPORT, timed
+
+T = TypeVar("T", bound=Hashable)
+R = TypeVar("R")
+
+EXCEPTION_LINE = re.compile(r"^[\w.]+(Error|Exception)\b")
+
+
+def _init_worker(threads: int) -> None:
+    # every worker would otherwise start a polars thread per core
+    os.environ["POLARS_MAX_THREADS"] = str(threads)
+
+
+def process_pool(
+    workers: int, max_tasks_per_child: int = 50, threads_per_worker: int = 1
+) -> ProcessPoolExecutor:
+    """
+    Process pool for the CPU-heavy (polars) stages
+
+    Workers are spawned rather than forked, as forking a process with polars'
+    thread pool running can deadlock, and are replaced after `max_tasks_per_child`
+    units, so the memory they hold on to stays bounded.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=max_tasks_per_child,
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    )
+
+
+def run_in_processes(
+    func: Callable[[T], R],
+    items: list[T],
+    workers: int,
+    description: str,
+    max_tasks_per_child: int = 50,
+) -> tuple[dict[T, R], dict[T, str]]:
+    """
+    Runs `func` for every item in a process pool
+
+    At most twice as many items as workers are submitted at a time, and the results
+    are collected in order, so the progress follows the order of `items`. An item
+    failing (or killing its worker) doesn't stop the run: the failures are returned
+    with their tracebacks, next to the results of the other items.
+
+    `func` must be importable by the workers, i.e. a module level function (or a
+    `functools.partial` of one). With a single worker, the items are run in this
+    process instead. The time of each item is added to the `RUN_REPORT`, and the
+    items done to the `METRICS`.
+    """
+    results: dict[T, R] = {}
+    failures: dict[T, str] = {}
+    remaining = deque(items)
+    # items that were in flight when a worker died, rerun one at a time to find
+    # the one that killed it
+    suspects: deque[T] = deque()
+    # (item, future, whether it's a suspect running on its own)
+    pending: deque[tuple[T, Future, bool]] = deque()
+
+    # the description without the trailing colon, as the metrics' label
+    label = description.rstrip(": ")
+    with Progress() as progress:
+        task = progress.add_task(description, total=len(items))
+        if workers <= 1:
+            for item in items:
+                try:
+                    results[item], wall_time, cpu_time = timed(func, item)
+                    RUN_REPORT.unit(str(item), "compute", wall_time, cpu_time)
+                    METRICS.inc("elexon_units_completed_total", task=label)
+                except Exception:
+                    failures[item] = traceback.format_exc()
+                progress.advance(task)
+            return results, failures
+
+        pool = process_pool(workers, max_tasks_per_child)
+        try:
+            while remaining or suspects or pending:
+                try:
+                    if suspects:
+                        if not pending:
+                            item = suspects.popleft()
+                            future = pool.submit(timed, func, item)
+                            pending.append((item, future, True))
+                    else:
+                        while remaining and len(pending) < 2 * workers:
+                            future = pool.submit(timed, func, remaining[0])
+                            pending.append((remaining.popleft(), future, False))
+                    item, future, _ = pending[0]
+                    result, wall_time, cpu_time = future.result()
+                except BrokenProcessPool:
+                    # the pool is lost with everything that was submitted to it
+                    if pending and pending[0][2]:
+                        failures[pending.popleft()[0]] = "worker process died"
+                        progress.advance(task)
+                    suspects.extend(item for item, _, _ in pending)
+                    pending.clear()
+                    pool.shutdown(cancel_futures=True)
+                    pool = process_pool(workers, max_tasks_per_child)
+                    continue
+                except Exception:
+                    failures[item] = traceback.format_exc()
+                else:
+                    results[item] = result
+                    RUN_REPORT.unit(str(item), "compute", wall_time, cpu_time)
+                    METRICS.inc("elexon_units_completed_total", task=label)
+                pending.popleft()
+                progress.advance(task)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    return results, failures
+
+
+def report_failures(failures: dict, description: str) -> None:
+    """Prints the items that failed, with the exception line of their traceback"""
+    if not failures:
+        return
+    print(f"{description}: {len(failures)} failed")
+    for item, error in failures.items():
+        lines = error.strip().splitlines()
+        # polars errors carry the query plan after the exception line
+        summary = next(
+            (line for line in reversed(lines) if EXCEPTION_LINE.match(line)),
+            lines[-1],
+        )
+        print(f"  {item}: {summary}")
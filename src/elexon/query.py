@@ -1,281 +1,875 @@
 import asyncio
 import datetime
-from typing import Callable, Literal, Optional
+import io
+import time
+import traceback
+import zoneinfo
+from collections import Counter
+from dataclasses import dataclass
+from functools import partial
+from typing import Awaitable, Callable, Literal, Optional, Sequence, TypeVar
 
 import aiohttp
 import pandas as pd
 import polars as pl
+import pyarrow as pa
+import pyarrow.json as pj
+from rich.progress import Progress
+
+from src.elexon import schemas
+from src.elexon.checkpoint import ChunkCheckpoint
+from src.elexon.client import ElexonClient
+from src.elexon.metrics import METRICS, endpoint
+from src.elexon.rate_limit import backoff_delay, retry_after_seconds
+from src.elexon.run_report import RUN_REPORT
+
+T = TypeVar("T")
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+CHUNK_LENGTH = datetime.timedelta(days=7)
+LONDON = zoneinfo.ZoneInfo("Europe/London")
+# a Monday, the chunk grid is anchored on
+GRID_ORIGIN = datetime.datetime(2024, 1, 1)
+
+# the dataset stream endpoints take several units per request, but their range is
+# limited, so they're requested per day
+BULK_CHUNK_LENGTH = datetime.timedelta(days=1)
+BULK_UNITS_PER_REQUEST = 50
+# a bulk batch is held in memory until it's split by unit, so its units times days
+# are capped, at about a month of a full request
+BULK_MAX_UNIT_DAYS = BULK_UNITS_PER_REQUEST * 31
+
+
+def aligned_chunks(
+    start_dt: datetime.datetime,
+    end_dt: datetime.datetime,
+    length: datetime.timedelta = CHUNK_LENGTH,
+) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Splits the time range into chunks on a fixed UTC grid
+
+    Chunks of a week follow the ISO weeks (Monday to Monday), and the first and
+    last ones are cut to whole days around the requested range. This way, runs with
+    different start and end times still make the same requests for the weeks they
+    share (and so can reuse cached responses), and extending a run only requests
+    the days at its end.
+    """
+    day = datetime.timedelta(days=1)
+    first_day = datetime.datetime.combine(start_dt.date(), datetime.time())
+    last_day = datetime.datetime.combine(end_dt.date(), datetime.time())
+    if last_day < end_dt:
+        last_day += day
+
+    chunks = []
+    current_start = first_day
+    while current_start < last_day:
+        grid_start = current_start - (current_start - GRID_ORIGIN) % length
+        current_end = min(grid_start + length, last_day)
+        chunks.append((current_start, current_end))
+        current_start = current_end
+    return chunks
+
+
+def trim_to_range(df: pl.DataFrame, from_time: str, to_time: str) -> pl.DataFrame:
+    """
+    Keeps the rows overlapping the `from_time` - `to_time` range
+
+    The times are either decoded as Datetime, or (without a schema) ISO strings,
+    which are all formatted the same way, so they can be compared as strings.
+    """
+    if df.schema["timeFrom"] != pl.String:
+        from_time = datetime.datetime.strptime(from_time, TIME_FORMAT)
+        to_time = datetime.datetime.strptime(to_time, TIME_FORMAT)
+    return df.filter(
+        pl.col("timeFrom").lt(to_time)
+        & (pl.col("timeTo").gt(from_time) | pl.col("timeFrom").ge(from_time))
+    )
+
+
+@dataclass
+class ChunkResult:
+    """Outcome of fetching one chunk of a long range"""
+
+    args: tuple
+    status: Literal["ok", "empty", "failed"]
+    df: Optional[pl.DataFrame] = None
+    reason: Optional[str] = None
+    # failures that would fail again the same way (e.g. a 404) aren't re-queued
+    retryable: bool = True
+
+
+class HTTPStatusError(Exception):
+    """Raised when Elexon answers with an error status (other than 429)"""
+
+    def __init__(self, status: int, url: str):
+        self.status = status
+        self.url = url
+        super().__init__(f"HTTP {status} for {url}")
+
+    @property
+    def retryable(self) -> bool:
+        """Server errors may pass, client errors won't"""
+        return self.status >= 500
+
+
+class IncompleteFetchError(Exception):
+    """Raised when chunks of a range are still failing after being re-queued"""
+
+    def __init__(self, failed: list[ChunkResult], total: int):
+        self.failed = failed
+        chunks = ", ".join(
+            f"{r.args[-2]} - {r.args[-1]} ({r.reason})" for r in failed[:3]
+        )
+        more = f" and {len(failed) - 3} more" if len(failed) > 3 else ""
+        super().__init__(f"{len(failed)}/{total} chunks failed: {chunks}{more}")
+
+
+def failed_chunk(args: tuple, error: Optional[Exception]) -> ChunkResult:
+    """The failed chunk, from the exception its request raised (`None` if the
+    retries ran out)"""
+    if isinstance(error, HTTPStatusError):
+        return ChunkResult(
+            args, "failed", reason=f"HTTP {error.status}", retryable=error.retryable
+        )
+    if error is not None:
+        return ChunkResult(args, "failed", reason=repr(error))
+    return ChunkResult(args, "failed", reason="retries exhausted")
+
+
+async def fetch_chunks(
+    fetch: Callable[..., Awaitable[Optional[pl.DataFrame]]],
+    tasks: list[tuple],
+    from_time: str,
+    to_time: str,
+    max_concurrent: int = 10,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+    requeue_rounds: int = 2,
+    units: Sequence[str] = (),
+) -> Optional[pl.DataFrame]:
+    """
+    Fetches the chunks of a long range (`fetch(*args)` for the args in `tasks`)
+
+    The result is trimmed back to the requested range. Rows spanning a chunk
+    boundary are returned by both chunks, so exact duplicates are dropped.
+
+    A chunk fails if its request raises or gets no response (the retries of a rate
+    limited request ran out). Failed chunks are re-queued once the others are done,
+    up to `requeue_rounds` times, except for client errors (`HTTPStatusError` 4xx),
+    which wouldn't succeed either. If some still fail an `IncompleteFetchError` is
+    raised rather than returning the range with holes in it.
+
+    With a `checkpoint`, every chunk is persisted as soon as it completes (rather
+    than held in memory until they all have), and chunks completed by an earlier,
+    interrupted, run aren't requested again.
+
+    How many chunks ended up ok, empty or failed is added to the run report of each
+    of the `units` the chunks are for.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def fetch_chunk(args: tuple) -> ChunkResult:
+        rows = None if checkpoint is None else checkpoint.rows(args)
+        if rows is None:
+            try:
+                async with semaphore:
+                    df = await fetch(*args)
+            except Exception as e:
+                return failed_chunk(args, e)
+            if df is None:
+                return failed_chunk(args, None)
+            rows = df.shape[0]
+            if checkpoint is not None:
+                checkpoint.save(args, df)
+                df = None
+        else:
+            df = None
+        return ChunkResult(args, "ok" if rows else "empty", df)
+
+    results = await asyncio.gather(*[fetch_chunk(args) for args in tasks])
+    for _ in range(requeue_rounds):
+        failed = [
+            i
+            for i, result in enumerate(results)
+            if result.status == "failed" and result.retryable
+        ]
+        if not failed:
+            break
+        retried = await asyncio.gather(*[fetch_chunk(tasks[i]) for i in failed])
+        for i, result in zip(failed, retried):
+            results[i] = result
+
+    counts = Counter(result.status for result in results)
+    for unit in units:
+        RUN_REPORT.chunks(
+            unit, {status: counts[status] for status in ["ok", "empty", "failed"]}
+        )
+
+    failed = [result for result in results if result.status == "failed"]
+    if failed:
+        raise IncompleteFetchError(failed, len(tasks))
+
+    frames = [r.df.lazy() for r in results if r.df is not None and r.status == "ok"]
+    if checkpoint is not None:
+        frames += checkpoint.scan(tasks)
+    if not frames:
+        return None
+    # the chunks are decoded with the same schema, so they're concatenated
+    # without casting or copying
+    df = trim_to_range(pl.concat(frames, rechunk=False).collect(), from_time, to_time)
+    if df.is_empty():
+        return None
+    return df.unique(maintain_order=True).sort(by="timeFrom")
 
 
 def long_date_range_handler(
     func: Callable,
     max_concurrent: int = 10,
-    timeout_seconds: int = 30,
 ):
-    """Wraps request functions and ensures that the max date-range error is worked around"""
-
-    async def wrapper(bm_unit: str, from_time: str, to_time: str):
-        start_dt = datetime.datetime.strptime(from_time, "%Y-%m-%dT%H:%M:%SZ")
-        end_dt = datetime.datetime.strptime(to_time, "%Y-%m-%dT%H:%M:%SZ")
-
-        if end_dt - start_dt > datetime.timedelta(days=6):
-            dfs = []
-            tasks = []
-            current_start = start_dt
-
-            while current_start < end_dt:
-                current_end = min(current_start + datetime.timedelta(days=7), end_dt)
-                current_start_str = current_start.strftime("%Y-%m-%dT%H:%M:%SZ")
-                current_end_str = current_end.strftime("%Y-%m-%dT%H:%M:%SZ")
-                tasks.append((bm_unit, current_start_str, current_end_str))
-                current_start = current_end
-
-            semaphore = asyncio.Semaphore(max_concurrent)
-            timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-
-            async def bounded_fetch(
-                session: aiohttp.ClientSession, *args
-            ) -> Optional[pl.DataFrame]:
-                async with semaphore:
-                    return await func(session, *args)
+    """
+    Wraps request functions and ensures that the max date-range error is worked around
 
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                dfs = await asyncio.gather(
-                    *[bounded_fetch(session, *args) for args in tasks],
-                    return_exceptions=True,
-                )
+    The range is requested in chunks aligned to a fixed grid (see `aligned_chunks`),
+    by `fetch_chunks`, optionally with a `checkpoint` of the completed chunks.
+    """
 
-            dfs = [d for d in dfs if d is not None and d.shape[0] > 0]
-            if dfs and pl.concat(dfs).shape[0] > 0:
-                return pl.concat(dfs).sort(by="timeFrom")
-            return None
-        else:
-            timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                return await func(session, bm_unit, from_time, to_time)
+    async def wrapper(
+        client: ElexonClient,
+        bm_unit: str,
+        from_time: str,
+        to_time: str,
+        checkpoint: Optional[ChunkCheckpoint] = None,
+    ):
+        start_dt = datetime.datetime.strptime(from_time, TIME_FORMAT)
+        end_dt = datetime.datetime.strptime(to_time, TIME_FORMAT)
+
+        tasks = [
+            (
+                bm_unit,
+                chunk_start.strftime(TIME_FORMAT),
+                chunk_end.strftime(TIME_FORMAT),
+            )
+            for chunk_start, chunk_end in aligned_chunks(start_dt, end_dt)
+        ]
+        return await fetch_chunks(
+            partial(func, client),
+            tasks,
+            from_time,
+            to_time,
+            max_concurrent,
+            checkpoint,
+            units=[bm_unit],
+        )
 
     return wrapper
 
 
+def decode_response(
+    body: bytes, schema: Optional[dict[str, pl.DataType]] = None
+) -> pl.DataFrame:
+    """
+    Decodes the `data` records of a response body straight into a dataframe
+
+    With a `schema`, the JSON is parsed by pyarrow directly into Arrow arrays of the
+    records' types, instead of going through Python dicts and inferring the types
+    (which materialises every record as Python objects first). Bodies that are a
+    bare list of records (e.g. the stream endpoints) are decoded too.
+
+    Without a schema, polars infers the types (pyarrow would turn the settlement
+    dates into timestamps).
+    """
+    if body.lstrip()[:1] == b"[":
+        body = b'{"data": ' + body + b"}"
+
+    if schema is None:
+        df = pl.read_json(io.BytesIO(body))
+        # there's nothing to infer the records' type from if there are none
+        if "data" not in df.columns or df.schema["data"] != pl.List(pl.Struct):
+            return pl.DataFrame()
+        return df["data"][0].struct.unnest()
+
+    records = pl.DataFrame(schema=schema).to_arrow(compat_level=pl.CompatLevel.oldest())
+    table = pj.read_json(
+        io.BytesIO(body),
+        # the whole body is a single JSON object, so it has to fit in one block
+        read_options=pj.ReadOptions(block_size=len(body) + 1, use_threads=False),
+        parse_options=pj.ParseOptions(
+            explicit_schema=pa.schema([("data", pa.list_(pa.struct(records.schema)))]),
+            unexpected_field_behavior="ignore",
+        ),
+    )
+    if "data" not in table.column_names:
+        return pl.DataFrame(schema=schema)
+    data = table.column("data").combine_chunks().flatten()
+    return pl.from_arrow(pa.Table.from_struct_array(data))
+
+
 async def _elexon_get_request_async(
-    session: aiohttp.ClientSession,
+    client: ElexonClient,
     url: str,
+    schema: Optional[dict[str, pl.DataType]] = None,
     max_retries: int = 7,
 ) -> Optional[pl.DataFrame]:
     """Async version of _elexon_get_request for use with aiohttp.
 
-    Includes retry logic with exponential backoff for rate limiting (429).
+    Every request goes through the client's (process-wide) rate limiter, and its
+    adaptive limit on the requests in flight, which is fed the latencies. On
+    rate limiting (429) the request is retried, waiting for as long as the
+    `Retry-After` header asks for (which pauses every other request too), or with
+    jittered exponential backoff if there's no such header.
+    See: https://bmrs.elexon.co.uk/api-documentation/guidance
+
+    If the client has a response cache, fresh cached responses are returned
+    without making a request, and successful responses are stored in it.
+
+    The body is decoded with `decode_response`, using the endpoint's `schema`. Any
+    other error status raises an `HTTPStatusError`, and `None` is returned once
+    the retries run out.
     """
-    delays = [
-        50,
-        10,
-        20,
-        30,
-        30,
-        30,
-        30,
-    ]  # https://bmrs.elexon.co.uk/api-documentation/guidance
+    path = endpoint(url, client.base_url)
+    if client.cache is not None:
+        cached = client.cache.get(url)
+        if cached is not None:
+            METRICS.inc("elexon_cache_hits_total", endpoint=path)
+            return cached
+
     for attempt in range(max_retries):
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                if attempt > 0:
-                    print(f"---- {datetime.datetime.now()} " + "-" * 30)
-                return pl.DataFrame(data.get("data"))
-            elif response.status == 429:
-                delay = delays[attempt]
-                print(
-                    f"Rate limited (429), retrying in {delay:.1f}s (attempt"
-                    f" {attempt + 1}/{max_retries})"
-                )
-                await asyncio.sleep(delay)
-            else:
-                print(f"Error: {response.status}")
-                return None
+        delay = None
+        async with client.in_flight:
+            await client.rate_limiter.acquire()
+            started = time.monotonic()
+            METRICS.inc("elexon_requests_in_flight")
+            # recorded once, when the headers arrive or the request fails before
+            recorded = False
+            try:
+                async with client.session.get(url) as response:
+                    # the time to the response headers, excluding the body
+                    latency = time.monotonic() - started
+                    await client.in_flight.record(latency, response.status == 429)
+                    recorded = True
+                    METRICS.observe(
+                        "elexon_request_duration_seconds", latency, endpoint=path
+                    )
+                    METRICS.inc(
+                        "elexon_responses_total",
+                        endpoint=path,
+                        status=str(response.status),
+                    )
+                    if response.status == 200:
+                        body = await response.read()
+                        client.rate_limiter.stats.downloaded += len(body)
+                        if attempt > 0:
+                            print(f"---- {datetime.datetime.now()} " + "-" * 30)
+                        # slowing down before we run out of the allowance
+                        wait = retry_after_seconds(response.headers)
+                        if wait:
+                            client.rate_limiter.pause(wait)
+                        df = decode_response(body, schema)
+                        if client.cache is not None:
+                            client.cache.put(url, df)
+                        return df
+                    elif response.status == 429:
+                        # with a Retry-After, the rate limiter holds every request
+                        retry_after = retry_after_seconds(response.headers)
+                        client.rate_limiter.throttled(retry_after)
+                        if retry_after is None:
+                            delay = backoff_delay(attempt)
+                        wait = retry_after if delay is None else delay
+                        METRICS.inc("elexon_throttled_total", endpoint=path)
+                        METRICS.inc(
+                            "elexon_retry_wait_seconds_total", wait, endpoint=path
+                        )
+                        print(
+                            f"Rate limited (429), retrying in {wait:.1f}s (attempt"
+                            f" {attempt + 1}/{max_retries})"
+                        )
+                    else:
+                        raise HTTPStatusError(response.status, url)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # timeouts and dropped connections are a sign of overload too
+                if not recorded:
+                    await client.in_flight.record(time.monotonic() - started, True)
+                METRICS.inc("elexon_request_errors_total", endpoint=path)
+                raise
+            finally:
+                METRICS.inc("elexon_requests_in_flight", -1)
+        # backing off without holding on to the request slot
+        if delay is not None:
+            await client.rate_limiter.backoff(delay)
     print(f"Max retries exceeded for {url}")
     return None
 
 
 async def get_indicative_imbalance_settlement(
-    session: aiohttp.ClientSession, settlementDate: str, settlementPeriod: int
+    client: ElexonClient, settlementDate: str, settlementPeriod: int
 ):
     """Gets the indicative imbalance settlement for a particular settlementPeriod."""
     url = (
-        f"https://data.elexon.co.uk/bmrs/api/v1/balancing/settlement/system-prices"
+        f"{client.base_url}/balancing/settlement/system-prices"
         f"/{settlementDate}/{settlementPeriod}"
     )
-    return await _elexon_get_request_async(session, url)
+    return await _elexon_get_request_async(client, url, schemas.SYSTEM_PRICES)
 
 
 async def get_indicative_cashflow(
-    session: aiohttp.ClientSession,
+    client: ElexonClient,
     time: str,
     bm_unit: str,
     cashflow_type: Literal["bid", "offer"],
 ) -> Optional[pl.DataFrame]:
     """Async version of get_indicative_cashflow for use with aiohttp."""
     url = (
-        f"https://data.elexon.co.uk/bmrs/api/v1/balancing/settlement/indicative/cashflows/all"
+        f"{client.base_url}/balancing/settlement/indicative/cashflows/all"
         f"/{cashflow_type}/{time}?bmUnit={bm_unit}&format=json"
     )
-    return await _elexon_get_request_async(session, url)
+    return await _elexon_get_request_async(client, url, schemas.INDICATIVE_CASHFLOW)
 
 
 @long_date_range_handler
 async def get_physical(
-    session: aiohttp.ClientSession, bm_unit: str, from_time: str, to_time: str
+    client: ElexonClient, bm_unit: str, from_time: str, to_time: str
 ):
     """Gets the physical notification data per BM unit"""
     url = (
-        f"https://data.elexon.co.uk/bmrs/api/v1/balancing/physical?"
+        f"{client.base_url}/balancing/physical?"
         f"bmUnit={bm_unit}&from={from_time}&to={to_time}&dataset=PN"
     )
-    return await _elexon_get_request_async(session, url)
+    return await _elexon_get_request_async(client, url, schemas.PHYSICAL)
 
 
 @long_date_range_handler
 async def get_acceptances(
-    session: aiohttp.ClientSession, bm_unit: str, from_time: str, to_time: str
+    client: ElexonClient, bm_unit: str, from_time: str, to_time: str
 ):
     """Gets the bid-offer acceptances per BM unit"""
     url = (
-        f"https://data.elexon.co.uk/bmrs/api/v1/balancing/acceptances?"
+        f"{client.base_url}/balancing/acceptances?"
         f"bmUnit={bm_unit}&from={from_time}&to={to_time}&format=json"
     )
-    return await _elexon_get_request_async(session, url)
+    return await _elexon_get_request_async(client, url, schemas.ACCEPTANCES)
 
 
 @long_date_range_handler
 async def get_bid_offer(
-    session: aiohttp.ClientSession, bm_unit: str, from_time: str, to_time: str
+    client: ElexonClient, bm_unit: str, from_time: str, to_time: str
 ):
     """Gets the bid-offer pairs per BM unit"""
     url = (
-        f"https://data.elexon.co.uk/bmrs/api/v1/balancing/bid-offer?"
+        f"{client.base_url}/balancing/bid-offer?"
         f"bmUnit={bm_unit}&from={from_time}&to={to_time}"
     )
-    return await _elexon_get_request_async(session, url)
+    return await _elexon_get_request_async(client, url, schemas.BID_OFFER)
+
+
+# dataset stream endpoints (and their record schema) of the per-unit datasets
+STREAM_ENDPOINTS = {
+    "physical": ("PN", schemas.PHYSICAL),
+    "acceptance": ("BOALF", schemas.ACCEPTANCES),
+    "bid_offer": ("BOD", schemas.BID_OFFER),
+}
+
+PER_UNIT_GETTERS = {
+    "physical": get_physical,
+    "acceptance": get_acceptances,
+    "bid_offer": get_bid_offer,
+}
+
+
+async def get_dataset_stream(
+    client: ElexonClient,
+    dataset: str,
+    bm_units: list[str],
+    from_time: str,
+    to_time: str,
+) -> Optional[pl.DataFrame]:
+    """Gets the dataset for several BM units at once, from its stream endpoint"""
+    code, schema = STREAM_ENDPOINTS[dataset]
+    units = "".join(f"&bmUnit={unit}" for unit in bm_units)
+    url = (
+        f"{client.base_url}/datasets/{code}/stream?from={from_time}&to={to_time}{units}"
+    )
+    return await _elexon_get_request_async(client, url, schema)
+
+
+async def get_units_bulk(
+    client: ElexonClient,
+    dataset: str,
+    bm_units: list[str],
+    from_time: str,
+    to_time: str,
+    max_concurrent: int = 10,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+) -> dict[str, pl.DataFrame]:
+    """
+    Gets the dataset for many BM units, and splits it by unit
+
+    The units are requested `BULK_UNITS_PER_REQUEST` at a time, per day (on the
+    same grid as `aligned_chunks`, so the cached days are shared between runs).
+    Units without data are left out.
+    """
+    start_dt = datetime.datetime.strptime(from_time, TIME_FORMAT)
+    end_dt = datetime.datetime.strptime(to_time, TIME_FORMAT)
+    tasks = [
+        (
+            bm_units[i : i + BULK_UNITS_PER_REQUEST],
+            chunk_start.strftime(TIME_FORMAT),
+            chunk_end.strftime(TIME_FORMAT),
+        )
+        for i in range(0, len(bm_units), BULK_UNITS_PER_REQUEST)
+        for chunk_start, chunk_end in aligned_chunks(
+            start_dt, end_dt, BULK_CHUNK_LENGTH
+        )
+    ]
+
+    df = await fetch_chunks(
+        partial(get_dataset_stream, client, dataset),
+        tasks,
+        from_time,
+        to_time,
+        max_concurrent,
+        checkpoint,
+        units=bm_units,
+    )
+    if df is None:
+        return {}
+    return {
+        unit: unit_df
+        for (unit,), unit_df in df.filter(pl.col("bmUnit").is_in(bm_units))
+        .partition_by("bmUnit", as_dict=True)
+        .items()
+    }
+
+
+async def get_units(
+    client: ElexonClient,
+    dataset: str,
+    bm_units: list[str],
+    from_time: str,
+    to_time: str,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+) -> dict[str, pl.DataFrame]:
+    """
+    Gets the dataset for a batch of units (see `unit_batches`), split by unit
+
+    Batches of a single unit use the per-unit endpoint, larger ones the stream
+    endpoint.
+    """
+    if len(bm_units) > 1:
+        return await get_units_bulk(
+            client, dataset, bm_units, from_time, to_time, checkpoint=checkpoint
+        )
+    [unit] = bm_units
+    df = await PER_UNIT_GETTERS[dataset](client, unit, from_time, to_time, checkpoint)
+    return {} if df is None else {unit: df}
+
+
+def unit_batches(
+    units: list[str],
+    from_time: str,
+    to_time: str,
+    mode: Literal["auto", "bulk", "per_unit"] = "auto",
+) -> list[list[str]]:
+    """
+    Splits the units into the batches fetched together
+
+    Per unit, every unit is a batch of its own and is requested per week. In bulk,
+    up to `BULK_UNITS_PER_REQUEST` units are requested at a time, but per day, and
+    fewer over long windows, so a batch spans at most `BULK_MAX_UNIT_DAYS` (a batch
+    of one unit uses the per-unit endpoint). With `mode="auto"` the one making
+    fewer requests is used: bulk for many units over a short window (e.g.
+    incremental runs), per unit for a few units or a long one.
+    """
+    start_dt = datetime.datetime.strptime(from_time, TIME_FORMAT)
+    end_dt = datetime.datetime.strptime(to_time, TIME_FORMAT)
+    days = len(aligned_chunks(start_dt, end_dt, BULK_CHUNK_LENGTH))
+    batch_size = max(1, min(BULK_UNITS_PER_REQUEST, BULK_MAX_UNIT_DAYS // max(days, 1)))
+    if mode == "auto":
+        per_unit_requests = len(units) * len(aligned_chunks(start_dt, end_dt))
+        bulk_requests = -(-len(units) // batch_size) * days
+        mode = "bulk" if bulk_requests < per_unit_requests else "per_unit"
+
+    if mode == "bulk":
+        return [units[i : i + batch_size] for i in range(0, len(units), batch_size)]
+    return [[unit] for unit in units]
 
 
 async def fetch_indicative_cashflows_batch(
+    client: ElexonClient,
     tasks: list[tuple[str, str, str]],
     max_concurrent: int = 10,
-    timeout_seconds: int = 30,
 ) -> list[pl.DataFrame | Exception]:
     """Fetch multiple indicative cashflows concurrently with rate limiting.
 
     Args:
+        client: Client owning the shared session.
         tasks: List of (time, bm_unit, flow_type) tuples to fetch.
         max_concurrent: Maximum number of concurrent requests.
-        timeout_seconds: Timeout for each request in seconds.
 
     Returns:
         List of DataFrames or Exceptions for failed requests.
     """
     semaphore = asyncio.Semaphore(max_concurrent)
-    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
 
     async def bounded_fetch(
-        session: aiohttp.ClientSession,
         time: str,
         bm_unit: str,
         cashflow_type: Literal["bid", "offer"],
     ) -> Optional[pl.DataFrame]:
         async with semaphore:
-            return await get_indicative_cashflow(session, time, bm_unit, cashflow_type)
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        results = await asyncio.gather(
-            *[
-                bounded_fetch(session, time, bm_unit, cashflow_type)
-                for time, bm_unit, cashflow_type in tasks
-            ],
-            return_exceptions=True,
-        )
+            return await get_indicative_cashflow(client, time, bm_unit, cashflow_type)
+
+    results = await asyncio.gather(
+        *[
+            bounded_fetch(time, bm_unit, cashflow_type)
+            for time, bm_unit, cashflow_type in tasks
+        ],
+        return_exceptions=True,
+    )
 
     return results
 
 
 async def fetch_unit_cashflows(
-    unit: str, from_time: str, to_time: str, cashflow_type: Literal["bid", "offer"]
+    client: ElexonClient,
+    unit: str,
+    from_time: str,
+    to_time: str,
+    cashflow_type: Literal["bid", "offer"],
+    requeue_rounds: int = 2,
 ) -> list[pl.DataFrame]:
-    """Fetch all cashflow data for a single unit using async requests."""
-    tasks = [
-        (str(_d).split(" ")[0], unit, cashflow_type)
-        for _d in pd.date_range(from_time, to_time)
-    ]
-    results = await fetch_indicative_cashflows_batch(tasks, max_concurrent=20)
+    """
+    Fetches all the cashflow data of a unit, a request per settlement date
 
-    dfs = []
-    for result in results:
-        if isinstance(result, Exception):
-            print(f"Request failed: {result}")
-            continue
-        if result is not None and not result.is_empty():
-            dfs.append(
-                result.select(
-                    "settlementDate", "settlementPeriod", "bmUnit", "totalCashflow"
-                )
+    As in `fetch_chunks`, the days that failed are re-queued (unless they got a
+    client error), and if some still fail an `IncompleteFetchError` is raised
+    rather than returning the cashflows with holes in them.
+    """
+    dates = [_d.date() for _d in pd.date_range(from_time, to_time)]
+    tasks = [(str(date), unit, cashflow_type) for date in dates]
+    results = await fetch_indicative_cashflows_batch(client, tasks, max_concurrent=20)
+
+    def failures() -> dict[int, ChunkResult]:
+        """The failed days, by index, as chunks of a day"""
+        return {
+            i: failed_chunk(
+                (unit, str(date), str(date + datetime.timedelta(days=1))), result
             )
-    return dfs
+            for i, (date, result) in enumerate(zip(dates, results))
+            if not isinstance(result, pl.DataFrame)
+        }
+
+    for _ in range(requeue_rounds):
+        failed = [i for i, chunk in failures().items() if chunk.retryable]
+        if not failed:
+            break
+        retried = await fetch_indicative_cashflows_batch(
+            client, [tasks[i] for i in failed], max_concurrent=20
+        )
+        for i, result in zip(failed, retried):
+            results[i] = result
+
+    failed = list(failures().values())
+    dfs = [result for result in results if isinstance(result, pl.DataFrame)]
+    RUN_REPORT.chunks(
+        unit,
+        {
+            "ok": sum(not df.is_empty() for df in dfs),
+            "empty": sum(df.is_empty() for df in dfs),
+            "failed": len(failed),
+        },
+    )
+    if failed:
+        raise IncompleteFetchError(failed, len(tasks))
+
+    return [
+        df.select("settlementDate", "settlementPeriod", "bmUnit", "totalCashflow")
+        for df in dfs
+        if not df.is_empty()
+    ]
 
 
 async def _fetch_imbalance_settlement_batch(
+    client: ElexonClient,
     tasks: list[tuple[str, str]],
     max_concurrent: int = 10,
-    timeout_seconds: int = 30,
 ) -> list[pl.DataFrame | Exception]:
     semaphore = asyncio.Semaphore(max_concurrent)
-    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
 
     async def bounded_fetch(
-        session: aiohttp.ClientSession, settlementDate: str, settlementPeriod: str
+        settlementDate: str, settlementPeriod: str
     ) -> Optional[pl.DataFrame]:
         async with semaphore:
             return await get_indicative_imbalance_settlement(
-                session, settlementDate, settlementPeriod
+                client, settlementDate, settlementPeriod
             )
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        results = await asyncio.gather(
-            *[
-                bounded_fetch(session, settlementDate, settlementPeriod)
-                for settlementDate, settlementPeriod in tasks
-            ],
-            return_exceptions=True,
-        )
+    results = await asyncio.gather(
+        *[
+            bounded_fetch(settlementDate, settlementPeriod)
+            for settlementDate, settlementPeriod in tasks
+        ],
+        return_exceptions=True,
+    )
 
     return results
 
 
+async def get_system_prices_for_date(
+    client: ElexonClient, settlementDate: str
+) -> Optional[pl.DataFrame]:
+    """Gets the system prices of every settlement period of the settlement date"""
+    url = f"{client.base_url}/balancing/settlement/system-prices/{settlementDate}"
+    return await _elexon_get_request_async(client, url, schemas.SYSTEM_PRICES)
+
+
+def _settlement_day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(), LONDON).astimezone(
+        datetime.UTC
+    )
+
+
+def settlement_periods(settlementDate: str) -> int:
+    """Number of settlement periods in the day, 46 and 50 on the clock changes"""
+    day = datetime.date.fromisoformat(settlementDate)
+    start, end = (
+        _settlement_day_start(d) for d in [day, day + datetime.timedelta(days=1)]
+    )
+    return (end - start) // datetime.timedelta(minutes=30)
+
+
+def settlement_period_end(
+    settlementDate: str, settlementPeriod: int
+) -> datetime.datetime:
+    """When the settlement period ends, in UTC"""
+    start = _settlement_day_start(datetime.date.fromisoformat(settlementDate))
+    return start + settlementPeriod * datetime.timedelta(minutes=30)
+
+
 async def fetch_imbalance_settlement(
-    from_time: str, to_time: str
-) -> list[pl.DataFrame]:
-    """Fetch all cashflow data for a single unit using async requests."""
-    tasks = [
-        (str(_d).split(" ")[0], i)
-        for _d in pd.date_range(from_time, to_time)
-        for i in range(1, 49)
-    ]
-    results = await _fetch_imbalance_settlement_batch(tasks, max_concurrent=20)
+    client: ElexonClient, from_time: str, to_time: str, max_concurrent: int = 20
+) -> pl.DataFrame:
+    """
+    Fetches the system prices of every settlement period in the date range
+
+    The prices are requested per settlement date, and only the periods missing from
+    a date's response (e.g. the request failed) are requested one by one, if they
+    have ended.
+    """
+    dates = [str(_d).split(" ")[0] for _d in pd.date_range(from_time, to_time)]
+
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def bounded_fetch(settlementDate: str) -> Optional[pl.DataFrame]:
+        async with semaphore:
+            return await get_system_prices_for_date(client, settlementDate)
+
+    results = await asyncio.gather(
+        *[bounded_fetch(settlementDate) for settlementDate in dates],
+        return_exceptions=True,
+    )
 
+    now = datetime.datetime.now(datetime.UTC)
     dfs = []
+    missing = []
+    for settlementDate, result in zip(dates, results):
+        if isinstance(result, Exception):
+            print(f"Request failed: {result}")
+            result = None
+        found = set()
+        if result is not None and not result.is_empty():
+            dfs.append(result)
+            found = set(result["settlementPeriod"])
+        missing += [
+            (settlementDate, i)
+            for i in range(1, settlement_periods(settlementDate) + 1)
+            if i not in found and settlement_period_end(settlementDate, i) <= now
+        ]
+
+    results = await _fetch_imbalance_settlement_batch(
+        client, missing, max_concurrent=max_concurrent
+    )
     for result in results:
         if isinstance(result, Exception):
             print(f"Request failed: {result}")
             continue
         if result is not None and not result.is_empty():
-            dfs.append(
-                result.select(
-                    "settlementDate",
-                    "settlementPeriod",
-                    "systemSellPrice",
-                    "systemBuyPrice",
-                    "netImbalanceVolume",
-                    "totalAcceptedOfferVolume",
-                    "totalAcceptedBidVolume",
-                    "totalAdjustmentSellVolume",
-                    "totalAdjustmentBuyVolume",
-                )
+            dfs.append(result)
+
+    columns = [
+        "settlementDate",
+        "settlementPeriod",
+        "systemSellPrice",
+        "systemBuyPrice",
+        "netImbalanceVolume",
+        "totalAcceptedOfferVolume",
+        "totalAcceptedBidVolume",
+        "totalAdjustmentSellVolume",
+        "totalAdjustmentBuyVolume",
+    ]
+    if not dfs:
+        return pl.DataFrame(schema={c: schemas.SYSTEM_PRICES[c] for c in columns})
+    return (
+        pl.concat(dfs, rechunk=False)
+        .select(columns)
+        .unique(["settlementDate", "settlementPeriod"], maintain_order=True)
+        .sort("settlementDate", "settlementPeriod")
+    )
+
+
+async def run_unit_queue(
+    units: list[T],
+    worker: Callable[[T], Awaitable[None]],
+    max_concurrent_units: int,
+    description: str,
+    progress: Optional[Progress] = None,
+) -> dict[str, str]:
+    """
+    Runs `worker` for every unit (or batch of units, see `unit_batches`), with at
+    most `max_concurrent_units` at a time
+
+    Units are taken from a shared queue by a fixed number of workers, so each
+    unit's output can be written as soon as its own fetches complete. The progress
+    is shown as a task of `progress` if given, e.g. next to the stage's other tasks.
+
+    A unit (or batch) failing doesn't stop the others: the failures are returned
+    with their tracebacks, per unit.
+    """
+    if progress is None:
+        with Progress() as progress:
+            return await run_unit_queue(
+                units, worker, max_concurrent_units, description, progress
             )
-    return pl.concat(dfs)
+
+    queue: asyncio.Queue[T] = asyncio.Queue()
+    for unit in units:
+        queue.put_nowait(unit)
+
+    task = progress.add_task(description, total=len(units))
+    failures: dict[str, str] = {}
+
+    # the description without the trailing colon, as the metrics' label
+    label = description.rstrip(": ")
+    METRICS.set("elexon_queue_depth", queue.qsize(), task=label)
+
+    async def consume():
+        while not queue.empty():
+            item = queue.get_nowait()
+            METRICS.set("elexon_queue_depth", queue.qsize(), task=label)
+            batch = item if isinstance(item, list) else [item]
+            started = time.perf_counter()
+            try:
+                await worker(item)
+            except Exception:
+                error = traceback.format_exc()
+                for unit in batch:
+                    failures[unit] = error
+            else:
+                METRICS.inc("elexon_units_completed_total", len(batch), task=label)
+            # a batch's time is every unit's in it
+            for unit in batch:
+                RUN_REPORT.unit(
+                    unit, "fetch", time.perf_counter() - started, batch_size=len(batch)
+                )
+            progress.advance(task)
+
+    await asyncio.gather(*[consume() for _ in range(max_concurrent_units)])
+    return failures
@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+
+@dataclass
+class RateLimiterStats:
+    """
+    Counters of the rate limiter, `wait_time` is summed over concurrent requests,
+    and `downloaded` counts the bytes of the successful responses
+    """
+
+    requests: int = 0
+    throttles: int = 0
+    wait_time: float = 0.0
+    downloaded: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests, {self.throttles} throttled, "
+            f"{self.wait_time:.1f}s spent waiting, {self.downloaded / 1e6:.1f} MB"
+        )
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate of the whole process
+
+    Tokens refill at `rate` per second up to `capacity`, and each request takes
+    one. Acquiring reserves a token straight away (the count may go negative), and
+    sleeps until the reservation is due, so no lock is held across awaits and the
+    same bucket can be shared by every request path and event loop in the process.
+
+    When Elexon throttles us, `pause` blocks every request until the given time,
+    instead of each request backing off on its own schedule.
+    """
+
+    def __init__(self, rate: float = 10, capacity: int = 20):
+        self.rate = rate
+        self.capacity = capacity
+        self.stats = RateLimiterStats()
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def configure(self, rate: float, capacity: int) -> None:
+        """Changes the rate and capacity, e.g. from the run config"""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = min(self._tokens, float(capacity))
+
+    def _reserve(self) -> float:
+        """Takes a token and returns how long to wait until it can be used"""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        self._tokens -= 1
+        return max(-self._tokens / self.rate, self._blocked_until - now, 0.0)
+
+    async def acquire(self) -> None:
+        """Waits for a token (and for any pause to pass)"""
+        delay = self._reserve()
+        while delay > 0:
+            self.stats.wait_time += delay
+            await asyncio.sleep(delay)
+            # a pause might have been requested while we were sleeping
+            delay = max(self._blocked_until - time.monotonic(), 0.0)
+        self.stats.requests += 1
+
+    def pause(self, seconds: float) -> None:
+        """Blocks every request for `seconds`"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def throttled(self, retry_after: Optional[float]) -> None:
+        """Records a 429, pausing every request if the server told us how long for"""
+        self.stats.throttles += 1
+        if retry_after is not None:
+            self.pause(retry_after)
+
+    async def backoff(self, delay: float) -> None:
+        """Sleeps for a single request's backoff"""
+        self.stats.wait_time += delay
+        await asyncio.sleep(delay)
+
+
+RATE_LIMITER = TokenBucket()
+
+
+def backoff_delay(
+    attempt: int, base: float = 1.0, cap: float = 60.0, jitter: float = 0.5
+) -> float:
+    """Exponential backoff, with the last `jitter` fraction of it randomised"""
+    delay = min(cap, base * 2**attempt)
+    return delay * (1 - jitter) + random.uniform(0, delay * jitter)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Reads how long the server asks us to wait, if it tells us
+
+    Looks at `Retry-After` (seconds or an HTTP date), and if there are no
+    remaining requests in the current window, the rate limit reset header.
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                until = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return None
+            now = datetime.datetime.now(datetime.timezone.utc)
+            return max((until - now).total_seconds(), 0.0)
+
+    for prefix in ["RateLimit", "X-RateLimit"]:
+        remaining = headers.get(f"{prefix}-Remaining")
+        reset = headers.get(f"{prefix}-Reset")
+        if remaining is not None and reset is not None:
+            try:
+                if float(remaining) > 0:
+                    return None
+                reset_seconds = float(reset)
+            except ValueError:
+                return None
+            # some APIs send the reset as a unix timestamp rather than a delay
+            if reset_seconds > 1e9:
+                reset_seconds -= time.time()
+            return max(reset_seconds, 0.0)
+    return None
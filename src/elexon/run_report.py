@@ -0,0 +1,210 @@
+import datetime
+import json
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, TypeVar
+
+from src.elexon.rate_limit import RATE_LIMITER
+
+if TYPE_CHECKING:
+    # the store imports the query module, which reports to this one
+    from src.elexon.store import DataStore
+
+T = TypeVar("T")
+
+REPORT_FILE = "run_report.jsonl"
+
+
+def _max_rss_mb(who: int) -> float:
+    """High-water mark of the resident memory, in MB (ru_maxrss is in KB on Linux)"""
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss / (1e6 if sys.platform == "darwin" else 1e3)
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident memory of the process, in MB, if the platform has /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1e6
+    except OSError:
+        return None
+
+
+def _cpu_time() -> float:
+    """CPU time of the process and of its finished child processes"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def timed(func: Callable[..., T], *args) -> tuple[T, float, float]:
+    """
+    Calls `func(*args)`, returning the result with its wall and CPU time
+
+    Module level, so that it can be run in the worker processes, where the CPU
+    time of the process is the call's own.
+    """
+    started, cpu_started = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, time.perf_counter() - started, time.process_time() - cpu_started
+
+
+class RunReport:
+    """
+    Appends the figures of every stage of a run, and of every unit in it, to a
+    JSON-lines file
+
+    Each stage gets a line with its wall and CPU time (including the finished
+    worker processes), the peak memory of the process during the stage (and the
+    high-water mark of its worker processes), the Elexon requests made and the
+    bytes downloaded, and the rows it added to its datasets. It's followed by a line
+    per unit, with the rows added per dataset and the time spent in each phase of
+    the stage (e.g. fetching and computing), as recorded with `unit`, and how many
+    of its chunks were ok, empty or failed, as recorded with `chunks` (which the
+    stage line sums up).
+
+    Until `open` is called (e.g. when a stage is run on its own), nothing is
+    recorded.
+    """
+
+    def __init__(self, sample_interval: float = 0.05):
+        self.sample_interval = sample_interval
+        self.path: Optional[Path] = None
+        self._units: Optional[dict[str, dict]] = None
+        self._lock = threading.Lock()
+
+    def open(self, path: str | Path) -> None:
+        self.path = Path(path)
+
+    def close(self) -> None:
+        self.path = None
+
+    def unit(
+        self,
+        unit: str,
+        phase: str,
+        wall_time: float,
+        cpu_time: Optional[float] = None,
+        **figures,
+    ) -> None:
+        """Adds the time the unit spent in a phase of the current stage"""
+        if self._units is None:
+            return
+        with self._lock:
+            entry = self._units[unit]
+            entry[f"{phase}_time"] = entry.get(f"{phase}_time", 0.0) + wall_time
+            if cpu_time is not None:
+                entry[f"{phase}_cpu_time"] = (
+                    entry.get(f"{phase}_cpu_time", 0.0) + cpu_time
+                )
+            entry.update(figures)
+
+    def chunks(self, unit: str, counts: dict[str, int]) -> None:
+        """Adds the chunks fetched for the unit, per status (ok, empty or failed)"""
+        if self._units is None:
+            return
+        with self._lock:
+            chunks = self._units[unit].setdefault("chunks", {})
+            for status, count in counts.items():
+                chunks[status] = chunks.get(status, 0) + count
+
+    @contextmanager
+    def stage(
+        self, name: str, store: "DataStore", datasets: list[str]
+    ) -> Iterator[None]:
+        """Reports the stage run in the block, and the rows it added to `datasets`"""
+        if self.path is None:
+            yield
+            return
+
+        rows_before = {dataset: store.row_counts(dataset) for dataset in datasets}
+        stats = RATE_LIMITER.stats
+        requests, throttles, downloaded = (
+            stats.requests,
+            stats.throttles,
+            stats.downloaded,
+        )
+        started_at = datetime.datetime.now(datetime.UTC)
+        started, cpu_started = time.perf_counter(), _cpu_time()
+        self._units = defaultdict(dict)
+
+        # sampling the memory, as ru_maxrss is the peak of the whole run so far (it's
+        # only used without /proc)
+        peak = _rss_mb()
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.wait(self.sample_interval):
+                peak = max(peak, _rss_mb())
+
+        sampler = None
+        if peak is not None:
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+        try:
+            yield
+        finally:
+            done.set()
+            if sampler is not None:
+                sampler.join()
+            units, self._units = self._units, None
+
+        rows = defaultdict(dict)
+        for dataset in datasets:
+            before = rows_before[dataset]
+            for unit, count in store.row_counts(dataset).items():
+                if count != before.get(unit, 0):
+                    rows[unit][dataset] = count - before.get(unit, 0)
+
+        lines = [
+            {
+                "type": "stage",
+                "stage": name,
+                "started": started_at.isoformat(timespec="seconds"),
+                "wall_time": round(time.perf_counter() - started, 3),
+                "cpu_time": round(_cpu_time() - cpu_started, 3),
+                "peak_rss_mb": round(
+                    _max_rss_mb(resource.RUSAGE_SELF) if peak is None else peak, 1
+                ),
+                "workers_max_rss_mb": round(_max_rss_mb(resource.RUSAGE_CHILDREN), 1),
+                "requests": stats.requests - requests,
+                "throttled": stats.throttles - throttles,
+                "bytes_downloaded": stats.downloaded - downloaded,
+                "rows": {
+                    dataset: sum(r.get(dataset, 0) for r in rows.values())
+                    for dataset in datasets
+                },
+                "units": len(units.keys() | rows.keys()),
+            }
+        ]
+        chunks = defaultdict(int)
+        for figures in units.values():
+            for status, count in figures.get("chunks", {}).items():
+                chunks[status] += count
+        if chunks:
+            lines[0]["chunks"] = dict(chunks)
+        for unit in sorted(units.keys() | rows.keys()):
+            figures = {
+                key: round(value, 3) if isinstance(value, float) else value
+                for key, value in units.get(unit, {}).items()
+            }
+            lines.append(
+                {
+                    "type": "unit",
+                    "stage": name,
+                    "unit": unit,
+                    "rows": rows.get(unit, {}),
+                    **figures,
+                }
+            )
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+
+
+RUN_REPORT = RunReport()
@@ -0,0 +1,110 @@
+import polars as pl
+
+# Schemas of the `data` records returned by the Elexon endpoints, so that responses
+# are decoded straight into these types, without inferring them. Fields missing
+# from a record are null, and fields not listed here are dropped.
+
+PHYSICAL = {
+    "dataset": pl.String,
+    "settlementDate": pl.String,
+    "settlementPeriod": pl.Int64,
+    "timeFrom": pl.Datetime("us"),
+    "timeTo": pl.Datetime("us"),
+    "levelFrom": pl.Float64,
+    "levelTo": pl.Float64,
+    "nationalGridBmUnit": pl.String,
+    "bmUnit": pl.String,
+}
+
+ACCEPTANCES = {
+    "settlementDate": pl.String,
+    "settlementPeriodFrom": pl.Int64,
+    "settlementPeriodTo": pl.Int64,
+    "timeFrom": pl.Datetime("us"),
+    "timeTo": pl.Datetime("us"),
+    "levelFrom": pl.Float64,
+    "levelTo": pl.Float64,
+    "nationalGridBmUnit": pl.String,
+    "bmUnit": pl.String,
+    "acceptanceNumber": pl.Int64,
+    "acceptanceTime": pl.Datetime("us"),
+    "deemedBoFlag": pl.Boolean,
+    "soFlag": pl.Boolean,
+    "storFlag": pl.Boolean,
+    "rrFlag": pl.Boolean,
+}
+
+BID_OFFER = {
+    "settlementDate": pl.String,
+    "settlementPeriod": pl.Int64,
+    "timeFrom": pl.Datetime("us"),
+    "timeTo": pl.Datetime("us"),
+    "levelFrom": pl.Float64,
+    "levelTo": pl.Float64,
+    "nationalGridBmUnit": pl.String,
+    "bmUnit": pl.String,
+    "bid": pl.Float64,
+    "offer": pl.Float64,
+    "pairId": pl.Int64,
+}
+
+INDICATIVE_CASHFLOW = {
+    "startTime": pl.Datetime("us"),
+    "settlementDate": pl.String,
+    "settlementPeriod": pl.Int64,
+    "bmUnit": pl.String,
+    "bmUnitType": pl.String,
+    "leadPartyName": pl.String,
+    "nationalGridBmUnitId": pl.String,
+    "totalCashflow": pl.Float64,
+}
+
+SYSTEM_PRICES = {
+    "settlementDate": pl.String,
+    "settlementPeriod": pl.Int64,
+    "startTime": pl.Datetime("us"),
+    "createdDateTime": pl.Datetime("us"),
+    "systemSellPrice": pl.Float64,
+    "systemBuyPrice": pl.Float64,
+    "bsadDefaulted": pl.Boolean,
+    "priceDerivationCode": pl.String,
+    "reserveScarcityPrice": pl.Float64,
+    "netImbalanceVolume": pl.Float64,
+    "sellPriceAdjustment": pl.Float64,
+    "buyPriceAdjustment": pl.Float64,
+    "replacementPrice": pl.Float64,
+    "replacementPriceReferenceVolume": pl.Float64,
+    "totalAcceptedOfferVolume": pl.Float64,
+    "totalAcceptedBidVolume": pl.Float64,
+    "totalAdjustmentSellVolume": pl.Float64,
+    "totalAdjustmentBuyVolume": pl.Float64,
+    "totalSystemTaggedAcceptedOfferVolume": pl.Float64,
+    "totalSystemTaggedAcceptedBidVolume": pl.Float64,
+    "totalSystemTaggedAdjustmentSellVolume": pl.Float64,
+    "totalSystemTaggedAdjustmentBuyVolume": pl.Float64,
+}
+
+# schemas of the stored datasets that are fetched from the API, by dataset name
+DATASETS = {
+    "physical": PHYSICAL,
+    "acceptance": ACCEPTANCES,
+    "bid_offer": BID_OFFER,
+    "indicative_cashflow/bid": INDICATIVE_CASHFLOW,
+    "indicative_cashflow/offer": INDICATIVE_CASHFLOW,
+    "system_prices": SYSTEM_PRICES,
+}
+
+
+def conform(df: pl.DataFrame, schema: dict[str, pl.DataType]) -> pl.DataFrame:
+    """
+    Casts the columns of `df` that are in `schema` to their schema type
+
+    For data that didn't go through the decoder, e.g. stored before the schemas
+    existed, so that every unit and month of a dataset has the same types. Columns
+    not in the schema are left as they are.
+    """
+    return df.with_columns(
+        pl.col(column).cast(dtype)
+        for column, dtype in schema.items()
+        if column in df.columns and df.schema[column] != dtype
+    )
@@ -0,0 +1,163 @@
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+from src.elexon.metrics import METRICS
+from src.elexon.query import TIME_FORMAT
+from src.elexon.schemas import DATASETS, conform
+
+# ISO timestamp columns returned by the API, stored as (naive UTC) Datetime
+TIME_COLUMNS = ["timeFrom", "timeTo", "acceptanceTime", "time"]
+
+# columns the month partition is taken from, in order of preference
+PARTITION_COLUMNS = ["timeFrom", "time", "settlementDate"]
+
+EMPTY_MARKER = "_EMPTY"
+# where units are written before being swapped in, outside of the datasets so that
+# scanning them never picks up a partial unit
+STAGING = "_staging"
+
+
+def with_datetimes(df: pl.DataFrame) -> pl.DataFrame:
+    """Parses the timestamp columns that are still strings (e.g. from the API)"""
+    return df.with_columns(
+        pl.col(c).str.strptime(format=TIME_FORMAT, dtype=pl.Datetime)
+        for c in TIME_COLUMNS
+        if df.schema.get(c) == pl.String
+    )
+
+
+def _month(df: pl.DataFrame) -> pl.Expr:
+    column = next(c for c in PARTITION_COLUMNS if c in df.columns)
+    if df.schema[column] == pl.String:
+        return pl.col(column).str.slice(0, 7)
+    return pl.col(column).dt.strftime("%Y-%m")
+
+
+class DataStore:
+    """
+    Parquet store of the per-unit datasets, partitioned by unit and month
+
+        {folder}/{dataset}/bmUnit={unit}/month={YYYY-MM}/data.parquet
+
+    Timestamps are stored as Datetime columns, the datasets fetched from the API
+    are cast to their schema (see `schemas.DATASETS`) so that every partition has
+    the same types, and the files are zstd compressed.
+    The layout is hive-style, so `scan` (or e.g. DuckDB) can prune units and months,
+    and read only the columns needed.
+
+    Units that were queried but had no data get an `_EMPTY` marker instead, so that
+    they're not queried again.
+
+    Datasets that aren't per unit (e.g. the system prices) are stored without the
+    unit level, by passing no `unit`.
+    """
+
+    def __init__(self, folder: str | Path):
+        self.folder = Path(folder)
+
+    def dataset_path(self, dataset: str) -> Path:
+        return self.folder / dataset
+
+    def unit_path(self, dataset: str, unit: Optional[str] = None) -> Path:
+        if unit is None:
+            return self.dataset_path(dataset)
+        return self.dataset_path(dataset) / f"bmUnit={unit}"
+
+    def staging_path(self, dataset: str, unit: Optional[str] = None) -> Path:
+        return (
+            self.folder
+            / STAGING
+            / self.unit_path(dataset, unit).relative_to(self.folder)
+        )
+
+    def _restore(self, dataset: str, unit: Optional[str]) -> None:
+        """Puts back the unit's previous data if a write crashed while swapping"""
+        unit_path = self.unit_path(dataset, unit)
+        if not unit_path.exists():
+            staging_path = self.staging_path(dataset, unit)
+            old_path = staging_path.with_name(staging_path.name + ".old")
+            if old_path.exists():
+                unit_path.parent.mkdir(parents=True, exist_ok=True)
+                old_path.rename(unit_path)
+
+    def exists(self, dataset: str, unit: Optional[str] = None) -> bool:
+        self._restore(dataset, unit)
+        return self.unit_path(dataset, unit).exists()
+
+    def units(self, dataset: str) -> list[str]:
+        """Units stored in the dataset, including the ones without data"""
+        return sorted(
+            p.name.removeprefix("bmUnit=")
+            for p in self.dataset_path(dataset).glob("bmUnit=*")
+            if p.is_dir() and not p.name.endswith(".tmp")
+        )
+
+    def read(self, dataset: str, unit: Optional[str] = None) -> Optional[pl.DataFrame]:
+        """Reads the unit's data, returns None if it's missing or empty"""
+        self._restore(dataset, unit)
+        files = sorted(self.unit_path(dataset, unit).glob("month=*/data.parquet"))
+        if not files:
+            return None
+        df = pl.read_parquet(files, hive_partitioning=False)
+        return conform(df, DATASETS.get(dataset, {}))
+
+    def write(
+        self, dataset: str, unit: Optional[str], df: Optional[pl.DataFrame]
+    ) -> None:
+        """
+        Replaces the unit's data, or marks it as empty if there's none
+
+        The partitions are written to a temporary folder outside of the dataset
+        first, and swapped in once complete: the previous data is moved aside, and
+        only deleted after the new data is in place (it's put back if a crash
+        happens in between), so a crash never leaves a half-written unit behind,
+        nor loses the stored one.
+        """
+        self._restore(dataset, unit)
+        unit_path = self.unit_path(dataset, unit)
+        staging_path = self.staging_path(dataset, unit)
+        tmp_path = staging_path.with_name(staging_path.name + ".tmp")
+        old_path = staging_path.with_name(staging_path.name + ".old")
+        # earlier versions staged the unit next to it, in the dataset
+        legacy_tmp_path = unit_path.with_name(unit_path.name + ".tmp")
+        for path in [tmp_path, old_path, legacy_tmp_path]:
+            if path.exists():
+                shutil.rmtree(path)
+        tmp_path.mkdir(parents=True)
+
+        if df is None or df.is_empty():
+            (tmp_path / EMPTY_MARKER).touch()
+        else:
+            df = conform(with_datetimes(df), DATASETS.get(dataset, {}))
+            partitions = df.with_columns(_month(df).alias("month")).partition_by(
+                "month", as_dict=True, include_key=False
+            )
+            for (month,), partition in partitions.items():
+                month_path = tmp_path / f"month={month}"
+                month_path.mkdir()
+                partition.write_parquet(month_path / "data.parquet", compression="zstd")
+
+        if unit_path.exists():
+            unit_path.rename(old_path)
+        unit_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.rename(unit_path)
+        if old_path.exists():
+            shutil.rmtree(old_path)
+        if df is not None:
+            METRICS.inc("elexon_rows_written_total", df.height, dataset=dataset)
+
+    def row_counts(self, dataset: str) -> dict[str, int]:
+        """Rows stored per unit of the dataset, from the Parquet metadata"""
+        if not any(self.dataset_path(dataset).glob("bmUnit=*/month=*/data.parquet")):
+            return {}
+        counts = self.scan(dataset).group_by("bmUnit").len().collect()
+        return dict(counts.iter_rows())
+
+    def scan(self, dataset: str) -> pl.LazyFrame:
+        """Lazily scans every unit of the dataset, with `bmUnit` and `month` columns"""
+        return pl.scan_parquet(
+            self.dataset_path(dataset) / "**/*.parquet", hive_partitioning=True
+        )
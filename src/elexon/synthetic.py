@@ -0,0 +1,347 @@
+import datetime
+
+import numpy as np
+import polars as pl
+
+from src.elexon import schemas
+from src.elexon.query import TIME_FORMAT
+
+# Seeded synthetic Elexon data at fleet scale, for the benchmarks and the fake server.
+# The frames have the types of the store (see `schemas`), so they can be passed
+# straight to the functions in utils.py.
+
+# (share of the fleet, mean capacity factor, volatility, lowest level as a share
+# of the capacity, acceptances per day)
+UNIT_TYPES = {
+    "wind": (0.6, 0.35, 0.08, 0.0, 3.0),
+    "thermal": (0.25, 0.6, 0.03, 0.0, 1.5),
+    "storage": (0.15, 0.0, 0.15, -1.0, 4.0),
+}
+
+
+def synthetic_units(n_units: int, seed: int = 0) -> dict[str, str]:
+    """Names and types of `n_units` BM units, in the fleet's proportions"""
+    rng = np.random.default_rng(seed)
+    shares = [share for share, *_ in UNIT_TYPES.values()]
+    types = rng.choice(list(UNIT_TYPES), size=n_units, p=shares)
+    return {f"T_SYN-{i}": str(unit_type) for i, unit_type in enumerate(types)}
+
+
+def _settlement_columns(column: str, period: str = "settlementPeriod") -> list[pl.Expr]:
+    return [
+        pl.col(column).dt.strftime("%Y-%m-%d").alias("settlementDate"),
+        (pl.col(column).dt.hour() * 2 + pl.col(column).dt.minute() // 30 + 1)
+        .cast(pl.Int64)
+        .alias(period),
+    ]
+
+
+def _parse(time: str) -> datetime.datetime:
+    return datetime.datetime.strptime(time, TIME_FORMAT)
+
+
+def synthetic_physical(
+    units: dict[str, str],
+    from_time: str,
+    to_time: str,
+    records_per_period: int = 1,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Physical notifications of the units, `records_per_period` segments per period
+
+    The level of each unit is a mean-reverting random walk around its type's
+    capacity factor, continuous from one segment to the next, between the type's
+    lowest level and the unit's capacity.
+    """
+    rng = np.random.default_rng(seed)
+    step = datetime.timedelta(minutes=30) / records_per_period
+    times = pl.datetime_range(
+        _parse(from_time), _parse(to_time), step, closed="left", eager=True
+    )
+    n = len(times)
+
+    # stepping every unit at once, as the levels are clipped at every step
+    params = np.array([UNIT_TYPES[unit_type][1:4] for unit_type in units.values()])
+    mean, volatility, lowest = params.T if len(params) else np.zeros((3, 0))
+    capacities = rng.integers(10, 500, len(units)).astype(float)
+    shocks = rng.normal(0, 1, (n + 1, len(units))) * volatility
+    factors = np.empty((n + 1, len(units)))
+    factors[0] = mean
+    for i in range(1, n + 1):
+        factors[i] = factors[i - 1] + 0.05 * (mean - factors[i - 1]) + shocks[i]
+        np.clip(factors[i], lowest, 1.0, out=factors[i])
+    levels = (factors * capacities).round(1)
+
+    frames = [
+        pl.DataFrame(
+            {
+                "timeFrom": times,
+                "timeTo": times + step,
+                "levelFrom": levels[:-1, i],
+                "levelTo": levels[1:, i],
+            }
+        ).with_columns(
+            pl.lit(unit).alias("bmUnit"), pl.lit(unit[2:]).alias("nationalGridBmUnit")
+        )
+        for i, unit in enumerate(units)
+    ]
+    return schemas.conform(
+        pl.concat(frames).with_columns(
+            *_settlement_columns("timeFrom"), pl.lit("PN").alias("dataset")
+        ),
+        schemas.PHYSICAL,
+    ).select(list(schemas.PHYSICAL))
+
+
+def synthetic_acceptances(
+    physical: pl.DataFrame,
+    units: dict[str, str],
+    seed: int = 0,
+    reissue_rate: float = 0.2,
+) -> pl.DataFrame:
+    """
+    Acceptances of the units, overlapping each other, on top of their PNs
+
+    Each acceptance ramps from the PN level to its target, holds it and ramps back
+    (three rows sharing the acceptance number). Acceptance numbers restart every
+    day, acceptances often start before the previous one ended, and a
+    `reissue_rate` share of them is re-issued later with the same number and a
+    different target, so the later ones have to win when they're resolved.
+    """
+    rng = np.random.default_rng(seed)
+    start = physical["timeFrom"].min()
+    minutes = int((physical["timeTo"].max() - start).total_seconds() // 60)
+    days = max(minutes / 1440, 1 / 48)
+    capacities = physical.group_by("bmUnit").agg(
+        pl.max_horizontal("levelFrom", "levelTo").max().alias("capacity")
+    )
+    capacities = dict(capacities.iter_rows())
+
+    frames = []
+    for unit, unit_type in units.items():
+        *_, lowest, per_day = UNIT_TYPES[unit_type]
+        capacity = max(capacities.get(unit, 0.0), 1.0)
+        n = rng.poisson(per_day * days)
+        if n == 0:
+            continue
+        begins = np.sort(rng.integers(0, max(minutes - 30, 1), n))
+        ramps = rng.integers(2, 10, n)
+        holds = rng.integers(5, 90, n)
+        targets = rng.uniform(lowest, 1.0, n) * capacity
+        # wind is mostly curtailed
+        if unit_type == "wind":
+            targets = targets * rng.uniform(0, 0.5, n)
+        # the times are issued ahead of the acceptances start
+        issued = begins - rng.integers(2, 15, n)
+
+        reissued = rng.random(n) < reissue_rate
+        r = np.flatnonzero(reissued)
+        begins = np.concatenate([begins, begins[r] + rng.integers(1, 20, len(r))])
+        ramps = np.concatenate([ramps, ramps[r]])
+        holds = np.concatenate([holds, holds[r]])
+        targets = np.concatenate([targets, rng.uniform(lowest, 1.0, len(r)) * capacity])
+        issued = np.concatenate([issued, begins[n:] - 1])
+        ids = np.concatenate([np.arange(n), r])
+
+        points = np.stack(
+            [begins, begins + ramps, begins + ramps + holds, begins + 2 * ramps + holds]
+        )
+        frames.append(
+            pl.DataFrame(
+                {
+                    "from": np.concatenate(points[:3]),
+                    "to": np.concatenate(points[1:]),
+                    "segment": np.repeat(np.arange(3), len(ids)),
+                    "id": np.tile(ids, 3),
+                    "target": np.tile(targets.round(1), 3),
+                    "issued": np.tile(issued, 3),
+                    "soFlag": np.tile(rng.random(len(ids)) < 0.3, 3),
+                }
+            ).with_columns(pl.lit(unit).alias("bmUnit"))
+        )
+    if not frames:
+        return pl.DataFrame(schema=schemas.ACCEPTANCES)
+
+    def at(column: str) -> pl.Expr:
+        return pl.lit(start) + pl.duration(minutes=pl.col(column))
+
+    df = pl.concat(frames).with_columns(
+        at("from").alias("timeFrom"), at("to").alias("timeTo")
+    )
+    # the ramps start and end at the PN level of the acceptance's start
+    df = (
+        df.sort("timeFrom")
+        .join_asof(
+            physical.select("bmUnit", "timeFrom", "levelFrom")
+            .rename({"timeFrom": "pnFrom", "levelFrom": "pn"})
+            .sort("pnFrom"),
+            left_on="timeFrom",
+            right_on="pnFrom",
+            by="bmUnit",
+            check_sortedness=False,
+        )
+        .with_columns(pl.col("pn").first().over("bmUnit", "id", "issued").fill_null(0))
+    )
+    return (
+        df.select(
+            "bmUnit",
+            pl.col("bmUnit").str.slice(2).alias("nationalGridBmUnit"),
+            "timeFrom",
+            "timeTo",
+            pl.when(pl.col("segment").eq(0))
+            .then(pl.col("pn"))
+            .otherwise(pl.col("target"))
+            .alias("levelFrom"),
+            pl.when(pl.col("segment").eq(2))
+            .then(pl.col("pn"))
+            .otherwise(pl.col("target"))
+            .alias("levelTo"),
+            # numbered from 1 on every day, by the day the acceptance starts on
+            pl.col("id")
+            .rank("dense")
+            .over("bmUnit", pl.col("timeFrom").min().over("bmUnit", "id").dt.date())
+            .alias("acceptanceNumber"),
+            at("issued").alias("acceptanceTime"),
+            pl.lit(False).alias("deemedBoFlag"),
+            "soFlag",
+            pl.lit(False).alias("storFlag"),
+            pl.lit(False).alias("rrFlag"),
+            *_settlement_columns("timeFrom", "settlementPeriodFrom"),
+            _settlement_columns("timeTo", "settlementPeriodTo")[1],
+        )
+        .pipe(schemas.conform, schemas.ACCEPTANCES)
+        .select(list(schemas.ACCEPTANCES))
+        .sort("bmUnit", "acceptanceTime", "timeFrom")
+    )
+
+
+def synthetic_bid_offer(
+    physical: pl.DataFrame, units: dict[str, str], pairs: int = 3, seed: int = 0
+) -> pl.DataFrame:
+    """
+    Bid-offer ladders of the units, `pairs` on either side of zero, every period
+
+    The ladder's levels split the unit's capacity between the pairs, and the
+    prices rise with the pair id, drifting from one period to the next.
+    """
+    rng = np.random.default_rng(seed)
+    periods = (
+        physical.select("bmUnit", pl.col("timeFrom").dt.truncate("30m"))
+        .unique(maintain_order=True)
+        .partition_by("bmUnit", as_dict=True, include_key=False)
+    )
+    capacities = dict(
+        physical.group_by("bmUnit")
+        .agg(pl.max_horizontal("levelFrom", "levelTo").max())
+        .iter_rows()
+    )
+    pair_ids = np.concatenate([np.arange(-pairs, 0), np.arange(1, pairs + 1)])
+
+    frames = []
+    for unit in units:
+        times = periods[(unit,)]["timeFrom"]
+        n = len(times)
+        capacity = max(capacities.get(unit, 0.0), 1.0)
+        # a negative pair covers a share of the capacity below zero, a positive one above
+        levels = pair_ids / pairs * capacity
+        base = np.cumsum(rng.normal(0, 2, n)) + rng.uniform(20, 80)
+        steps = rng.uniform(5, 30, len(pair_ids)).cumsum()
+        offers = base[:, None] + steps[None, :]
+        bids = offers - rng.uniform(5, 20, (n, len(pair_ids)))
+        # formatting the dates once per period, rather than once per pair
+        settlement = times.to_frame().select(_settlement_columns("timeFrom"))
+        frames.append(
+            pl.DataFrame(
+                {
+                    "timeFrom": np.repeat(times.to_numpy(), len(pair_ids)),
+                    "pairId": np.tile(pair_ids, n),
+                    "levelFrom": np.tile(levels, n).round(1),
+                    "bid": bids.ravel().round(2),
+                    "offer": offers.ravel().round(2),
+                }
+            ).with_columns(
+                *settlement[np.repeat(np.arange(n), len(pair_ids))].get_columns(),
+                pl.lit(unit).alias("bmUnit"),
+                pl.lit(unit[2:]).alias("nationalGridBmUnit"),
+            )
+        )
+    return (
+        pl.concat(frames)
+        .with_columns(
+            (pl.col("timeFrom") + pl.duration(minutes=30)).alias("timeTo"),
+            pl.col("levelFrom").alias("levelTo"),
+        )
+        .pipe(schemas.conform, schemas.BID_OFFER)
+        .select(list(schemas.BID_OFFER))
+    )
+
+
+def synthetic_cashflows(acceptances: pl.DataFrame, seed: int = 0) -> pl.DataFrame:
+    """Indicative cashflows of the periods the units have acceptances in"""
+    rng = np.random.default_rng(seed)
+    df = (
+        acceptances.select(
+            "bmUnit",
+            "settlementDate",
+            pl.col("settlementPeriodFrom").alias("settlementPeriod"),
+            pl.col("timeFrom").dt.truncate("30m").alias("startTime"),
+        )
+        .unique()
+        .sort("bmUnit", "startTime")
+    )
+    return df.with_columns(
+        pl.Series("totalCashflow", rng.normal(0, 2000, df.height).round(2)),
+        pl.col("bmUnit").str.slice(2).alias("nationalGridBmUnitId"),
+    ).pipe(schemas.conform, schemas.INDICATIVE_CASHFLOW)
+
+
+def synthetic_system_prices(
+    from_time: str, to_time: str, seed: int = 0
+) -> pl.DataFrame:
+    """System prices of every period, with the accepted and adjustment volumes"""
+    rng = np.random.default_rng(seed)
+    times = pl.datetime_range(
+        _parse(from_time),
+        _parse(to_time),
+        datetime.timedelta(minutes=30),
+        closed="left",
+        eager=True,
+    )
+    n = len(times)
+    price = (np.cumsum(rng.normal(0, 5, n)) + 70).round(2)
+    return (
+        pl.DataFrame(
+            {
+                "startTime": times,
+                "systemSellPrice": price,
+                "systemBuyPrice": price,
+                "netImbalanceVolume": rng.normal(0, 300, n).round(3),
+                "totalAcceptedOfferVolume": rng.uniform(0, 2000, n).round(3),
+                "totalAcceptedBidVolume": -rng.uniform(0, 2000, n).round(3),
+                "totalAdjustmentSellVolume": np.zeros(n),
+                "totalAdjustmentBuyVolume": np.zeros(n),
+            }
+        )
+        .with_columns(*_settlement_columns("startTime"))
+        .pipe(schemas.conform, schemas.SYSTEM_PRICES)
+    )
+
+
+def synthetic_datasets(
+    units: dict[str, str],
+    from_time: str,
+    to_time: str,
+    records_per_period: int = 1,
+    seed: int = 0,
+) -> dict[str, pl.DataFrame]:
+    """Every synthetic dataset of the units (see `synthetic_units`), keyed by the store's names"""
+    physical = synthetic_physical(units, from_time, to_time, records_per_period, seed)
+    acceptances = synthetic_acceptances(physical, units, seed)
+    return {
+        "physical": physical,
+        "acceptance": acceptances,
+        "bid_offer": synthetic_bid_offer(physical, units, seed=seed),
+        "indicative_cashflow": synthetic_cashflows(acceptances, seed),
+        "system_prices": synthetic_system_prices(from_time, to_time, seed),
+    }
@@ -13,6 +13,20 @@ def safe_create_dir(path: Path) -> None:
         os.mkdir(path)
 
 
+def parse_time(df: pl.DataFrame, column: str) -> pl.Expr:
+    """
+    Parses an ISO timestamp column of the dataframe
+
+    Times from the API are strings, the ones read from the store are already
+    Datetime (which `str.strptime` would reject).
+    """
+    if df.schema[column] == pl.String:
+        return pl.col(column).str.strptime(
+            format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime
+        )
+    return pl.col(column).cast(pl.Datetime)
+
+
 def resolve_acceptances(df: pl.DataFrame) -> pl.DataFrame:
     """
     Discarding overwritten accepted bids and offers
@@ -21,63 +35,82 @@ def resolve_acceptances(df: pl.DataFrame) -> pl.DataFrame:
     be overwritten by a later acceptance covering the same time period. To handle
     this, the acceptance levels are interpolated to 1 minute time intervals,
     and for each time interval the level from the last acceptance is selected.
+
+    All acceptance rows are expanded at once: each row gets its list of minutes,
+    which is exploded together with the step index, and the level is linearly
+    interpolated between `levelFrom` and `levelTo` along that index.
     """
-    result = df.with_columns(
-        pl.col("timeFrom")
-        .str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
-        .alias("from"),
-        pl.col("timeTo")
-        .str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
-        .alias("to"),
+    expanded = (
+        df.with_columns(
+            parse_time(df, "timeFrom").alias("from"),
+            parse_time(df, "timeTo").alias("to"),
+        )
+        .with_columns(
+            pl.datetime_ranges("from", "to", interval="1m").alias("time"),
+        )
+        .with_columns(
+            pl.col("time").list.len().sub(1).alias("steps"),
+            pl.int_ranges(pl.col("time").list.len()).alias("step"),
+        )
+        .select("time", "step", "steps", "levelFrom", "levelTo", "acceptanceTime")
+        .explode("time", "step")
     )
-    dfs = []
-    for d in result.group_by(pl.col("acceptanceNumber")):
-        for row in d[1].iter_rows(named=True):
-            time_series = pl.datetime_range(
-                start=row["from"],
-                end=row["to"],
-                interval="1m",
-                eager=True,
-            ).alias("time")
-
-            level_series = pl.Series(
-                name="level",
-                values=[
-                    row["levelFrom"],
-                    *(None for _ in range(time_series.shape[0] - 2)),
-                    row["levelTo"],
-                ],
-            )
-            new_df = pl.DataFrame(
-                {
-                    "time": time_series,
-                    "level": level_series,
-                    "acceptanceTime": pl.Series(
-                        [row["acceptanceTime"]] * time_series.shape[0]
-                    ),
-                }
-            ).interpolate()
-
-            dfs.append(new_df)
+
+    # same arithmetic as `interpolate()`: levelFrom + step * slope, with the
+    # end point pinned to levelTo
+    slope = (
+        pl.col("levelTo").cast(pl.Float64) - pl.col("levelFrom").cast(pl.Float64)
+    ) / pl.col("steps")
+    level = (
+        pl.when(pl.col("step").eq(pl.col("steps")))
+        .then(pl.col("levelTo").cast(pl.Float64))
+        .when(pl.col("step").eq(0))
+        .then(pl.col("levelFrom").cast(pl.Float64))
+        .otherwise(pl.col("levelFrom").cast(pl.Float64) + pl.col("step") * slope)
+        .alias("level")
+    )
+
     return (
-        pl.concat(dfs)
+        expanded.select("time", level, "acceptanceTime")
         .sort(by=["time", "acceptanceTime"])
         # this ensures, that the latest acceptance is taken into account for each
         .unique(subset=["time"], keep="last")
     )
 
 
+def resolve_overlapping_segments(
+    segments: pl.DataFrame, priority: list[str]
+) -> pl.DataFrame:
+    """
+    Splits overlapping `from`-`to` segments into non-overlapping pieces
+
+    The segment boundaries cut the time axis into elementary `start`-`end` pieces,
+    and each piece keeps the covering segment with the highest `priority` (sorted
+    ascending, so the last one wins). The original segment columns are kept, so
+    the linear level can still be evaluated along the piece. Pieces not covered by
+    any segment are dropped.
+    """
+    boundaries = pl.concat([segments["from"], segments["to"]]).unique().sort()
+    pieces = pl.DataFrame({"start": boundaries.head(-1), "end": boundaries[1:]})
+    return (
+        pieces.join_where(
+            segments,
+            pl.col("from").le(pl.col("start")),
+            pl.col("to").ge(pl.col("end")),
+        )
+        .sort(by=["start", *priority])
+        .unique(subset=["start"], keep="last")
+        .sort(by="start")
+    )
+
+
 def smoothen_physical(physical: pl.DataFrame) -> pl.DataFrame:
     """Smoothens the physical dataframe"""
     # TODO why am I not using the timeTo here?
     # TODO seems like it can happen, that there's no physical notification. What to do in this case?
     physical_parsed = physical.with_columns(
-        pl.col("timeFrom")
-        .str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
-        .alias("from"),
-        pl.col("timeTo")
-        .str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
-        .alias("to"),
+        parse_time(physical, "timeFrom").alias("from"),
+        parse_time(physical, "timeTo").alias("to"),
     )
 
     # Currently only deduplicating, if there's an overlap with exactly the same start and end
@@ -97,47 +130,48 @@ def smoothen_physical(physical: pl.DataFrame) -> pl.DataFrame:
         }
     )
 
-    physical_smoothened_matched = (
-        full_time_range.join_where(
-            physical_deduplicated,
-            (pl.col("time").ge(pl.col("from")) & pl.col("time").lt(pl.col("to"))),
-        )
-        .unique(subset=["time"], keep="last")
-        .with_columns(
-            (
-                pl.col("levelFrom")
-                + (pl.col("levelTo") - pl.col("levelFrom"))
-                * (
-                    (pl.col("time").dt.minute().sub(pl.col("from").dt.minute()))
-                    / (pl.col("to").dt.minute().sub(pl.col("from").dt.minute()))
-                )
-            )
-            .alias("level")
-            .cast(pl.Float64),
-            pl.col("settlementPeriod").cast(pl.Int64),
-        )
-        .select("time", "level", "settlementPeriod", "settlementDate")
+    # Overlapping PNs are cut into non-overlapping pieces first (the latest starting
+    # one wins), so each minute can be matched to at most one piece with a sorted
+    # as-of join, instead of an inequality join against every PN row
+    physical_resolved = resolve_overlapping_segments(
+        physical_deduplicated, priority=["from", "to"]
     )
 
-    physical_smoothened_unmatched = (
-        (full_time_range.join(physical_smoothened_matched, on="time", how="anti"))
-        .with_columns(
-            pl.lit(0).alias("level").cast(pl.Float64),
-            (
-                (pl.col("time").dt.minute() // 30 + 1) * 1
-                + (pl.col("time").dt.hour()) * 2
+    # minutes not covered by any PN (i.e. after the end of the matched piece) are
+    # filled with zero level, and their settlement period is derived from the time
+    matched = pl.col("end").is_not_null() & pl.col("time").lt(pl.col("end"))
+    physical_smoothened = full_time_range.join_asof(
+        physical_resolved,
+        left_on="time",
+        right_on="start",
+        strategy="backward",
+    ).select(
+        "time",
+        pl.when(matched)
+        .then(
+            pl.col("levelFrom")
+            + (pl.col("levelTo") - pl.col("levelFrom"))
+            * (
+                (pl.col("time").dt.minute().sub(pl.col("from").dt.minute()))
+                / (pl.col("to").dt.minute().sub(pl.col("from").dt.minute()))
             )
-            .alias("settlementPeriod")
-            .cast(pl.Int64),
-            pl.col("time").dt.strftime(format="%Y-%m-%d").alias("settlementDate"),
         )
-        .select("time", "level", "settlementPeriod", "settlementDate")
+        .otherwise(pl.lit(0))
+        .cast(pl.Float64)
+        .alias("level"),
+        pl.when(matched)
+        .then(pl.col("settlementPeriod"))
+        .otherwise(
+            (pl.col("time").dt.minute() // 30 + 1) * 1 + (pl.col("time").dt.hour()) * 2
+        )
+        .cast(pl.Int64)
+        .alias("settlementPeriod"),
+        pl.when(matched)
+        .then(pl.col("settlementDate"))
+        .otherwise(pl.col("time").dt.strftime(format="%Y-%m-%d"))
+        .alias("settlementDate"),
     )
 
-    physical_smoothened = pl.concat(
-        [physical_smoothened_matched, physical_smoothened_unmatched]
-    ).sort(by="time")
-
     return physical_smoothened
 
 
@@ -218,6 +252,187 @@ def aggregate_acceptance_and_pn(
     return output
 
 
+def _level_at(time: str) -> pl.Expr:
+    """Linear level of the matched segment at the `time` column"""
+    return pl.col("levelFrom") + (pl.col("levelTo") - pl.col("levelFrom")) * (
+        (pl.col(time) - pl.col("from")).dt.total_seconds()
+        / (pl.col("to") - pl.col("from")).dt.total_seconds()
+    )
+
+
+def _levels_on_pieces(
+    pieces: pl.DataFrame, resolved: pl.DataFrame, prefix: str
+) -> pl.DataFrame:
+    """Matches the resolved segments to the pieces and evaluates their level at both ends"""
+    matched = pieces.join_asof(
+        resolved.select(
+            pl.col("start").alias(f"{prefix}_start"),
+            pl.col("end").alias(f"{prefix}_end"),
+            pl.exclude("start", "end"),
+        ),
+        left_on="start",
+        right_on=f"{prefix}_start",
+        strategy="backward",
+    )
+    covered = pl.col(f"{prefix}_end").is_not_null() & pl.col("start").lt(
+        pl.col(f"{prefix}_end")
+    )
+    return matched.with_columns(
+        pl.when(covered).then(_level_at("start")).alias(f"{prefix}_from"),
+        pl.when(covered).then(_level_at("end")).alias(f"{prefix}_to"),
+    )
+
+
+def integrate_acceptance_and_pn(
+    accepted: Optional[pl.DataFrame],
+    physical: pl.DataFrame,
+    downsample_frequency: str,
+    energy_unit: Literal["MWh", "GWh"],
+) -> pl.DataFrame:
+    """
+    Exact counterpart of `aggregate_acceptance_and_pn` working on the raw PN data
+
+    Both the physical notification and the accepted levels are piecewise linear,
+    so instead of upsampling them to 1 minute, the time axis is cut at every
+    segment and downsample bucket boundary. Within each piece both levels (and so
+    their difference) are linear, and the energy is integrated exactly with the
+    trapezoid rule, splitting the difference at its zero crossing for curtailment
+    and extra generation.
+
+    Overlapping PNs are resolved as the latest starting one wins, and overlapping
+    acceptances as the latest accepted one wins. The output has the same columns
+    as `aggregate_acceptance_and_pn`.
+    """
+    physical_parsed = physical.with_columns(
+        parse_time(physical, "timeFrom").alias("from"),
+        parse_time(physical, "timeTo").alias("to"),
+    )
+    physical_resolved = resolve_overlapping_segments(
+        physical_parsed.unique(
+            subset=["settlementDate", "settlementPeriod", "from", "to"], keep="last"
+        ).select(
+            "from",
+            "to",
+            "levelFrom",
+            "levelTo",
+            pl.col("settlementPeriod").cast(pl.Int64),
+            "settlementDate",
+        ),
+        priority=["from", "to"],
+    )
+
+    window_start = physical_parsed.select(pl.col("from").min()).item()
+    window_end = physical_parsed.select(pl.col("to").max()).item()
+
+    boundaries = [
+        physical_resolved["start"],
+        physical_resolved["end"],
+        pl.datetime_range(
+            start=pl.Series([window_start]).dt.truncate(downsample_frequency).item(),
+            end=window_end,
+            interval=downsample_frequency,
+            eager=True,
+        ),
+    ]
+
+    accepted_resolved = None
+    if accepted is not None:
+        accepted_resolved = resolve_overlapping_segments(
+            accepted.select(
+                parse_time(accepted, "timeFrom").alias("from"),
+                parse_time(accepted, "timeTo").alias("to"),
+                "levelFrom",
+                "levelTo",
+                "acceptanceTime",
+                "acceptanceNumber",
+            ),
+            priority=["acceptanceTime", "acceptanceNumber"],
+        )
+        boundaries.extend([accepted_resolved["start"], accepted_resolved["end"]])
+
+    boundaries = pl.concat([b.alias("time") for b in boundaries])
+    boundaries = (
+        boundaries.filter(boundaries.is_between(window_start, window_end))
+        .unique()
+        .sort()
+    )
+    pieces = pl.DataFrame({"start": boundaries.head(-1), "end": boundaries[1:]})
+
+    pieces = _levels_on_pieces(pieces, physical_resolved, "physical").select(
+        "start",
+        "end",
+        pl.col("physical_from").fill_null(0),
+        pl.col("physical_to").fill_null(0),
+        pl.coalesce(
+            pl.col("settlementPeriod"),
+            (pl.col("start").dt.minute() // 30 + 1) + pl.col("start").dt.hour() * 2,
+        )
+        .cast(pl.Int64)
+        .alias("settlementPeriod"),
+        pl.coalesce(
+            pl.col("settlementDate"), pl.col("start").dt.strftime(format="%Y-%m-%d")
+        ).alias("settlementDate"),
+    )
+
+    if accepted_resolved is not None:
+        pieces = _levels_on_pieces(pieces, accepted_resolved, "accepted").select(
+            "start",
+            "end",
+            "physical_from",
+            "physical_to",
+            "settlementPeriod",
+            "settlementDate",
+            # accepted - physical => curtailment (-), or extra (+)
+            pl.col("accepted_from")
+            .sub(pl.col("physical_from"))
+            .fill_null(0)
+            .alias("d0"),
+            pl.col("accepted_to").sub(pl.col("physical_to")).fill_null(0).alias("d1"),
+        )
+    else:
+        pieces = pieces.with_columns(d0=pl.lit(0.0), d1=pl.lit(0.0))
+
+    hours = (pl.col("end") - pl.col("start")).dt.total_seconds() / 3600
+    # area of the positive part of a linear function going from d0 to d1
+    positive = (
+        pl.when(pl.col("d0").ge(0) & pl.col("d1").ge(0))
+        .then(hours * (pl.col("d0") + pl.col("d1")) / 2)
+        .when(pl.col("d0").le(0) & pl.col("d1").le(0))
+        .then(pl.lit(0.0))
+        .otherwise(
+            hours
+            * pl.max_horizontal("d0", "d1").pow(2)
+            / (2 * (pl.col("d0").abs() + pl.col("d1").abs()))
+        )
+    )
+
+    multiplier = ENERGY_MULTIPLIERS[energy_unit]
+    output = (
+        pieces.with_columns(
+            (hours * (pl.col("physical_from") + pl.col("physical_to")) / 2).alias(
+                "physical_level"
+            ),
+            (hours * (pl.col("d0") + pl.col("d1")) / 2).alias("diff"),
+            positive.alias("extra"),
+            pl.col("start").dt.truncate(downsample_frequency).alias("time"),
+        )
+        .with_columns(
+            pl.col("physical_level").add(pl.col("diff")).alias("generated"),
+            pl.col("diff").sub(pl.col("extra")).alias("curtailment"),
+        )
+        .group_by("time", maintain_order=True)
+        .agg(
+            pl.col("physical_level").mul(multiplier).sum(),
+            pl.col("extra").mul(multiplier).sum(),
+            pl.col("curtailment").mul(multiplier).sum(),
+            pl.col("generated").mul(multiplier).sum(),
+            pl.col("settlementPeriod").first(),
+            pl.col("settlementDate").first(),
+        )
+    )
+    return output
+
+
 def aggregate_bm_unit_generation(
     accepted: pl.DataFrame, physical: pl.DataFrame
 ) -> dict:
@@ -282,11 +497,11 @@ def format_bid_offer_table(df: pl.DataFrame) -> pl.DataFrame:
         ]
     )
 
-    with_zeros = (
-        df.with_columns(pl.col("pairId").cast(pl.Float64))
-        .extend(zero_rows)
-        .sort(by="pairId", descending=False)
-    )
+    # relaxed, as the levels are floats when read from the store
+    with_zeros = pl.concat(
+        [df.with_columns(pl.col("pairId").cast(pl.Float64)), zero_rows],
+        how="vertical_relaxed",
+    ).sort(by="pairId", descending=False)
 
     negative_pairs = with_zeros.filter(pl.col("pairId").lt(pl.lit(0)))
     positive_pairs = with_zeros.filter(pl.col("pairId").gt(pl.lit(0)))
@@ -389,11 +604,61 @@ def calculate_cashflow(df: pl.DataFrame) -> float:
 
 
 def cashflow(bo_df: pl.DataFrame, gen_df: pl.DataFrame) -> pl.DataFrame:
-    """Creates cashflow columns form the bid-offer and generation dataframe"""
-    merged = (
-        bo_df.join(gen_df, on=["settlementDate", "settlementPeriod"])
-        .group_by("settlementDate", "settlementPeriod")
-        .map_groups(calculate_cashflow)
+    """
+    Creates cashflow columns form the bid-offer and generation dataframe
+
+    Same as running `calculate_cashflow` for each settlement period, but for every
+    period in one lazy query: the ladders of `format_bid_offer_table` are built with
+    window expressions over the periods, and priced with the `c_or_e_map`
+    expressions like in `aggregate_prices`. Periods with no ladder to price (i.e.
+    only 0-0 pairs) get null cashflows.
+    """
+    keys = ["settlementDate", "settlementPeriod"]
+    pairs = (
+        bo_df.lazy()
+        .join(gen_df.lazy(), on=keys)
+        .select(
+            *keys,
+            "levelFrom",
+            "levelTo",
+            "bid",
+            "offer",
+            "curtailment",
+            "extra",
+            "pairId",
+        )
+        .unique(maintain_order=True)
+    )
+
+    # the pairs are stacked outwards from zero: each negative pair ends where the one
+    # closer to zero does, and each positive pair starts where the one closer to zero
+    # does, with the pairs closest to zero ending/starting at 0
+    ladder = pairs.filter(
+        ~(pl.col("levelFrom").eq(pl.lit(0)) & pl.col("levelTo").eq(pl.lit(0)))
+    ).sort(by=[*keys, "pairId"])
+    bid_offer_table = pl.concat(
+        [
+            ladder.filter(pl.col("pairId").lt(pl.lit(0))).with_columns(
+                pl.col("levelTo").shift(-1).over(keys).fill_null(0)
+            ),
+            ladder.filter(pl.col("pairId").gt(pl.lit(0))).with_columns(
+                pl.col("levelFrom").shift(1).over(keys).fill_null(0)
+            ),
+        ]
+    ).filter(~(pl.col("levelTo").eq(pl.col("levelFrom"))))
+
+    prices = bid_offer_table.group_by(keys, maintain_order=True).agg(
+        pl.when(pl.col(col).first().eq(pl.lit(0)))
+        .then(pl.lit(0.0))
+        .otherwise(expr.mul(pl.col(price_col)).filter(_filter).sum())
+        .cast(pl.Float64)
+        .alias(f"calculated_cashflow_{col}")
+        for col, (price_col, expr, _filter) in c_or_e_map.items()
     )
 
-    return merged
+    return (
+        pairs.select(keys)
+        .unique(maintain_order=True)
+        .join(prices, on=keys, how="left")
+        .collect()
+    )
@@ -0,0 +1,62 @@
+import datetime
+import os
+import time
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from src.elexon.cache import ResponseCache, period_end
+
+BASE_URL = "https://data.elexon.co.uk/bmrs/api/v1"
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        (
+            f"{BASE_URL}/balancing/physical?bmUnit=T_X-1&from=2024-01-01T00:00:00Z"
+            "&to=2024-01-08T00:00:00Z&dataset=PN",
+            datetime.datetime(2024, 1, 8),
+        ),
+        (
+            f"{BASE_URL}/balancing/settlement/system-prices/2024-01-01/5",
+            datetime.datetime(2024, 1, 2),
+        ),
+        (f"{BASE_URL}/reference/bmunits/all", None),
+    ],
+)
+def test_period_end(url: str, expected: datetime.datetime):
+    assert period_end(url) == expected
+
+
+def test_response_cache_settled_entries_never_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=60)
+    url = (
+        f"{BASE_URL}/balancing/physical?bmUnit=T_X-1&from=2024-01-01T00:00:00Z"
+        "&to=2024-01-08T00:00:00Z&dataset=PN"
+    )
+    df = pl.DataFrame({"bmUnit": ["T_X-1"], "levelFrom": [10]})
+
+    assert cache.get(url) is None
+    cache.put(url, df)
+    assert cache.path(url).parent.parent.name == "balancing_physical"
+
+    # making the entry look like it was written a day ago
+    a_day_ago = time.time() - 24 * 3600
+    os.utime(cache.path(url), (a_day_ago, a_day_ago))
+    assert_frame_equal(cache.get(url), df)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_response_cache_recent_entries_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=60)
+    today = datetime.date.today().isoformat()
+    url = f"{BASE_URL}/balancing/settlement/system-prices/{today}/5"
+    cache.put(url, pl.DataFrame())
+
+    assert cache.get(url) is not None
+
+    an_hour_ago = time.time() - 3600
+    os.utime(cache.path(url), (an_hour_ago, an_hour_ago))
+    assert cache.get(url) is None
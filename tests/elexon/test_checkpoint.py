@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from src.elexon.checkpoint import ChunkCheckpoint
+from src.elexon.query import IncompleteFetchError, fetch_chunks
+from src.elexon.run_report import REPORT_FILE, RUN_REPORT
+from src.elexon.store import DataStore
+
+TASKS = [
+    ("T_X-1", "2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"),
+    ("T_X-1", "2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z"),
+    ("T_X-1", "2024-01-03T00:00:00Z", "2024-01-04T00:00:00Z"),
+]
+
+
+def chunk(unit: str, from_time: str, to_time: str) -> pl.DataFrame:
+    return pl.DataFrame(
+        {"timeFrom": [from_time], "timeTo": [to_time], "bmUnit": [unit]}
+    )
+
+
+def test_fetch_chunks_resumes_from_checkpoint(tmp_path):
+    requested = []
+    failing = {"2024-01-02T00:00:00Z"}
+
+    async def fetch(unit: str, from_time: str, to_time: str):
+        requested.append(from_time)
+        if from_time in failing:
+            raise ConnectionError("interrupted")
+        if from_time == "2024-01-03T00:00:00Z":
+            return chunk(unit, from_time, to_time).clear()
+        return chunk(unit, from_time, to_time)
+
+    def run(checkpoint: ChunkCheckpoint):
+        return asyncio.run(
+            fetch_chunks(
+                fetch,
+                TASKS,
+                "2024-01-01T00:00:00Z",
+                "2024-01-04T00:00:00Z",
+                checkpoint=checkpoint,
+            )
+        )
+
+    with pytest.raises(IncompleteFetchError, match="1/3 chunks failed"):
+        run(ChunkCheckpoint.for_units(tmp_path, "physical", ["T_X-1"]))
+    # requested once, and re-queued twice
+    assert requested.count("2024-01-02T00:00:00Z") == 3
+
+    # a new run only requests the chunk that failed
+    checkpoint = ChunkCheckpoint.for_units(tmp_path, "physical", ["T_X-1"])
+    assert len(checkpoint.chunks) == 2
+    requested.clear()
+    failing.clear()
+    df = run(checkpoint)
+
+    assert requested == ["2024-01-02T00:00:00Z"]
+    assert_frame_equal(df, pl.concat([chunk(*TASKS[0]), chunk(*TASKS[1])]))
+
+    checkpoint.clear()
+    assert not checkpoint.folder.exists()
+
+
+def test_fetch_chunks_reports_chunks(tmp_path):
+    async def fetch(unit: str, from_time: str, to_time: str):
+        if from_time == "2024-01-02T00:00:00Z":
+            return chunk(unit, from_time, to_time).clear()
+        return chunk(unit, from_time, to_time)
+
+    RUN_REPORT.open(tmp_path / REPORT_FILE)
+    try:
+        with RUN_REPORT.stage("generation", DataStore(tmp_path), []):
+            asyncio.run(
+                fetch_chunks(
+                    fetch,
+                    TASKS,
+                    "2024-01-01T00:00:00Z",
+                    "2024-01-04T00:00:00Z",
+                    units=["T_X-1"],
+                )
+            )
+    finally:
+        RUN_REPORT.close()
+
+    stage, unit = [json.loads(line) for line in open(tmp_path / REPORT_FILE)]
+    assert stage["chunks"] == {"ok": 2, "empty": 1, "failed": 0}
+    assert unit["unit"] == "T_X-1"
+    assert unit["chunks"] == {"ok": 2, "empty": 1, "failed": 0}
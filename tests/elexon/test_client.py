@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from src.elexon.cache import ResponseCache
+from src.elexon.client import ElexonClient
+from src.elexon.rate_limit import RATE_LIMITER
+
+
+def test_session_lifecycle():
+    client = ElexonClient(limit=7, limit_per_host=3, max_in_flight=5)
+
+    async def run():
+        async with client as opened:
+            assert opened is client
+            session = client.session
+            assert not session.closed
+            assert session.connector.limit == 7
+            assert session.connector.limit_per_host == 3
+            assert client.in_flight.max_limit == 5
+        return session
+
+    session = asyncio.run(run())
+
+    assert session.closed
+    assert client._session is None
+    assert client._in_flight is None
+
+
+@pytest.mark.parametrize("attribute", ["session", "in_flight"])
+def test_outside_async_with(attribute):
+    with pytest.raises(RuntimeError, match="async with ElexonClient"):
+        getattr(ElexonClient(), attribute)
+
+
+def test_from_config(tmp_path, monkeypatch):
+    # the rate limiter is process-wide, restore it afterwards
+    for name in ["rate", "capacity", "_tokens"]:
+        monkeypatch.setattr(RATE_LIMITER, name, getattr(RATE_LIMITER, name))
+    config = {
+        "client": {
+            "limit": 12,
+            "base_url": "http://localhost:8080",
+            "rate_limit": {"rate": 3, "capacity": 6},
+            "cache": {"folder": str(tmp_path), "ttl_seconds": 60},
+            "concurrency": {"min_limit": 2},
+        }
+    }
+
+    client = ElexonClient.from_config(config)
+
+    assert client.limit == 12
+    assert client.base_url == "http://localhost:8080"
+    assert client.rate_limiter is RATE_LIMITER
+    assert (RATE_LIMITER.rate, RATE_LIMITER.capacity) == (3, 6)
+    assert isinstance(client.cache, ResponseCache)
+    assert client.cache.folder == tmp_path
+    assert client.cache.ttl_seconds == 60
+    assert client.concurrency == {"min_limit": 2}
+    # the run config is left as is
+    assert "rate_limit" in config["client"]
+
+
+def test_from_config_defaults():
+    client = ElexonClient.from_config({})
+
+    assert client.limit == 100
+    assert client.cache is None
+    assert client.concurrency == {}
+
+
+@pytest.mark.parametrize("absolute", [False, True])
+def test_from_config_concurrency_log_path(tmp_path, absolute):
+    log_path = str(tmp_path / "logs" / "concurrency.jsonl") if absolute else "c.jsonl"
+    config = {"client": {"concurrency": {"log_path": log_path}}}
+
+    client = ElexonClient.from_config(config, tmp_path / "output")
+
+    # relative to the output folder, like the run report
+    expected = log_path if absolute else str(tmp_path / "output" / "c.jsonl")
+    assert client.concurrency == {"log_path": expected}
+    assert config["client"]["concurrency"]["log_path"] == log_path
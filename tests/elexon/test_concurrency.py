@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from src.elexon.concurrency import AdaptiveConcurrency
+
+
+def test_adaptive_concurrency_aimd(tmp_path):
+    log_path = tmp_path / "concurrency.jsonl"
+    limiter = AdaptiveConcurrency(
+        max_limit=10, initial=4, window=5, log_path=str(log_path)
+    )
+
+    async def run():
+        # two healthy windows
+        for _ in range(10):
+            await limiter.record(0.1)
+        assert limiter.limit == 6
+
+        # a burst of 429s only halves the limit once
+        for _ in range(3):
+            await limiter.record(0.1, throttled=True)
+        assert limiter.limit == 3
+
+        # latency rising well above the baseline, in the next window
+        for _ in range(2):
+            await limiter.record(0.1)
+        for _ in range(5):
+            await limiter.record(1.0)
+        assert limiter.limit == 1
+
+        # never above the max
+        for _ in range(100):
+            await limiter.record(0.1)
+        assert limiter.limit == 10
+
+    asyncio.run(run())
+
+    decisions = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [d["reason"] for d in decisions[:4]] == [
+        "healthy",
+        "healthy",
+        "throttled",
+        "latency",
+    ]
+    assert (decisions[2]["from"], decisions[2]["to"]) == (6, 3)
+
+
+def test_adaptive_concurrency_caps_in_flight():
+    limiter = AdaptiveConcurrency(max_limit=10, initial=2)
+    in_flight = []
+
+    async def request():
+        async with limiter:
+            in_flight.append(limiter._in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*[request() for _ in range(10)])
+
+    asyncio.run(run())
+    assert max(in_flight) == 2
@@ -0,0 +1,61 @@
+import asyncio
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from src.elexon.client import ElexonClient
+from src.elexon.fake_server import STATS, BackgroundServer, ServerStats, create_app
+from src.elexon.query import get_physical, get_units
+from src.elexon.rate_limit import TokenBucket
+from src.elexon.synthetic import synthetic_units
+
+UNITS = synthetic_units(2)
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-03T00:00:00Z"
+
+
+def fetch_physical(throttle_rate: float = 0.0):
+    stats = ServerStats()
+    app = create_app(
+        UNITS,
+        FROM_TIME,
+        TO_TIME,
+        throttle_rate=throttle_rate,
+        retry_after=0,
+        stats=stats,
+    )
+
+    async def fetch(base_url: str):
+        client = ElexonClient(base_url=base_url, rate_limiter=TokenBucket(1000, 1000))
+        async with client:
+            per_unit = {
+                unit: await get_physical(client, unit, FROM_TIME, TO_TIME)
+                for unit in UNITS
+            }
+            bulk = await get_units(client, "physical", list(UNITS), FROM_TIME, TO_TIME)
+        return per_unit, bulk
+
+    with BackgroundServer(app) as server:
+        per_unit, bulk = asyncio.run(fetch(server.url))
+    assert app[STATS] is stats
+    return stats, per_unit, bulk
+
+
+def test_fake_server_serves_per_unit_and_bulk():
+    stats, per_unit, bulk = fetch_physical()
+
+    assert stats.throttled == 0
+    for unit in UNITS:
+        # a row per settlement period
+        assert per_unit[unit].height == 96
+        assert per_unit[unit]["bmUnit"].unique().to_list() == [unit]
+        assert_frame_equal(bulk[unit], per_unit[unit])
+
+
+def test_fake_server_throttling_is_retried():
+    stats, per_unit, _ = fetch_physical(throttle_rate=0.3)
+
+    assert stats.throttled > 0
+    assert stats.requests > stats.throttled
+    assert all(df.height == 96 for df in per_unit.values())
+    assert pl.concat(per_unit.values())["levelFrom"].null_count() == 0
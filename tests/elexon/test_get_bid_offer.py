@@ -0,0 +1,36 @@
+import asyncio
+
+from src.elexon.benchmark import benchmark_config
+from src.elexon.fake_server import BackgroundServer, create_app
+from src.elexon.get_bid_offer import fetch_units
+from src.elexon.incremental import HighWaterMarks
+from src.elexon.store import DataStore
+from src.elexon.synthetic import synthetic_units
+
+UNITS = synthetic_units(2)
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-03T00:00:00Z"
+
+
+def fetch(tmp_path, to_time: str):
+    # the server has no data after TO_TIME
+    with BackgroundServer(create_app(UNITS, FROM_TIME, TO_TIME)) as server:
+        config = benchmark_config(server.url, list(UNITS), FROM_TIME, to_time)
+        config["incremental"] = True
+        asyncio.run(fetch_units(config, str(tmp_path)))
+
+
+def test_incremental_run_without_new_data(tmp_path):
+    fetch(tmp_path, TO_TIME)
+    store = DataStore(tmp_path)
+    files = sorted(store.dataset_path("bid_offer").glob("**/data.parquet"))
+    written = [path.stat().st_mtime_ns for path in files]
+    assert files
+
+    later = "2024-01-04T00:00:00Z"
+    fetch(tmp_path, later)
+
+    # only the marks move, the stored units aren't rewritten
+    assert [path.stat().st_mtime_ns for path in files] == written
+    marks = HighWaterMarks(store.dataset_path("bid_offer"))
+    assert all(marks.get(unit) == later for unit in UNITS)
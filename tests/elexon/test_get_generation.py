@@ -0,0 +1,112 @@
+import asyncio
+import re
+
+import pytest
+from aiohttp import web
+
+from src.elexon import get_generation
+from src.elexon.benchmark import benchmark_config
+from src.elexon.fake_server import BackgroundServer, create_app
+from src.elexon.get_generation import downsample_units
+from src.elexon.incremental import HighWaterMarks
+from src.elexon.store import DataStore
+from src.elexon.synthetic import synthetic_units
+
+UNITS = synthetic_units(3)
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-03T00:00:00Z"
+
+
+def failing(*paths: str):
+    """Middleware answering the requests for `paths` with a server error"""
+
+    @web.middleware
+    async def fail(request: web.Request, handler) -> web.StreamResponse:
+        if any(path in request.path for path in paths):
+            return web.Response(status=500)
+        return await handler(request)
+
+    return fail
+
+
+def downsample(tmp_path, app: web.Application, **config) -> DataStore:
+    store = DataStore(tmp_path)
+    with BackgroundServer(app) as server:
+        run_config = benchmark_config(server.url, list(UNITS), FROM_TIME, TO_TIME)
+        run_config.update(config)
+        asyncio.run(downsample_units(run_config, store))
+    return store
+
+
+def test_failed_dataset_stores_nothing(tmp_path, capsys):
+    app = create_app(UNITS, FROM_TIME, TO_TIME)
+    app.middlewares.append(failing("/datasets/BOALF/", "/balancing/acceptances"))
+
+    store = downsample(tmp_path, app)
+
+    # the physical data was fetched, but isn't stored without the acceptances
+    for dataset in ["physical", "acceptance", "generation/total"]:
+        marks = HighWaterMarks(store.dataset_path(dataset))
+        for unit in UNITS:
+            assert not store.exists(dataset, unit)
+            assert marks.get(unit) is None
+    assert f"Getting generation data: {len(UNITS)} failed" in capsys.readouterr().out
+
+
+def test_downsample_units(tmp_path, monkeypatch, capsys):
+    failing_unit = list(UNITS)[1]
+    downsample_stored_unit = get_generation.downsample_stored_unit
+
+    def downsample_or_fail(folder, unit, *args):
+        if unit == failing_unit:
+            raise ValueError(f"failed {unit}")
+        return downsample_stored_unit(folder, unit, *args)
+
+    monkeypatch.setattr(get_generation, "downsample_stored_unit", downsample_or_fail)
+    store = downsample(tmp_path, create_app(UNITS, FROM_TIME, TO_TIME))
+
+    # a unit failing to compute doesn't hold up the others
+    for unit in UNITS:
+        assert store.exists("physical", unit)
+        assert store.exists("generation/total", unit) == (unit != failing_unit)
+    out = capsys.readouterr().out
+    assert "Computing generation data: 1 failed" in out
+    assert not re.search(r"Getting generation data: \d+ failed", out)
+
+
+def test_downsample_units_fetch_raising(tmp_path, monkeypatch):
+    run_unit_queue = get_generation.run_unit_queue
+
+    async def run_and_raise(*args):
+        await run_unit_queue(*args)
+        raise RuntimeError("fetching failed")
+
+    monkeypatch.setattr(get_generation, "run_unit_queue", run_and_raise)
+    with pytest.raises(RuntimeError, match="fetching failed"):
+        downsample(tmp_path, create_app(UNITS, FROM_TIME, TO_TIME), workers=1)
+
+    # the consumers computed the queued units before stopping
+    store = DataStore(tmp_path)
+    assert all(store.exists("generation/total", unit) for unit in UNITS)
+
+
+def test_incremental_run_without_new_data(tmp_path):
+    # the server has no data after TO_TIME
+    store = downsample(
+        tmp_path, create_app(UNITS, FROM_TIME, TO_TIME), incremental=True
+    )
+    files = sorted(store.dataset_path("physical").glob("**/data.parquet"))
+    written = [path.stat().st_mtime_ns for path in files]
+
+    later = "2024-01-04T00:00:00Z"
+    store = downsample(
+        tmp_path,
+        create_app(UNITS, FROM_TIME, TO_TIME),
+        incremental=True,
+        to_time=later,
+    )
+
+    # only the marks move, the stored units aren't rewritten
+    assert [path.stat().st_mtime_ns for path in files] == written
+    marks = HighWaterMarks(store.dataset_path("physical"))
+    assert all(marks.get(unit) == later for unit in UNITS)
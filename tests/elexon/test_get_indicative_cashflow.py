@@ -0,0 +1,53 @@
+import asyncio
+
+from aiohttp import web
+
+from src.elexon.benchmark import benchmark_config
+from src.elexon.fake_server import BackgroundServer, create_app
+from src.elexon.get_generation import downsample_units
+from src.elexon.get_indicative_cashflow import fetch_units
+from src.elexon.incremental import HighWaterMarks
+from src.elexon.store import DataStore
+from src.elexon.synthetic import synthetic_units
+
+UNITS = synthetic_units(3)
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-04T00:00:00Z"
+FAILING_DAY = "/cashflows/all/bid/2024-01-02"
+
+
+def test_failed_day_stores_nothing(tmp_path, capsys):
+    requests = []
+
+    @web.middleware
+    async def fail(request: web.Request, handler) -> web.StreamResponse:
+        if request.path.endswith(FAILING_DAY):
+            requests.append(request.query["bmUnit"])
+            return web.Response(status=500)
+        return await handler(request)
+
+    store = DataStore(tmp_path)
+    app = create_app(UNITS, FROM_TIME, TO_TIME)
+    app.middlewares.append(fail)
+    with BackgroundServer(app) as server:
+        config = benchmark_config(server.url, list(UNITS), FROM_TIME, TO_TIME)
+        config["incremental"] = True
+        asyncio.run(downsample_units(config, store))
+        asyncio.run(fetch_units(config, str(tmp_path)))
+
+    # the units with acceptances on the failing day were requested it three times
+    failed = set(requests)
+    assert failed
+    assert all(requests.count(unit) == 3 for unit in failed)
+    bid_marks = HighWaterMarks(store.dataset_path("indicative_cashflow/bid"))
+    offer_marks = HighWaterMarks(store.dataset_path("indicative_cashflow/offer"))
+    for unit in UNITS:
+        if not store.exists("acceptance", unit):
+            continue
+        # no hole is stored, nor skipped over by the next run's mark
+        assert store.exists("indicative_cashflow/bid", unit) == (unit not in failed)
+        assert (bid_marks.get(unit) is None) == (unit in failed)
+        assert offer_marks.get(unit) is not None
+    out = capsys.readouterr().out
+    assert f"Getting indicative cashflow data (bid): {len(failed)} failed" in out
+    assert "HTTP 500" in out
@@ -0,0 +1,35 @@
+import yaml
+
+from src.elexon.benchmark import benchmark_config
+from src.elexon.fake_server import BackgroundServer, ServerStats, create_app
+from src.elexon.get_system_imbalance_settlement import main
+from src.elexon.store import DataStore
+from src.elexon.synthetic import synthetic_units
+
+UNITS = synthetic_units(1)
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-03T00:00:00Z"
+
+
+def test_uses_the_client_config(tmp_path):
+    stats = ServerStats()
+    app = create_app(UNITS, FROM_TIME, TO_TIME, stats=stats)
+    config_path = tmp_path / "config.yaml"
+
+    with BackgroundServer(app) as server:
+        config = benchmark_config(server.url, list(UNITS), FROM_TIME, TO_TIME)
+        config["client"]["cache"] = {"folder": str(tmp_path / "cache")}
+        config_path.write_text(yaml.safe_dump(config))
+        main(FROM_TIME, TO_TIME, str(tmp_path), config_path=str(config_path))
+        requests = stats.requests
+        main(FROM_TIME, TO_TIME, str(tmp_path), config_path=str(config_path))
+
+    # fetched from the configured server, the second time from the cache
+    prices = DataStore(tmp_path).read("system_prices")
+    assert prices["settlementDate"].unique().sort().to_list() == [
+        "2024-01-01",
+        "2024-01-02",
+    ]
+    assert requests > 0
+    assert stats.requests == requests
+    assert any((tmp_path / "cache").rglob("*.parquet"))
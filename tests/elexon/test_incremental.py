@@ -0,0 +1,131 @@
+import datetime
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from src.elexon.incremental import (
+    HighWaterMarks,
+    append_rows,
+    fetch_start,
+    recompute_start,
+    replace_from,
+    resolve_time_range,
+)
+
+
+def test_resolve_time_range():
+    config = {"from_time": "2024-01-01T00:00:00Z", "to_time": "now"}
+    resolved = resolve_time_range(config)
+
+    to_time = datetime.datetime.strptime(resolved["to_time"], "%Y-%m-%dT%H:%M:%SZ")
+    assert to_time.minute in (0, 30) and to_time.second == 0
+    assert config["to_time"] == "now"
+    assert resolve_time_range(resolved) == resolved
+
+
+def test_high_water_marks(tmp_path):
+    marks = HighWaterMarks(tmp_path)
+    assert marks.get("T_X-1") is None
+
+    marks.set("T_X-1", "2024-01-08T00:00:00Z")
+    assert HighWaterMarks(tmp_path).get("T_X-1") == "2024-01-08T00:00:00Z"
+
+
+@pytest.mark.parametrize(
+    ("mark", "existing", "expected"),
+    [
+        (
+            "2024-01-08T00:00:00Z",
+            pl.DataFrame({"timeTo": ["2024-01-03T00:00:00Z"]}),
+            "2024-01-08T00:00:00Z",
+        ),
+        (
+            None,
+            pl.DataFrame({"timeTo": ["2024-01-03T00:00:00Z", "2024-01-02T00:00:00Z"]}),
+            "2024-01-03T00:00:00Z",
+        ),
+        (None, None, "2024-01-01T00:00:00Z"),
+    ],
+)
+def test_fetch_start(tmp_path, mark, existing, expected):
+    marks = HighWaterMarks(tmp_path)
+    if mark is not None:
+        marks.set("T_X-1", mark)
+    assert fetch_start(marks, "T_X-1", existing, "2024-01-01T00:00:00Z") == expected
+
+
+def test_append_rows():
+    existing = pl.DataFrame(
+        {
+            "timeFrom": ["2024-01-01T00:00:00Z", "2024-01-01T00:30:00Z"],
+            "levelFrom": [10, 20],
+        }
+    )
+    new = pl.DataFrame(
+        {
+            "timeFrom": ["2024-01-01T00:30:00Z", "2024-01-01T01:00:00Z"],
+            "levelFrom": [25.0, 30.0],
+        }
+    )
+
+    assert_frame_equal(
+        append_rows(existing, new, subset=["timeFrom"]),
+        pl.DataFrame(
+            {
+                "timeFrom": [
+                    datetime.datetime(2024, 1, 1, 0, 0),
+                    datetime.datetime(2024, 1, 1, 0, 30),
+                    datetime.datetime(2024, 1, 1, 1, 0),
+                ],
+                "levelFrom": [10.0, 25.0, 30.0],
+            }
+        ),
+    )
+    assert_frame_equal(append_rows(existing, None), existing)
+    assert_frame_equal(append_rows(None, new), new)
+
+
+def test_recompute_start():
+    new = [
+        None,
+        pl.DataFrame({"timeFrom": ["2024-01-01T10:47:00Z", "2024-01-01T11:00:00Z"]}),
+        pl.DataFrame({"timeFrom": ["2024-01-01T10:52:00Z"]}),
+    ]
+    assert recompute_start(new, "30m") == datetime.datetime(2024, 1, 1, 10, 30)
+    assert recompute_start([None], "30m") is None
+
+
+def test_replace_from():
+    existing = pl.DataFrame(
+        {
+            "time": [
+                datetime.datetime(2024, 1, 1, 0, 0),
+                datetime.datetime(2024, 1, 1, 0, 30),
+            ],
+            "generated": [1.0, 2.0],
+        }
+    )
+    recomputed = pl.DataFrame(
+        {
+            "time": [
+                datetime.datetime(2024, 1, 1, 0, 30),
+                datetime.datetime(2024, 1, 1, 1),
+            ],
+            "generated": [3.0, 4.0],
+        }
+    )
+
+    assert_frame_equal(
+        replace_from(existing, recomputed, datetime.datetime(2024, 1, 1, 0, 30)),
+        pl.DataFrame(
+            {
+                "time": [
+                    datetime.datetime(2024, 1, 1, 0, 0),
+                    datetime.datetime(2024, 1, 1, 0, 30),
+                    datetime.datetime(2024, 1, 1, 1),
+                ],
+                "generated": [1.0, 3.0, 4.0],
+            }
+        ),
+    )
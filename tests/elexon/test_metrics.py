@@ -0,0 +1,176 @@
+import asyncio
+import urllib.request
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from src.elexon.client import ElexonClient
+from src.elexon.fake_server import BackgroundServer, create_app
+from src.elexon.metrics import CONTENT_TYPE, METRICS, Metrics, endpoint
+from src.elexon.query import HTTPStatusError, _elexon_get_request_async, get_physical
+from src.elexon.rate_limit import TokenBucket
+from src.elexon.synthetic import synthetic_units
+
+BASE_URL = "https://data.elexon.co.uk/bmrs/api/v1"
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            f"{BASE_URL}/balancing/physical?bmUnit=T_X-1&from=2024-01-01",
+            "/balancing/physical",
+        ),
+        (f"{BASE_URL}/datasets/BOALF/stream?from=2024-01-01", "/datasets/BOALF/stream"),
+        (
+            f"{BASE_URL}/balancing/settlement/indicative/cashflows/all/bid/2024-01-01"
+            "?bmUnit=T_X-1",
+            "/balancing/settlement/indicative/cashflows/all/bid/{date}",
+        ),
+        (
+            f"{BASE_URL}/balancing/settlement/system-prices/2024-01-01/48",
+            "/balancing/settlement/system-prices/{date}/{period}",
+        ),
+    ],
+)
+def test_endpoint(url, expected):
+    assert endpoint(url, BASE_URL) == expected
+
+
+def test_metrics_render():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("elexon_throttled_total", endpoint="/balancing/physical")
+    metrics.inc("elexon_throttled_total", 2, endpoint="/balancing/physical")
+    metrics.set("elexon_queue_depth", 5, task='Getting "bid-offer"')
+    for latency in [0.05, 0.1, 0.5, 3.0]:
+        metrics.observe("elexon_request_duration_seconds", latency, endpoint="/a")
+
+    assert metrics.render().splitlines() == [
+        "# HELP elexon_queue_depth Units (or batches) waiting to be processed",
+        "# TYPE elexon_queue_depth gauge",
+        'elexon_queue_depth{task="Getting \\"bid-offer\\""} 5',
+        "# HELP elexon_request_duration_seconds Time to the response headers, per"
+        " endpoint",
+        "# TYPE elexon_request_duration_seconds histogram",
+        'elexon_request_duration_seconds_bucket{endpoint="/a",le="0.1"} 2',
+        'elexon_request_duration_seconds_bucket{endpoint="/a",le="1.0"} 3',
+        'elexon_request_duration_seconds_bucket{endpoint="/a",le="+Inf"} 4',
+        'elexon_request_duration_seconds_sum{endpoint="/a"} 3.65',
+        'elexon_request_duration_seconds_count{endpoint="/a"} 4',
+        "# HELP elexon_throttled_total Rate limited (429) responses",
+        "# TYPE elexon_throttled_total counter",
+        'elexon_throttled_total{endpoint="/balancing/physical"} 3',
+    ]
+
+
+def test_metrics_exporting(tmp_path):
+    metrics = Metrics()
+    metrics.inc("elexon_rows_written_total", 10, dataset="physical")
+    textfile = tmp_path / "elexon.prom"
+
+    with metrics.exporting({"port": 0, "textfile": str(textfile), "host": "127.0.0.1"}):
+        # already exported, e.g. by the orchestrator
+        with metrics.exporting({"port": 0}):
+            pass
+        with urllib.request.urlopen(f"http://127.0.0.1:{metrics.port}/metrics") as r:
+            assert r.headers["Content-Type"] == CONTENT_TYPE
+            assert r.read().decode() == metrics.render()
+
+    assert metrics.port is None
+    assert 'elexon_rows_written_total{dataset="physical"} 10' in textfile.read_text()
+    assert list(tmp_path.iterdir()) == [textfile]
+
+
+def test_requests_are_instrumented():
+    units = synthetic_units(1)
+    unit = next(iter(units))
+    from_time, to_time = "2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"
+    app = create_app(units, from_time, to_time, throttle_rate=0.5, retry_after=0)
+    path = "/balancing/physical"
+
+    async def fetch(base_url: str):
+        client = ElexonClient(base_url=base_url, rate_limiter=TokenBucket(1000, 1000))
+        async with client:
+            for _ in range(10):
+                await get_physical(client, unit, from_time, to_time)
+
+    before = {
+        "ok": METRICS.value("elexon_responses_total", endpoint=path, status="200"),
+        "throttled": METRICS.value("elexon_throttled_total", endpoint=path),
+    }
+    with BackgroundServer(app) as server:
+        asyncio.run(fetch(server.url))
+
+    assert METRICS.value("elexon_responses_total", endpoint=path, status="200") == (
+        before["ok"] + 10
+    )
+    throttled = (
+        METRICS.value("elexon_throttled_total", endpoint=path) - before["throttled"]
+    )
+    assert throttled > 0
+    assert (
+        METRICS.value("elexon_responses_total", endpoint=path, status="429")
+        >= throttled
+    )
+    assert METRICS.value("elexon_requests_in_flight") == 0
+
+
+def test_dropped_body_is_recorded_once():
+    async def truncated(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Length": "1000"})
+        await response.prepare(request)
+        await response.write(b'{"data": [')
+        # dropping the connection half way through the body
+        request.transport.close()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/truncated", truncated)
+    records = []
+
+    async def fetch(base_url: str):
+        client = ElexonClient(base_url=base_url, rate_limiter=TokenBucket(1000, 1000))
+        async with client:
+            record = client.in_flight.record
+
+            async def recording(latency: float, throttled: bool = False):
+                records.append(throttled)
+                await record(latency, throttled)
+
+            client.in_flight.record = recording
+            await _elexon_get_request_async(client, f"{base_url}/truncated")
+
+    errors = METRICS.value("elexon_request_errors_total", endpoint="/truncated")
+    with BackgroundServer(app) as server:
+        with pytest.raises(aiohttp.ClientPayloadError):
+            asyncio.run(fetch(server.url))
+
+    # recorded when the headers arrived, not again when the body failed
+    assert records == [False]
+    assert (
+        METRICS.value("elexon_request_errors_total", endpoint="/truncated")
+        == errors + 1
+    )
+
+
+def test_error_status_raises():
+    app = web.Application()
+
+    async def fetch(base_url: str):
+        client = ElexonClient(base_url=base_url, rate_limiter=TokenBucket(1000, 1000))
+        async with client:
+            await _elexon_get_request_async(client, f"{base_url}/missing")
+
+    responses = METRICS.value(
+        "elexon_responses_total", endpoint="/missing", status="404"
+    )
+    with BackgroundServer(app) as server:
+        with pytest.raises(HTTPStatusError, match="HTTP 404") as error:
+            asyncio.run(fetch(server.url))
+
+    assert not error.value.retryable
+    assert (
+        METRICS.value("elexon_responses_total", endpoint="/missing", status="404")
+        == responses + 1
+    )
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from src.elexon.parallel import run_in_processes
+
+
+def square(x: int) -> int:
+    if x == 3:
+        raise ValueError("no threes")
+    if x == 5:
+        # killing the worker, like running out of memory would
+        os._exit(1)
+    return x * x
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_in_processes_isolates_failures(workers: int):
+    items = [1, 2, 3, 4] if workers == 1 else [1, 2, 3, 4, 5, 6, 7]
+    results, failures = run_in_processes(square, items, workers, "Squaring:")
+
+    assert results == {x: x * x for x in items if x not in (3, 5)}
+    assert failures[3].strip().endswith("ValueError: no threes")
+    if workers > 1:
+        assert failures[5] == "worker process died"
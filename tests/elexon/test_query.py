@@ -0,0 +1,338 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from src.elexon import query, schemas
+from src.elexon.query import (
+    BULK_CHUNK_LENGTH,
+    HTTPStatusError,
+    IncompleteFetchError,
+    aligned_chunks,
+    decode_response,
+    fetch_chunks,
+    fetch_imbalance_settlement,
+    run_unit_queue,
+    settlement_period_end,
+    settlement_periods,
+    trim_to_range,
+    unit_batches,
+)
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "expected"),
+    [
+        (
+            # a Wednesday morning to a Saturday two weeks later
+            datetime(2024, 1, 3, 5),
+            datetime(2024, 1, 20),
+            [
+                (datetime(2024, 1, 3), datetime(2024, 1, 8)),
+                (datetime(2024, 1, 8), datetime(2024, 1, 15)),
+                (datetime(2024, 1, 15), datetime(2024, 1, 20)),
+            ],
+        ),
+        (
+            datetime(2024, 1, 4),
+            datetime(2024, 1, 4, 12),
+            [(datetime(2024, 1, 4), datetime(2024, 1, 5))],
+        ),
+        (
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 15),
+            [
+                (datetime(2024, 1, 1), datetime(2024, 1, 8)),
+                (datetime(2024, 1, 8), datetime(2024, 1, 15)),
+            ],
+        ),
+    ],
+)
+def test_aligned_chunks(
+    start: datetime, end: datetime, expected: list[tuple[datetime, datetime]]
+):
+    assert aligned_chunks(start, end) == expected
+
+
+def test_aligned_chunks_are_shared_between_runs():
+    first_run = aligned_chunks(datetime(2024, 1, 2), datetime(2024, 2, 1))
+    second_run = aligned_chunks(datetime(2024, 1, 3), datetime(2024, 2, 3))
+
+    assert set(first_run[1:-1]) <= set(second_run)
+
+
+def test_aligned_chunks_per_day():
+    assert aligned_chunks(
+        datetime(2024, 1, 3, 5), datetime(2024, 1, 5, 1), BULK_CHUNK_LENGTH
+    ) == [
+        (datetime(2024, 1, 3), datetime(2024, 1, 4)),
+        (datetime(2024, 1, 4), datetime(2024, 1, 5)),
+        (datetime(2024, 1, 5), datetime(2024, 1, 6)),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("n_units", "to_time", "mode", "expected_sizes"),
+    [
+        # many units over a day: one request instead of one per unit
+        (120, "2024-01-02T00:00:00Z", "auto", [50, 50, 20]),
+        # a few units over a year: weekly requests per unit are fewer
+        (3, "2025-01-01T00:00:00Z", "auto", [1, 1, 1]),
+        (3, "2025-01-01T00:00:00Z", "bulk", [3]),
+        # a few units over a week: a request per unit rather than per day
+        (3, "2024-01-08T00:00:00Z", "auto", [1, 1, 1]),
+        (120, "2024-01-08T00:00:00Z", "auto", [50, 50, 20]),
+        # smaller batches over longer windows, so they fit in memory
+        (120, "2024-03-01T00:00:00Z", "auto", [25, 25, 25, 25, 20]),
+        (120, "2025-01-01T00:00:00Z", "bulk", [4] * 30),
+        (1000, "2029-01-01T00:00:00Z", "auto", [1] * 1000),
+        (120, "2024-01-02T00:00:00Z", "per_unit", [1] * 120),
+    ],
+)
+def test_unit_batches(n_units: int, to_time: str, mode: str, expected_sizes: list[int]):
+    units = [f"T_X-{i}" for i in range(n_units)]
+    batches = unit_batches(units, "2024-01-01T00:00:00Z", to_time, mode)
+
+    assert [len(batch) for batch in batches] == expected_sizes
+    assert [unit for batch in batches for unit in batch] == units
+
+
+@pytest.mark.parametrize("parse_times", [False, True])
+def test_trim_to_range(parse_times: bool):
+    df = pl.DataFrame(
+        {
+            "timeFrom": [
+                "2024-01-01T23:30:00Z",
+                "2024-01-02T00:00:00Z",
+                "2024-01-02T10:00:00Z",
+                "2024-01-02T11:00:00Z",
+                "2024-01-02T12:00:00Z",
+            ],
+            "timeTo": [
+                "2024-01-02T00:00:00Z",
+                "2024-01-02T00:30:00Z",
+                "2024-01-02T10:00:00Z",
+                "2024-01-02T12:30:00Z",
+                "2024-01-02T12:30:00Z",
+            ],
+        }
+    )
+    if parse_times:
+        df = df.with_columns(pl.all().str.to_datetime("%Y-%m-%dT%H:%M:%SZ"))
+
+    assert_frame_equal(
+        trim_to_range(df, "2024-01-02T00:00:00Z", "2024-01-02T12:00:00Z"),
+        df.slice(1, 3),
+    )
+
+
+SCHEMA = {"timeFrom": pl.Datetime("us"), "levelFrom": pl.Float64, "pairId": pl.Int64}
+
+
+@pytest.mark.parametrize(
+    ("body", "schema", "expected"),
+    [
+        (
+            b'{"metadata": {"datasets": ["BOD"]}, "data": ['
+            b'{"timeFrom": "2024-01-01T00:00:00Z", "levelFrom": 5, "pairId": 1, "x": 1},'
+            b'{"timeFrom": "2024-01-01T00:30:00Z", "levelFrom": 5.5}]}',
+            SCHEMA,
+            pl.DataFrame(
+                {
+                    "timeFrom": [datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 30)],
+                    "levelFrom": [5.0, 5.5],
+                    "pairId": [1, None],
+                },
+                schema=SCHEMA,
+            ),
+        ),
+        (b'{"data": []}', SCHEMA, pl.DataFrame(schema=SCHEMA)),
+        (
+            b'[{"timeFrom": "2024-01-01T00:00:00Z", "levelFrom": 5, "pairId": 1}]',
+            SCHEMA,
+            pl.DataFrame(
+                {"timeFrom": [datetime(2024, 1, 1)], "levelFrom": [5.0], "pairId": [1]},
+                schema=SCHEMA,
+            ),
+        ),
+        (
+            b'{"data": [{"settlementDate": "2024-01-01", "totalCashflow": 1.5}]}',
+            None,
+            pl.DataFrame({"settlementDate": ["2024-01-01"], "totalCashflow": [1.5]}),
+        ),
+        (b'{"data": []}', None, pl.DataFrame()),
+    ],
+)
+def test_decode_response(body: bytes, schema: dict, expected: pl.DataFrame):
+    assert_frame_equal(decode_response(body, schema), expected)
+
+
+@pytest.mark.parametrize(
+    ("settlement_date", "expected"),
+    [("2024-06-01", 48), ("2024-03-31", 46), ("2024-10-27", 50)],
+)
+def test_settlement_periods(settlement_date: str, expected: int):
+    assert settlement_periods(settlement_date) == expected
+
+
+def system_prices(settlement_date: str, periods: list[int]) -> pl.DataFrame:
+    # the other columns are null
+    return pl.concat(
+        [
+            pl.DataFrame(schema=schemas.SYSTEM_PRICES),
+            pl.DataFrame(
+                {"settlementDate": settlement_date, "settlementPeriod": periods}
+            ),
+        ],
+        how="diagonal_relaxed",
+    )
+
+
+def test_fetch_imbalance_settlement_fills_gaps_per_period(monkeypatch):
+    period_requests = []
+
+    async def get_date(client, settlement_date):
+        # the first day is missing its last period, the second day failed
+        if settlement_date == "2024-01-01":
+            return system_prices(settlement_date, list(range(1, 48)))
+        return None
+
+    async def get_period(client, settlement_date, settlement_period):
+        period_requests.append((settlement_date, settlement_period))
+        return system_prices(settlement_date, [settlement_period])
+
+    monkeypatch.setattr(query, "get_system_prices_for_date", get_date)
+    monkeypatch.setattr(query, "get_indicative_imbalance_settlement", get_period)
+
+    df = asyncio.run(
+        fetch_imbalance_settlement(None, "2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z")
+    )
+
+    assert period_requests == [("2024-01-01", 48)] + [
+        ("2024-01-02", i) for i in range(1, 49)
+    ]
+    assert df.shape[0] == 96
+    assert df["settlementPeriod"].to_list() == list(range(1, 49)) * 2
+
+
+def test_fetch_imbalance_settlement_skips_future_periods(monkeypatch):
+    period_requests = []
+
+    async def get_date(client, settlement_date):
+        return None
+
+    async def get_period(client, settlement_date, settlement_period):
+        period_requests.append((settlement_date, settlement_period))
+        return None
+
+    monkeypatch.setattr(query, "get_system_prices_for_date", get_date)
+    monkeypatch.setattr(query, "get_indicative_imbalance_settlement", get_period)
+
+    today = datetime.now(UTC).date()
+    yesterday = today - timedelta(days=1)
+    tomorrow = today + timedelta(days=1)
+    before = datetime.now(UTC)
+    asyncio.run(
+        fetch_imbalance_settlement(
+            None, f"{yesterday}T00:00:00Z", f"{tomorrow}T00:00:00Z"
+        )
+    )
+
+    # yesterday is complete, today only up to now, and tomorrow hasn't started
+    assert period_requests[: settlement_periods(str(yesterday))] == [
+        (str(yesterday), i) for i in range(1, settlement_periods(str(yesterday)) + 1)
+    ]
+    assert all(
+        settlement_period_end(date, period) <= datetime.now(UTC)
+        for date, period in period_requests
+    )
+    assert {
+        (str(today), i)
+        for i in range(1, settlement_periods(str(today)) + 1)
+        if settlement_period_end(str(today), i) <= before
+    } <= set(period_requests)
+
+
+@pytest.mark.parametrize(
+    ("settlement_date", "period", "expected"),
+    [
+        ("2024-01-01", 1, datetime(2024, 1, 1, 0, 30, tzinfo=UTC)),
+        ("2024-07-01", 48, datetime(2024, 7, 1, 23, tzinfo=UTC)),
+        # the day starts at midnight in London
+        ("2024-07-01", 1, datetime(2024, 6, 30, 23, 30, tzinfo=UTC)),
+    ],
+)
+def test_settlement_period_end(settlement_date: str, period: int, expected: datetime):
+    assert settlement_period_end(settlement_date, period) == expected
+
+
+def test_fetch_chunks_requeues_failed_chunks():
+    attempts = {}
+
+    async def fetch(from_time: str, to_time: str):
+        attempts[from_time] = attempts.get(from_time, 0) + 1
+        # the first chunk fails once, the second gets no response the first time
+        if from_time == "2024-01-01T00:00:00Z" and attempts[from_time] == 1:
+            raise TimeoutError()
+        if from_time == "2024-01-02T00:00:00Z" and attempts[from_time] == 1:
+            return None
+        return pl.DataFrame({"timeFrom": [from_time], "timeTo": [to_time]})
+
+    tasks = [
+        ("2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"),
+        ("2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z"),
+    ]
+    df = asyncio.run(
+        fetch_chunks(fetch, tasks, "2024-01-01T00:00:00Z", "2024-01-03T00:00:00Z")
+    )
+
+    assert df["timeFrom"].to_list() == [from_time for from_time, _ in tasks]
+    assert attempts == {from_time: 2 for from_time, _ in tasks}
+
+
+def test_fetch_chunks_requeues_only_retryable_errors():
+    attempts = {}
+
+    async def fetch(from_time: str, to_time: str):
+        attempts[from_time] = attempts.get(from_time, 0) + 1
+        status = {"2024-01-01T00:00:00Z": 404, "2024-01-02T00:00:00Z": 503}
+        raise HTTPStatusError(status[from_time], f"https://elexon/?from={from_time}")
+
+    tasks = [
+        ("2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"),
+        ("2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z"),
+    ]
+    with pytest.raises(IncompleteFetchError) as error:
+        asyncio.run(
+            fetch_chunks(fetch, tasks, "2024-01-01T00:00:00Z", "2024-01-03T00:00:00Z")
+        )
+
+    # the client error is permanent, the server error is re-queued twice
+    assert attempts == {"2024-01-01T00:00:00Z": 1, "2024-01-02T00:00:00Z": 3}
+    assert [result.reason for result in error.value.failed] == ["HTTP 404", "HTTP 503"]
+
+
+def test_run_unit_queue():
+    units = [f"T_X-{i}" for i in range(10)] + [["T_Y-1", "T_Y-2"]]
+    calls = []
+    in_flight = peak = 0
+
+    async def worker(item):
+        nonlocal in_flight, peak
+        calls.append(item)
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if item == "T_X-3" or isinstance(item, list):
+            raise ValueError(f"failed {item}")
+
+    failures = asyncio.run(run_unit_queue(units, worker, 3, "Testing:"))
+
+    # every unit once, at most 3 at a time, a failure not stopping the others
+    assert sorted(map(str, calls)) == sorted(map(str, units))
+    assert peak == 3
+    assert sorted(failures) == ["T_X-3", "T_Y-1", "T_Y-2"]
+    assert "ValueError: failed T_X-3" in failures["T_X-3"]
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from src.elexon.rate_limit import TokenBucket, backoff_delay, retry_after_seconds
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({}, None),
+        ({"Retry-After": "12"}, 12.0),
+        ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+        ({"Retry-After": "soon"}, None),
+        ({"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "20"}, None),
+        ({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "20"}, 20.0),
+        ({"RateLimit-Remaining": "0", "RateLimit-Reset": "5"}, 5.0),
+    ],
+)
+def test_retry_after_seconds(headers: dict, expected: float):
+    assert retry_after_seconds(headers) == expected
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=1.0, cap=60.0, jitter=0.5)
+        expected = min(60.0, 2**attempt)
+        assert expected / 2 <= delay <= expected
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=5)
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*[bucket.acquire() for _ in range(25)])
+        return time.monotonic() - start
+
+    # the first 5 go straight away, the other 20 at 100 per second
+    elapsed = asyncio.run(run())
+    assert 0.18 <= elapsed < 0.5
+    assert bucket.stats.requests == 25
+    assert bucket.stats.wait_time > 0
+
+
+def test_token_bucket_pause_blocks_everyone():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    bucket.throttled(0.2)
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*[bucket.acquire() for _ in range(3)])
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.19
+    assert bucket.stats.throttles == 1
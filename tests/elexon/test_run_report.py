@@ -0,0 +1,72 @@
+import json
+
+import polars as pl
+
+from src.elexon.run_report import RunReport
+from src.elexon.store import DataStore
+
+PHYSICAL = pl.DataFrame(
+    {
+        "settlementDate": ["2024-01-31", "2024-02-01"],
+        "timeFrom": ["2024-01-31T23:30:00Z", "2024-02-01T00:00:00Z"],
+        "timeTo": ["2024-02-01T00:00:00Z", "2024-02-01T00:30:00Z"],
+        "levelFrom": [10, 20],
+        "levelTo": [20, 30],
+        "bmUnit": ["T_X-1", "T_X-1"],
+    }
+)
+
+
+def test_run_report(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    report = RunReport(sample_interval=0.001)
+    report.open(tmp_path / "run_report.jsonl")
+
+    with report.stage("generation", store, ["physical"]):
+        store.write("physical", "T_X-2", PHYSICAL.head(1))
+        report.unit("T_X-2", "fetch", 0.5, batch_size=2)
+        report.unit("T_X-2", "fetch", 0.25)
+        report.unit("T_X-3", "compute", 1.0, 0.75)
+        report.chunks("T_X-2", {"ok": 3, "empty": 1, "failed": 0})
+        report.chunks("T_X-2", {"ok": 2, "empty": 0, "failed": 1})
+
+    with open(tmp_path / "run_report.jsonl") as f:
+        lines = [json.loads(line) for line in f]
+
+    assert [line["type"] for line in lines] == ["stage", "unit", "unit"]
+    assert lines[0]["stage"] == "generation"
+    assert lines[0]["rows"] == {"physical": 1}
+    assert lines[0]["units"] == 2
+    assert lines[0]["chunks"] == {"ok": 5, "empty": 1, "failed": 1}
+    assert lines[0]["peak_rss_mb"] > 0
+    assert lines[1:] == [
+        {
+            "type": "unit",
+            "stage": "generation",
+            "unit": "T_X-2",
+            "rows": {"physical": 1},
+            "fetch_time": 0.75,
+            "batch_size": 2,
+            "chunks": {"ok": 5, "empty": 1, "failed": 1},
+        },
+        {
+            "type": "unit",
+            "stage": "generation",
+            "unit": "T_X-3",
+            "rows": {},
+            "compute_time": 1.0,
+            "compute_cpu_time": 0.75,
+        },
+    ]
+
+
+def test_run_report_closed(tmp_path):
+    store = DataStore(tmp_path)
+    report = RunReport()
+
+    with report.stage("generation", store, ["physical"]):
+        store.write("physical", "T_X-1", PHYSICAL)
+        report.unit("T_X-1", "fetch", 0.5)
+
+    assert list(tmp_path.glob("*.jsonl")) == []
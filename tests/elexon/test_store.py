@@ -0,0 +1,152 @@
+import datetime
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from src.elexon.store import DataStore
+
+PHYSICAL = pl.DataFrame(
+    {
+        "settlementDate": ["2024-01-31", "2024-02-01"],
+        "timeFrom": ["2024-01-31T23:30:00Z", "2024-02-01T00:00:00Z"],
+        "timeTo": ["2024-02-01T00:00:00Z", "2024-02-01T00:30:00Z"],
+        "levelFrom": [10, 20],
+        "levelTo": [20, 30],
+        "bmUnit": ["T_X-1", "T_X-1"],
+    }
+)
+
+
+def test_store_round_trip(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+
+    assert sorted(p.name for p in store.unit_path("physical", "T_X-1").iterdir()) == [
+        "month=2024-01",
+        "month=2024-02",
+    ]
+    assert_frame_equal(
+        store.read("physical", "T_X-1"),
+        PHYSICAL.with_columns(
+            pl.col("timeFrom", "timeTo").str.to_datetime("%Y-%m-%dT%H:%M:%SZ"),
+            # cast to the physical schema
+            pl.col("levelFrom", "levelTo").cast(pl.Float64),
+        ),
+    )
+
+
+def test_store_write_replaces_unit(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    store.write("physical", "T_X-1", PHYSICAL.tail(1))
+
+    assert store.read("physical", "T_X-1").shape[0] == 1
+    assert [p.name for p in store.unit_path("physical", "T_X-1").iterdir()] == [
+        "month=2024-02"
+    ]
+
+
+def test_store_write_crash_keeps_unit(tmp_path, monkeypatch):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pl.DataFrame, "write_parquet", crash)
+    with pytest.raises(OSError):
+        store.write("physical", "T_X-1", PHYSICAL.tail(1))
+
+    # the half-written unit is outside of the dataset
+    assert store.units("physical") == ["T_X-1"]
+    assert store.row_counts("physical") == {"T_X-1": 2}
+    assert store.read("physical", "T_X-1").shape[0] == 2
+
+
+def test_store_write_crash_while_swapping(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    # crashing once the previous data is moved aside, before the new one is in
+    staging_path = store.staging_path("physical", "T_X-1")
+    staging_path.parent.mkdir(parents=True, exist_ok=True)
+    store.unit_path("physical", "T_X-1").rename(f"{staging_path}.old")
+
+    assert store.exists("physical", "T_X-1")
+    assert store.read("physical", "T_X-1").shape[0] == 2
+    store.write("physical", "T_X-1", PHYSICAL.tail(1))
+    assert store.read("physical", "T_X-1").shape[0] == 1
+    assert list(staging_path.parent.iterdir()) == []
+
+
+def test_store_ignores_leftover_tmp_units(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    # left behind by a crashed write of an earlier version
+    legacy = store.dataset_path("physical") / "bmUnit=T_X-1.tmp"
+    legacy.mkdir()
+
+    assert store.units("physical") == ["T_X-1"]
+    store.write("physical", "T_X-1", PHYSICAL)
+    assert not legacy.exists()
+
+
+def test_store_empty_marker(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", None)
+
+    assert store.exists("physical", "T_X-1")
+    assert not store.exists("physical", "T_X-2")
+    assert store.read("physical", "T_X-1") is None
+    assert store.units("physical") == ["T_X-1"]
+
+
+def test_store_scan(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    store.write("physical", "T_X-2", PHYSICAL.with_columns(bmUnit=pl.lit("T_X-2")))
+    store.write("physical", "T_X-3", None)
+
+    out = (
+        store.scan("physical")
+        .filter(pl.col("bmUnit").eq("T_X-2") & pl.col("month").eq("2024-02"))
+        .select("timeFrom", "levelFrom")
+        .collect()
+    )
+    assert_frame_equal(
+        out,
+        pl.DataFrame(
+            {"timeFrom": [datetime.datetime(2024, 2, 1)], "levelFrom": [20.0]}
+        ),
+    )
+
+
+def test_store_units_share_schema(tmp_path):
+    store = DataStore(tmp_path)
+    store.write("physical", "T_X-1", PHYSICAL)
+    store.write(
+        "physical", "T_X-2", PHYSICAL.with_columns(pl.col("levelFrom", "levelTo") / 2)
+    )
+
+    assert store.scan("physical").collect().schema["levelFrom"] == pl.Float64
+
+
+def test_store_dataset_without_units(tmp_path):
+    store = DataStore(tmp_path)
+    prices = pl.DataFrame(
+        {
+            "settlementDate": ["2024-01-31", "2024-02-01"],
+            "settlementPeriod": [48, 1],
+            "systemSellPrice": [70, 80],
+        }
+    )
+    store.write("system_prices", None, prices)
+
+    assert sorted(p.name for p in store.dataset_path("system_prices").iterdir()) == [
+        "month=2024-01",
+        "month=2024-02",
+    ]
+    assert_frame_equal(
+        store.read("system_prices"),
+        prices.with_columns(pl.col("systemSellPrice").cast(pl.Float64)),
+    )
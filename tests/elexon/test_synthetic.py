@@ -0,0 +1,63 @@
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from src.elexon import schemas
+from src.elexon.synthetic import synthetic_datasets, synthetic_units
+from src.elexon.utils import resolve_acceptances
+
+FROM_TIME = "2024-01-01T00:00:00Z"
+TO_TIME = "2024-01-08T00:00:00Z"
+
+
+def test_synthetic_datasets_are_seeded():
+    units = synthetic_units(10, seed=1)
+    first = synthetic_datasets(units, FROM_TIME, TO_TIME, seed=1)
+    second = synthetic_datasets(units, FROM_TIME, TO_TIME, seed=1)
+
+    for dataset, df in first.items():
+        assert_frame_equal(df, second[dataset])
+    assert not first["physical"].equals(
+        synthetic_datasets(units, FROM_TIME, TO_TIME, seed=2)["physical"]
+    )
+
+
+def test_synthetic_datasets_shapes():
+    units = synthetic_units(10)
+    datasets = synthetic_datasets(units, FROM_TIME, TO_TIME, records_per_period=2)
+
+    physical = datasets["physical"]
+    assert physical.schema == pl.Schema(schemas.PHYSICAL)
+    assert physical.height == 10 * 7 * 48 * 2
+    # the PN segments of a unit are continuous
+    assert (
+        physical.filter(
+            pl.col("levelFrom").ne(pl.col("levelTo").shift(1).over("bmUnit"))
+        ).height
+        == 0
+    )
+
+    bid_offer = datasets["bid_offer"]
+    assert bid_offer.schema == pl.Schema(schemas.BID_OFFER)
+    assert bid_offer["pairId"].unique().sort().to_list() == [-3, -2, -1, 1, 2, 3]
+
+
+def test_synthetic_acceptances_overlap_and_are_reissued():
+    units = synthetic_units(10)
+    acceptances = synthetic_datasets(units, FROM_TIME, TO_TIME)["acceptance"]
+    assert acceptances.schema == pl.Schema(schemas.ACCEPTANCES)
+
+    # the same acceptance number issued more than once in a day
+    reissued = acceptances.group_by("bmUnit", "settlementDate", "acceptanceNumber").agg(
+        pl.col("acceptanceTime").n_unique()
+    )
+    assert reissued.filter(pl.col("acceptanceTime").gt(1)).height > 0
+
+    # resolving keeps one level per minute, from fewer minutes than were accepted
+    unit = acceptances["bmUnit"][0]
+    accepted = acceptances.filter(pl.col("bmUnit").eq(unit))
+    resolved = resolve_acceptances(accepted)
+    assert resolved["time"].is_unique().all()
+    minutes = accepted.select(
+        ((pl.col("timeTo") - pl.col("timeFrom")).dt.total_minutes() + 1).sum()
+    ).item()
+    assert resolved.height < minutes
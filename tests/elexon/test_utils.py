@@ -6,6 +6,8 @@ from src.elexon.utils import (
     aggregate_prices,
     cashflow,
     format_bid_offer_table,
+    integrate_acceptance_and_pn,
+    resolve_acceptances,
     smoothen_physical,
 )
 
@@ -160,6 +162,30 @@ from src.elexon.utils import (
                 }
             ),
         ),
+        # levels read from the store are floats (see `schemas.BID_OFFER`)
+        (
+            pl.DataFrame(
+                {
+                    "levelFrom": [-100.0, 100.0],
+                    "levelTo": [-100.0, 100.0],
+                    "bid": [105.0, 105.0],
+                    "offer": [174.0, 174.0],
+                    "curtailment": [0, 0],
+                    "extra": [0, 0],
+                    "pairId": [-1, 1],
+                }
+            ),
+            pl.DataFrame(
+                {
+                    "levelFrom": [-100.0, 0.0],
+                    "levelTo": [0.0, 100.0],
+                    "bid": [105.0, 105.0],
+                    "offer": [174.0, 174.0],
+                    "curtailment": [0, 0],
+                    "extra": [0, 0],
+                }
+            ),
+        ),
     ],
 )
 def test_format_bid_price_table(
@@ -434,6 +460,44 @@ def test_calculate_cashflow(
     assert_frame_equal(expected_result, cf, check_row_order=False)
 
 
+def test_calculate_cashflow_without_bid_offer_ladder():
+    bo_df = pl.DataFrame(
+        {
+            "settlementDate": ["2024-12-10"] * 2,
+            "settlementPeriod": [34] * 2,
+            "levelFrom": [0, 0],
+            "levelTo": [0, 0],
+            "bid": [0.0, 0.0],
+            "offer": [0.0, 0.0],
+            "pairId": [-1, 1],
+        }
+    )
+    gen_df = pl.DataFrame(
+        {
+            "settlementDate": ["2024-12-10"],
+            "settlementPeriod": [34],
+            "extra": [0.0],
+            "curtailment": [-3.35],
+        }
+    )
+
+    assert_frame_equal(
+        cashflow(bo_df, gen_df),
+        pl.DataFrame(
+            {
+                "settlementDate": ["2024-12-10"],
+                "settlementPeriod": [34],
+                "calculated_cashflow_curtailment": [None],
+                "calculated_cashflow_extra": [None],
+            },
+            schema_overrides={
+                "calculated_cashflow_curtailment": pl.Float64,
+                "calculated_cashflow_extra": pl.Float64,
+            },
+        ),
+    )
+
+
 @pytest.mark.parametrize(
     ("raw_df", "expected_result"),
     [
@@ -621,6 +685,35 @@ def test_calculate_cashflow(
                 pl.col("level").cast(pl.Float64),
             ),
         ),
+        (
+            # a shorter PN starting later takes over, and the longer one resumes
+            # once it's over
+            pl.DataFrame(
+                {
+                    "dataset": ["PN"] * 2,
+                    "settlementDate": ["2021-02-28"] * 2,
+                    "settlementPeriod": [21, 21],
+                    "timeFrom": ["2021-02-28T10:00:00Z", "2021-02-28T10:10:00Z"],
+                    "timeTo": ["2021-02-28T10:30:00Z", "2021-02-28T10:20:00Z"],
+                    "levelFrom": [100, 50],
+                    "levelTo": [100, 50],
+                    "nationalGridBmUnit": ["WBURB-2"] * 2,
+                    "bmUnit": ["T_WBURB-2"] * 2,
+                }
+            ),
+            pl.DataFrame(
+                {
+                    "time": [f"2021-02-28T10:{i:02d}:00Z" for i in range(30)],
+                    "level": [100.0] * 10 + [50.0] * 10 + [100.0] * 10,
+                    "settlementPeriod": [21] * 30,
+                    "settlementDate": ["2021-02-28"] * 30,
+                }
+            ).with_columns(
+                pl.col("time").str.strptime(
+                    format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime
+                ),
+            ),
+        ),
     ],
 )
 def test_smoothen_physical(raw_df: pl.DataFrame, expected_result: pl.DataFrame):
@@ -628,3 +721,112 @@ def test_smoothen_physical(raw_df: pl.DataFrame, expected_result: pl.DataFrame):
         output = smoothen_physical(raw_df)
 
         assert_frame_equal(output, expected_result)
+
+
+@pytest.mark.parametrize(
+    ("acceptances", "expected_result"),
+    [
+        (
+            # a single ramp, followed by a flat segment of the same acceptance
+            pl.DataFrame(
+                {
+                    "acceptanceNumber": [1, 1],
+                    "acceptanceTime": ["2024-12-10T17:40:00Z"] * 2,
+                    "timeFrom": ["2024-12-10T18:00:00Z", "2024-12-10T18:04:00Z"],
+                    "timeTo": ["2024-12-10T18:04:00Z", "2024-12-10T18:06:00Z"],
+                    "levelFrom": [100, 20],
+                    "levelTo": [20, 20],
+                }
+            ),
+            pl.DataFrame(
+                {
+                    "time": [f"2024-12-10T18:{i:02d}:00Z" for i in range(7)],
+                    "level": [100.0, 80.0, 60.0, 40.0, 20.0, 20.0, 20.0],
+                    "acceptanceTime": ["2024-12-10T17:40:00Z"] * 7,
+                }
+            ),
+        ),
+        (
+            # the second acceptance overwrites the overlapping part of the first
+            pl.DataFrame(
+                {
+                    "acceptanceNumber": [1, 2],
+                    "acceptanceTime": [
+                        "2024-12-10T17:40:00Z",
+                        "2024-12-10T17:55:00Z",
+                    ],
+                    "timeFrom": ["2024-12-10T18:00:00Z", "2024-12-10T18:02:00Z"],
+                    "timeTo": ["2024-12-10T18:04:00Z", "2024-12-10T18:05:00Z"],
+                    "levelFrom": [50, 0],
+                    "levelTo": [50, 30],
+                }
+            ),
+            pl.DataFrame(
+                {
+                    "time": [f"2024-12-10T18:{i:02d}:00Z" for i in range(6)],
+                    "level": [50.0, 50.0, 0.0, 10.0, 20.0, 30.0],
+                    "acceptanceTime": ["2024-12-10T17:40:00Z"] * 2
+                    + ["2024-12-10T17:55:00Z"] * 4,
+                }
+            ),
+        ),
+    ],
+)
+def test_resolve_acceptances(acceptances: pl.DataFrame, expected_result: pl.DataFrame):
+    output = resolve_acceptances(acceptances).sort(by="time")
+
+    assert_frame_equal(
+        output,
+        expected_result.with_columns(
+            pl.col("time").str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
+        ),
+    )
+
+
+def test_integrate_acceptance_and_pn():
+    physical = pl.DataFrame(
+        {
+            "dataset": ["PN"] * 2,
+            "settlementDate": ["2024-12-10"] * 2,
+            "settlementPeriod": [21, 22],
+            "timeFrom": ["2024-12-10T10:00:00Z", "2024-12-10T10:30:00Z"],
+            "timeTo": ["2024-12-10T10:30:00Z", "2024-12-10T11:00:00Z"],
+            "levelFrom": [100, 100],
+            "levelTo": [100, 40],
+        }
+    )
+    # the second acceptance overwrites the first between 10:20 and 10:25
+    accepted = pl.DataFrame(
+        {
+            "acceptanceNumber": [1, 2],
+            "acceptanceTime": ["2024-12-10T09:40:00Z", "2024-12-10T10:05:00Z"],
+            "timeFrom": ["2024-12-10T10:15:00Z", "2024-12-10T10:20:00Z"],
+            "timeTo": ["2024-12-10T10:50:00Z", "2024-12-10T10:25:00Z"],
+            "levelFrom": [70, 0],
+            "levelTo": [70, 0],
+        }
+    )
+
+    output = integrate_acceptance_and_pn(accepted, physical, "30m", "MWh")
+
+    expected_result = pl.DataFrame(
+        {
+            "time": ["2024-12-10T10:00:00Z", "2024-12-10T10:30:00Z"],
+            "physical_level": [50.0, 35.0],
+            # the acceptance crosses the ramping PN at 10:45
+            "extra": [0.0, 10 * 5 / 2 / 60],
+            "curtailment": [
+                -(30 * 5 + 100 * 5 + 30 * 5) / 60,
+                -(30 * 15 / 2) / 60,
+            ],
+            "generated": [
+                50 - (30 * 5 + 100 * 5 + 30 * 5) / 60,
+                35 - (30 * 15 / 2) / 60 + 10 * 5 / 2 / 60,
+            ],
+            "settlementPeriod": [21, 22],
+            "settlementDate": ["2024-12-10"] * 2,
+        }
+    ).with_columns(
+        pl.col("time").str.strptime(format="%Y-%m-%dT%H:%M:%SZ", dtype=pl.Datetime)
+    )
+    assert_frame_equal(output, expected_result)